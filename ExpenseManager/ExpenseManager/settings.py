@@ -29,6 +29,21 @@ ALLOWED_HOSTS = []
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Serves request.user from a short-lived cached snapshot (see accounts/backends.py).
+# Sessions remember the backend that logged the user in, so sessions created
+# under the default ModelBackend end when this setting is deployed.
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+AUTH_USER_CACHE = 'auth'
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Daily exchange rate tables, YYYY-MM-DD.csv with `currency,rate` rows giving
+# units per one EXCHANGE_RATES_BASE (see expenses/currency_service.py).
+EXCHANGE_RATES_DIR = BASE_DIR / 'exchange_rates'
+EXCHANGE_RATES_BASE = 'USD'
+
+# Seconds the manager dashboard's per-report expense totals are reused.
+MANAGER_DASHBOARD_CACHE_TIMEOUT = 60
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -84,6 +99,43 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Users served to request.user (see accounts/backends.py). Must be shared
+    # by all web processes so invalidation reaches each of them. MAX_ENTRIES
+    # stays above the users active within TIMEOUT, so entries are not culled
+    # (a random 1/CULL_FREQUENCY of them at a time). FileBasedCache lists its
+    # directory on every set, i.e. on every miss; with many concurrent users
+    # point this at a shared Redis or Memcached server instead.
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'auth_cache',
+        'TIMEOUT': AUTH_USER_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # OCR text keyed by receipt image hash (see expenses/ocr_service.py).
+    # Shared on disk by web and OCR worker processes; once MAX_ENTRIES is
+    # reached, 1/CULL_FREQUENCY of the entries are evicted.
+    'ocr': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'ocr_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -120,6 +172,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files. Receipts are stored by content hash (see
+# expenses/storage.py) and served by the expenses app, which checks access.
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'receipts': {'BACKEND': 'expenses.storage.ContentAddressedStorage'},
+}
+
+# Receipt thumbnail sizes (longest side in pixels), generated on first
+# request under RECEIPT_THUMBNAIL_ROOT (default: MEDIA_ROOT/thumbnails).
+RECEIPT_THUMBNAIL_SIZES = {'sm': 320, 'md': 960}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,7 +1,14 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm,  UserChangeForm as BaseUserChangeForm
-from .models import CustomUser, Company
-from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from .forms import ManagersFieldMixin
+from .models import CustomUser, Company, UserImportJob
+from .pagination import prefix_match
+from .user_import import detect_format
+from django.contrib import admin, messages
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -59,14 +66,100 @@ class CustomUserChangeForm(BaseUserChangeForm):
                 role__in=[CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]
             ).exclude(pk=user_instance.pk)
 
+class CustomUserAdminForm(ManagersFieldMixin, forms.ModelForm):
+    """Admin change form that reports manager cycles as form errors."""
+
+
+class UserImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with a header row, or JSON Lines (.jsonl).')
+    workers = forms.IntegerField(min_value=1, max_value=16, initial=2,
+                                 help_text='Processes the import worker uses to hash passwords.')
+
+
 class CompanyAdmin(admin.ModelAdmin):
-    class Meta:
-        model = Company
+    actions = ['import_employees']
+
+    def get_urls(self):
+        return [
+            path('<int:company_id>/import-users/', self.admin_site.admin_view(self.import_users_view),
+                 name='accounts_company_import_users'),
+        ] + super().get_urls()
+
+    @admin.action(description='Import employees from a file')
+    def import_employees(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one company to import employees into.', messages.WARNING)
+            return None
+        return redirect('admin:accounts_company_import_users', company_id=queryset.get().pk)
+
+    def import_users_view(self, request, company_id):
+        company = get_object_or_404(Company, pk=company_id)
+        if not (self.has_change_permission(request, company) and request.user.has_perm('accounts.add_customuser')):
+            raise PermissionDenied
+        form = UserImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            # Hashing passwords takes far too long for a request; the
+            # user_import_worker command runs the job.
+            upload = form.cleaned_data['file']
+            job = UserImportJob.objects.create(
+                company=company,
+                file=upload,
+                format=detect_format(upload.name),
+                workers=form.cleaned_data['workers'],
+                requested_by=request.user,
+            )
+            self.message_user(request, 'The import was queued; its outcome will be shown on this page '
+                                       'once the user import worker has run it.', messages.SUCCESS)
+            return redirect(reverse('admin:accounts_userimportjob_change', args=[job.pk]))
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Import employees into {company}',
+            'opts': self.model._meta,
+            'original': company,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/accounts/company/import_users.html', context)
 
 class EditRoleForm(forms.ModelForm):
     class Meta:
         model = CustomUser
         fields = ['role']
 
-admin.site.register(CustomUser)
-admin.site.register(Company)
\ No newline at end of file
+class CustomUserAdmin(admin.ModelAdmin):
+    search_fields = ('username', 'email')
+    ordering = ('username',)
+    # Selected managers only; others are looked up through search.
+    autocomplete_fields = ('managers',)
+    form = CustomUserAdminForm
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Username/email prefix search as index ranges instead of the default
+        icontains scan. Manager autocomplete only offers admins and managers
+        of the requesting user's company, unless they are a superuser.
+        """
+        if request.GET.get('field_name') == 'managers':
+            queryset = queryset.filter(role__in=[CustomUser.Role.ADMIN, CustomUser.Role.MANAGER])
+            if not request.user.is_superuser:
+                queryset = queryset.filter(company_id=request.user.company_id)
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(prefix_match('username', search_term) | prefix_match('email', search_term)), False
+
+
+class UserImportJobAdmin(admin.ModelAdmin):
+    list_display = ('company', 'status', 'created', 'skipped', 'links', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('company', 'format', 'workers', 'requested_by', 'status', 'created', 'skipped', 'links',
+                       'errors', 'worker_id', 'created_at', 'started_at', 'finished_at')
+    exclude = ('file',)
+
+    def has_add_permission(self, request):
+        # Jobs are created from a company's import page.
+        return False
+
+
+admin.site.register(CustomUser, CustomUserAdmin)
+admin.site.register(Company, CompanyAdmin)
+admin.site.register(UserImportJob, UserImportJobAdmin)
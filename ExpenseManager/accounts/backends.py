@@ -0,0 +1,85 @@
+"""
+Authentication backend that serves request.user from a cached snapshot.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# The cache must be shared by every web process (see CACHES['auth']), so an
+# invalidation made by one process is seen by all of them.
+USER_CACHE_ALIAS = getattr(settings, 'AUTH_USER_CACHE', 'auth')
+# Bounds how long a change that bypassed invalidation (raw SQL, a queryset
+# update() without invalidate_all_users()) can be served.
+USER_CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+GENERATION_KEY = 'auth:user:generation'
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def invalidate_user(*user_ids):
+    """
+    Drops the users' snapshots now and again once the current transaction
+    commits: until then, a concurrent request can still read the old row
+    and cache it.
+    """
+    keys = [user_cache_key(user_id) for user_id in user_ids]
+    caches[USER_CACHE_ALIAS].delete_many(keys)
+    transaction.on_commit(lambda: caches[USER_CACHE_ALIAS].delete_many(keys))
+
+
+def invalidate_all_users():
+    """
+    Drops every cached user by moving to a new generation. Call it after
+    writes to users that send no signals, such as QuerySet.update() or
+    bulk_update().
+    """
+    caches[USER_CACHE_ALIAS].set(GENERATION_KEY, uuid.uuid4().hex, None)
+    transaction.on_commit(lambda: caches[USER_CACHE_ALIAS].set(GENERATION_KEY, uuid.uuid4().hex, None))
+
+
+def _current_generation(cache, generation):
+    """
+    The generation read from the cache, or a new one if the key is gone
+    (evicted or never set). Generations are random, so a snapshot from
+    before the key went missing can never match again.
+    """
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user(), called by AuthenticationMiddleware on
+    every request, reads the user's concrete fields (role, company_id,
+    password hash for session verification, ...) from the shared auth cache
+    and only queries the database on a miss. accounts.signals drops the
+    snapshot whenever the user or their manager assignments change, and a
+    snapshot from an older generation (see invalidate_all_users) is ignored.
+    """
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        cache = caches[USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        cached = cache.get_many([GENERATION_KEY, key])
+        generation = _current_generation(cache, cached.get(GENERATION_KEY))
+        snapshot = cached.get(key)
+        if snapshot is not None and snapshot[0] == generation:
+            _, field_names, values = snapshot
+            user = UserModel.from_db(DEFAULT_DB_ALIAS, field_names, values)
+            return user if self.user_can_authenticate(user) else None
+
+        user = super().get_user(user_id)
+        if user is not None:
+            field_names = [field.attname for field in UserModel._meta.concrete_fields]
+            snapshot = (generation, field_names, [getattr(user, name) for name in field_names])
+            cache.set(key, snapshot, USER_CACHE_TIMEOUT)
+        return user
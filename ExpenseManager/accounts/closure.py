@@ -0,0 +1,67 @@
+"""
+Closure computations on plain (employee id, manager id) links, free of
+model imports so that migrations can share them with accounts.hierarchy.
+"""
+from collections import Counter, defaultdict
+
+
+def find_cycle(managers_of):
+    """
+    True if following managers_of ({user: managers}) from some user leads
+    back to them.
+    """
+    visiting, done = set(), set()
+    for start in list(managers_of):
+        if start in done:
+            continue
+        stack = [(start, iter(managers_of.get(start, ())))]
+        visiting.add(start)
+        while stack:
+            node, managers = stack[-1]
+            manager = next(managers, None)
+            if manager is None:
+                stack.pop()
+                visiting.discard(node)
+                done.add(node)
+            elif manager in visiting:
+                return True
+            elif manager not in done:
+                visiting.add(manager)
+                stack.append((manager, iter(managers_of.get(manager, ()))))
+    return False
+
+
+def compute_closure(links):
+    """
+    Builds Counter({(ancestor, descendant, depth): paths}) from scratch for
+    a list of (employee id, manager id) links. Links that would close a
+    cycle are skipped and returned as the second value.
+    """
+    managers_of = defaultdict(list)
+    for employee_id, manager_id in links:
+        managers_of[employee_id].append(manager_id)
+
+    above = {}
+    skipped = []
+
+    def paths_above(user_id, visiting):
+        if user_id in above:
+            return above[user_id]
+        visiting.add(user_id)
+        paths = Counter()
+        for manager_id in managers_of.get(user_id, ()):
+            if manager_id in visiting:
+                skipped.append((user_id, manager_id))
+                continue
+            paths[(manager_id, 1)] += 1
+            for (ancestor_id, depth), count in paths_above(manager_id, visiting).items():
+                paths[(ancestor_id, depth + 1)] += count
+        visiting.discard(user_id)
+        above[user_id] = paths
+        return paths
+
+    closure = Counter()
+    for user_id in list(managers_of):
+        for (ancestor_id, depth), count in paths_above(user_id, set()).items():
+            closure[(ancestor_id, user_id, depth)] += count
+    return closure, skipped
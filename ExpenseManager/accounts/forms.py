@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm as BaseUserChangeForm
 from .models import CustomUser, Company
+from . import hierarchy
+from .widgets import ManagerAutocompleteWidget
 
 # Define common styling for form inputs
 text_input_styles = {
@@ -24,7 +26,22 @@ class CustomUserCreationForm(UserCreationForm):
         self.fields['password1'].widget.attrs.update(text_input_styles)
 
 
-class ProfileUpdateForm(forms.ModelForm):
+class ManagersFieldMixin:
+    """
+    Rejects managers that would create a reporting cycle as a form error,
+    before save_m2m() reaches the check in accounts.signals.
+    """
+    def clean_managers(self):
+        managers = self.cleaned_data['managers']
+        if self.instance.pk:
+            current = set(self.instance.managers.values_list('pk', flat=True))
+            hierarchy.check_links(
+                (self.instance.pk, manager.pk) for manager in managers if manager.pk not in current
+            )
+        return managers
+
+
+class ProfileUpdateForm(ManagersFieldMixin, forms.ModelForm):
     class Meta:
         model = CustomUser
         fields = ['first_name', 'last_name', 'email', 'managers']
@@ -32,7 +49,7 @@ class ProfileUpdateForm(forms.ModelForm):
             'first_name': forms.TextInput(attrs=text_input_styles),
             'last_name': forms.TextInput(attrs=text_input_styles),
             'email': forms.EmailInput(attrs=text_input_styles),
-            'managers': forms.SelectMultiple(attrs=text_input_styles),
+            'managers': ManagerAutocompleteWidget(attrs=text_input_styles),
         }
 
     def __init__(self, *args, **kwargs):
@@ -48,7 +65,8 @@ class ProfileUpdateForm(forms.ModelForm):
                 company=user_company,
                 role__in=[CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]
             ).exclude(pk=self.instance.pk)
-            self.fields['managers'].help_text = 'Select one or more managers.'
+            self.fields['managers'].help_text = 'Search and add one or more managers.'
+            self.fields['managers'].widget.attrs['data-exclude'] = self.instance.pk
         else:
             del self.fields['managers']
 
@@ -0,0 +1,211 @@
+"""
+Maintenance of the manager hierarchy closure table (ManagerClosure).
+
+Every manager link (employee -> manager) adds, for each ancestor A of the
+manager and each descendant D of the employee, the paths A ... manager ->
+employee ... D. Rows are keyed by depth and count paths, so removing a link
+subtracts exactly what adding it contributed. accounts.signals applies
+these changes whenever CustomUser.managers changes, refusing links that
+would create a reporting cycle before they are written; code that writes
+the through table directly must call check_links/add_links/remove_links
+itself.
+"""
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .closure import compute_closure, find_cycle
+from .models import CustomUser, ManagerClosure
+
+ManagerLink = CustomUser.managers.through
+
+
+def _paths_above(user_ids):
+    """
+    {user: Counter({(ancestor, depth): paths})}, including the user itself
+    at depth 0.
+    """
+    above = {user_id: Counter({(user_id, 0): 1}) for user_id in user_ids}
+    rows = ManagerClosure.objects.filter(descendant_id__in=user_ids)
+    for ancestor_id, descendant_id, depth, paths in rows.values_list('ancestor_id', 'descendant_id', 'depth', 'paths'):
+        above[descendant_id][(ancestor_id, depth)] += paths
+    return above
+
+
+def _paths_below(user_ids):
+    below = {user_id: Counter({(user_id, 0): 1}) for user_id in user_ids}
+    rows = ManagerClosure.objects.filter(ancestor_id__in=user_ids)
+    for ancestor_id, descendant_id, depth, paths in rows.values_list('ancestor_id', 'descendant_id', 'depth', 'paths'):
+        below[ancestor_id][(descendant_id, depth)] += paths
+    return below
+
+
+def _path_changes(links):
+    """
+    Counter({(ancestor, descendant, depth): paths}) contributed by `links`,
+    given as (employee id, manager id) pairs.
+    """
+    above = _paths_above({manager_id for _, manager_id in links})
+    below = _paths_below({employee_id for employee_id, _ in links})
+    changes = Counter()
+    for employee_id, manager_id in links:
+        for (ancestor_id, up), up_paths in above[manager_id].items():
+            for (descendant_id, down), down_paths in below[employee_id].items():
+                changes[(ancestor_id, descendant_id, up + 1 + down)] += up_paths * down_paths
+    return changes
+
+
+def _apply(changes, sign):
+    if not changes:
+        return
+    rows = ManagerClosure.objects.filter(
+        ancestor_id__in={key[0] for key in changes},
+        descendant_id__in={key[1] for key in changes},
+    )
+    existing = {(row.ancestor_id, row.descendant_id, row.depth): row for row in rows}
+
+    to_create, to_update, to_delete = [], [], []
+    for key, paths in changes.items():
+        row = existing.get(key)
+        if row is None:
+            if sign > 0:
+                to_create.append(ManagerClosure(ancestor_id=key[0], descendant_id=key[1], depth=key[2], paths=paths))
+            continue
+        row.paths += sign * paths
+        if row.paths > 0:
+            to_update.append(row)
+        else:
+            to_delete.append(row.pk)
+
+    ManagerClosure.objects.bulk_create(to_create, batch_size=2000)
+    ManagerClosure.objects.bulk_update(to_update, ['paths'], batch_size=2000)
+    ManagerClosure.objects.filter(pk__in=to_delete).delete()
+
+
+def check_links(links):
+    """
+    Raises ValidationError if adding the (employee id, manager id) links
+    would make someone their own (indirect) manager.
+    """
+    links = set(links)
+    if any(employee_id == manager_id for employee_id, manager_id in links):
+        raise ValidationError('A user cannot be their own manager.')
+    employee_ids = {employee_id for employee_id, _ in links}
+    manager_ids = {manager_id for _, manager_id in links}
+    # A link closes a loop if the employee is already above the manager.
+    above = set(
+        ManagerClosure.objects.filter(ancestor_id__in=employee_ids, descendant_id__in=manager_ids)
+        .values_list('ancestor_id', 'descendant_id')
+    )
+    if links & above:
+        raise ValidationError('This manager assignment would create a reporting cycle.')
+    # A loop through several new links at once needs both sides to vary,
+    # which m2m changes from a single user never do.
+    if len(employee_ids) > 1 and len(manager_ids) > 1:
+        _check_acyclic_with(links)
+
+
+def _check_acyclic_with(pairs):
+    """
+    Full check for several employees' links added at once, where a loop
+    can run through more than one new link.
+    """
+    managers_of = defaultdict(set)
+    for employee_id, manager_id in ManagerLink.objects.values_list('from_customuser_id', 'to_customuser_id'):
+        managers_of[employee_id].add(manager_id)
+    for employee_id, manager_id in pairs:
+        managers_of[employee_id].add(manager_id)
+    if find_cycle(managers_of):
+        raise ValidationError('This manager assignment would create a reporting cycle.')
+
+
+@transaction.atomic
+def add_links(links):
+    """
+    Records new (employee id, manager id) links in the closure table. The
+    links must have passed check_links() first.
+    """
+    # One link at a time: the paths added by one are the input of the next.
+    for link in links:
+        _apply(_path_changes([link]), +1)
+
+
+@transaction.atomic
+def remove_links(links):
+    """
+    Removes existing (employee id, manager id) links from the closure table.
+    """
+    for link in links:
+        _apply(_path_changes([link]), -1)
+
+
+@transaction.atomic
+def add_links_for_new_users(links):
+    """
+    Fast path of add_links for users created together, e.g. by an import:
+    the employee of every (employee id, manager id) link must be a new user
+    whose only subordinates are other new users in `links`. Closure rows are
+    then derived in memory, managers before their reports, and inserted in
+    bulk with one query for the existing managers' ancestors.
+    """
+    managers_of = defaultdict(list)
+    for employee_id, manager_id in links:
+        if employee_id == manager_id:
+            raise ValidationError('A user cannot be their own manager.')
+        managers_of[employee_id].append(manager_id)
+
+    # Order the new users so that each comes after its new managers.
+    order, state = [], {}
+    for start in managers_of:
+        if start in state:
+            continue
+        stack = [(start, iter(managers_of[start]))]
+        state[start] = 'visiting'
+        while stack:
+            user_id, managers = stack[-1]
+            manager_id = next(managers, None)
+            if manager_id is None:
+                stack.pop()
+                state[user_id] = 'done'
+                order.append(user_id)
+            elif state.get(manager_id) == 'visiting':
+                raise ValidationError('This manager assignment would create a reporting cycle.')
+            elif manager_id in managers_of and manager_id not in state:
+                state[manager_id] = 'visiting'
+                stack.append((manager_id, iter(managers_of[manager_id])))
+
+    existing_managers = {m for managers in managers_of.values() for m in managers if m not in managers_of}
+    above = _paths_above(existing_managers)
+    rows = []
+    for user_id in order:
+        paths = Counter()
+        for manager_id in managers_of[user_id]:
+            for (ancestor_id, depth), count in above[manager_id].items():
+                paths[(ancestor_id, depth + 1)] += count
+        rows.extend(
+            ManagerClosure(ancestor_id=ancestor_id, descendant_id=user_id, depth=depth, paths=count)
+            for (ancestor_id, depth), count in paths.items()
+        )
+        paths[(user_id, 0)] = 1
+        above[user_id] = paths
+    ManagerClosure.objects.bulk_create(rows, batch_size=2000)
+
+
+@transaction.atomic
+def rebuild():
+    """
+    Recomputes the closure table from CustomUser.managers. Returns the
+    number of rows and the links skipped because they form cycles.
+    """
+    links = ManagerLink.objects.values_list('from_customuser_id', 'to_customuser_id')
+    closure, skipped = compute_closure(list(links))
+    ManagerClosure.objects.all().delete()
+    ManagerClosure.objects.bulk_create(
+        (
+            ManagerClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth, paths=paths)
+            for (ancestor_id, descendant_id, depth), paths in closure.items()
+        ),
+        batch_size=2000,
+    )
+    return len(closure), skipped
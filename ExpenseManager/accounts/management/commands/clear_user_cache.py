@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from accounts import backends
+
+
+class Command(BaseCommand):
+    help = ('Drops every user cached for request.user. Run it after changing users with SQL or '
+            'queryset updates, which do not invalidate the cache.')
+
+    def handle(self, *args, **options):
+        backends.invalidate_all_users()
+        self.stdout.write(self.style.SUCCESS("Cached users cleared."))
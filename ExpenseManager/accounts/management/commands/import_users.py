@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Company
+from accounts.user_import import detect_format, import_users
+
+
+class Command(BaseCommand):
+    help = ('Imports employees and managers of one company from a CSV or JSON Lines file, '
+            'hashing passwords on a process pool. Usernames that already exist are skipped, '
+            'so an interrupted import can simply be restarted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or .jsonl file.')
+        parser.add_argument('--company', required=True, help='Company id or name.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help='File format (default: from the file extension).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500, help='Users written per transaction.')
+
+    def handle(self, *args, **options):
+        company = options['company']
+        lookup = {'pk': company} if company.isdigit() else {'name': company}
+        try:
+            company = Company.objects.get(**lookup)
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} does not exist.")
+
+        started = time.monotonic()
+
+        def progress(result):
+            rate = result.created / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"{result.created} created, {result.skipped} skipped ({rate:.0f} users/s)")
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = import_users(
+                    stream, options['format'] or detect_format(options['path']), company,
+                    workers=options['workers'], batch_size=options['batch_size'], progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, error in result.errors:
+            self.stderr.write(self.style.WARNING(f"Line {line}: {error}" if line else error))
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.monotonic() - started:.1f}s: {result.created} created, "
+            f"{result.skipped} already present, {len(result.errors)} rejected, {result.links} manager link(s)."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from accounts import hierarchy
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the manager hierarchy closure table from the manager assignments.'
+
+    def handle(self, *args, **options):
+        rows, skipped = hierarchy.rebuild()
+        for employee_id, manager_id in skipped:
+            self.stderr.write(self.style.WARNING(
+                f"Skipped the link from user {employee_id} to manager {manager_id}: it closes a reporting cycle."
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Manager closure rebuilt with {rows} row(s)."))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts import user_import
+
+
+class Command(BaseCommand):
+    help = 'Runs employee imports queued from the admin, one at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users written per transaction.')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help='Seconds after which a RUNNING job is considered abandoned and requeued.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling forever.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('User import worker started.')
+        while True:
+            requeued = user_import.requeue_stale(options['stale_after'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale import(s)."))
+
+            job = user_import.claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            try:
+                result = user_import.run_job(job, options['batch_size'])
+            except Exception as e:
+                self.stderr.write(f"Import {job.pk} failed: {e}")
+                continue
+            self.stdout.write(
+                f"Import {job.pk} into {job.company}: {result.created} created, {result.skipped} skipped, "
+                f"{len(result.errors)} rejected, {result.links} manager link(s) "
+                f"in {time.monotonic() - started:.1f}s."
+            )
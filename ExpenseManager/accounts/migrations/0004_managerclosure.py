@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.conf import settings
+
+from django.db import migrations, models
+
+from accounts.closure import compute_closure
+
+
+def build_closure(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    ManagerClosure = apps.get_model('accounts', 'ManagerClosure')
+
+    links = CustomUser.managers.through.objects.values_list('from_customuser_id', 'to_customuser_id')
+    closure, _ = compute_closure(list(links))
+    ManagerClosure.objects.bulk_create(
+        (
+            ManagerClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth, paths=paths)
+            for (ancestor_id, descendant_id, depth), paths in closure.items()
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_company_options_alter_customuser_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManagerClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('paths', models.PositiveIntegerField(default=1)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='closure_descendant_depth_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant', 'depth'), name='unique_closure_path_depth')],
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
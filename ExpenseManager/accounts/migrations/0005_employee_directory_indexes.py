@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_managerclosure'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['company', 'role', 'username'], name='user_company_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['company', 'username'], name='user_company_username_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(models.F('company'), django.db.models.functions.text.Lower('username'), name='user_company_username_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(models.F('company'), django.db.models.functions.text.Lower('email'), name='user_company_email_ci_idx'),
+        ),
+    ]
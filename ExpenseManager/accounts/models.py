@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Q
+from django.db.models import Min, Q
+from django.db.models.functions import Lower
 
+from .tracking import TrackedFieldsMixin
 
-class Company(models.Model):
+
+class Company(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     default_currency = models.CharField(max_length=3, default='USD')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -12,7 +15,7 @@ class Company(models.Model):
         return self.name
 
 
-class CustomUser(AbstractUser):
+class CustomUser(TrackedFieldsMixin, AbstractUser):
     class Role(models.TextChoices):
         ADMIN = 'ADMIN', 'Admin'
         MANAGER = 'MANAGER', 'Manager'
@@ -32,22 +35,39 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def all_subordinates(self):
+        """
+        Everyone who reports to this user, directly or through other managers.
+        """
+        return CustomUser.objects.filter(ancestor_links__ancestor=self).distinct()
+
+    def approval_chain(self):
+        """
+        Everyone above this user in the hierarchy, nearest first; `level` is
+        the length of the shortest reporting path to them.
+        """
+        return (
+            CustomUser.objects.filter(descendant_links__descendant=self)
+            .annotate(level=Min('descendant_links__depth'))
+            .order_by('level', 'pk')
+        )
+
     def save(self, *args, **kwargs):
-        # Store original state if the instance is being updated
-        if self.pk:
-            try:
-                old_instance = CustomUser.objects.get(pk=self.pk)
-                # Check if the role is being changed from a managing role to a non-managing one
-                was_manager = old_instance.role in [self.Role.ADMIN, self.Role.MANAGER]
-                is_now_employee = self.role == self.Role.EMPLOYEE
-
-                if was_manager and is_now_employee:
-                    # If the user is demoted, they can no longer be a manager for anyone.
-                    # This clears the relationship from their former subordinates.
-                    self.subordinates.clear()
-            except CustomUser.DoesNotExist:
-                # This can happen in rare cases like fixture loading.
-                pass
+        if self.pk and not self._state.adding:
+            # The role the user was loaded with; only instances that were
+            # not loaded from the database need a query.
+            if 'role' in self.loaded_values:
+                old_role = self.loaded_values['role']
+            else:
+                old_role = CustomUser.objects.filter(pk=self.pk).values_list('role', flat=True).first()
+            # Check if the role is being changed from a managing role to a non-managing one
+            was_manager = old_role in [self.Role.ADMIN, self.Role.MANAGER]
+            is_now_employee = self.role == self.Role.EMPLOYEE
+
+            if was_manager and is_now_employee:
+                # If the user is demoted, they can no longer be a manager for anyone.
+                # This clears the relationship from their former subordinates.
+                self.subordinates.clear()
 
         super().save(*args, **kwargs)
 
@@ -60,4 +80,78 @@ class CustomUser(AbstractUser):
                 name='one_admin_per_company'
             )
         ]
+        indexes = [
+            # Employee directory: role filter and username order per company,
+            # and case-insensitive username/email prefix search.
+            models.Index(fields=['company', 'role', 'username'], name='user_company_role_idx'),
+            models.Index(fields=['company', 'username'], name='user_company_username_idx'),
+            models.Index('company', Lower('username'), name='user_company_username_ci_idx'),
+            models.Index('company', Lower('email'), name='user_company_email_ci_idx'),
+        ]
+
+
+class ManagerClosure(models.Model):
+    """
+    Transitive closure of CustomUser.managers, maintained by
+    accounts.hierarchy. A row says `ancestor` is above `descendant` at
+    `depth` levels (1 = direct manager) through `paths` distinct reporting
+    paths; counting paths is what lets link removals be applied
+    incrementally when a user has several managers.
+    """
+    ancestor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+    paths = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant', 'depth'], name='unique_closure_path_depth')
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='closure_descendant_depth_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.ancestor} > {self.descendant} ({self.depth})"
+
+
+class UserImportJob(models.Model):
+    """
+    An employee import uploaded through the admin. The request only stores
+    the file; the `user_import_worker` management command runs the import
+    (accounts.user_import) out of band and records the outcome here. The
+    file, which may hold passwords, is deleted once the job has run.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    class Format(models.TextChoices):
+        CSV = 'csv', 'CSV'
+        JSONL = 'jsonl', 'JSON Lines'
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='user_imports/')
+    format = models.CharField(max_length=5, choices=Format.choices, default=Format.CSV)
+    workers = models.PositiveSmallIntegerField(default=1)
+    requested_by = models.ForeignKey('CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    links = models.PositiveIntegerField(default=0)
+    # [line number or null, message] pairs.
+    errors = models.JSONField(default=list, blank=True)
+    worker_id = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='userimportjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import into {self.company} ({self.get_status_display()})"
@@ -0,0 +1,145 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering keys of the last row
+seen instead of an OFFSET, so every page costs the same however deep it is,
+provided an index covers the keys. Keys must be non-null and, taken
+together, unique (end them with the primary key).
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+# Sorts after every character, so [prefix, prefix + PREFIX_END) is the
+# index range holding all values that start with prefix. That only holds
+# under a binary collation: SQLite's default, or "C" on PostgreSQL
+# (LC_COLLATE of the database); linguistic collations ignore punctuation
+# and would drop matches.
+PREFIX_END = '\U0010ffff'
+
+
+def prefix_match(field, prefix):
+    """
+    Q for rows whose `field` starts with `prefix`, ignoring case, as a range
+    over Lower(field) so that an index on that expression serves it.
+    """
+    # Bounds are lowered by the database too, so both sides fold case alike.
+    column = Lower(field)
+    return (
+        Q(GreaterThanOrEqual(column, Lower(Value(prefix))))
+        & Q(LessThan(column, Lower(Value(prefix + PREFIX_END))))
+    )
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _json_default(value):
+    # Full precision: keyset comparisons need the exact stored value.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot use {type(value).__name__} as a cursor key.")
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, list(values)], default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (direction, values), or (None, None) for a missing or
+    malformed cursor, which then simply yields the first page.
+    """
+    if not cursor:
+        return None, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None, None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+def _key_value(obj, key):
+    for attr in key.split('__'):
+        obj = obj[attr] if isinstance(obj, dict) else getattr(obj, attr)
+    return obj
+
+
+def _after(keys, values, descending):
+    """
+    Q for rows strictly after `values` in the (keys) ordering, i.e. the
+    expansion of the row comparison (k1, k2, ...) < (v1, v2, ...).
+    """
+    op = 'lt' if descending else 'gt'
+    condition = Q()
+    for i in reversed(range(len(keys))):
+        strict = Q(**{f"{keys[i]}__{op}": values[i]})
+        condition = strict if i == len(keys) - 1 else strict | (Q(**{keys[i]: values[i]}) & condition)
+    return condition
+
+
+def paginate(queryset, keys, cursor=None, per_page=50, descending=True):
+    """
+    Returns one KeysetPage of `queryset` ordered by `keys` (newest first
+    when `descending`). `cursor` is a next_cursor/previous_cursor taken
+    from an earlier page.
+    """
+    if len(keys) == 0:
+        raise ValueError('Keyset pagination needs at least one key.')
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(keys):
+        direction = values = None
+
+    backwards = direction == 'prev'
+    scan_descending = descending != backwards
+    prefix = '-' if scan_descending else ''
+    queryset = queryset.order_by(*(prefix + key for key in keys))
+    if values is not None:
+        queryset = queryset.filter(_after(keys, values, scan_descending))
+
+    rows = list(queryset[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, values is not None
+
+    page = KeysetPage(rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor('next', [_key_value(rows[-1], key) for key in keys])
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor('prev', [_key_value(rows[0], key) for key in keys])
+    return page
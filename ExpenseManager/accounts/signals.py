@@ -0,0 +1,48 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import backends, hierarchy
+from .models import CustomUser
+
+
+def _links(instance, reverse, pk_set):
+    """
+    (employee id, manager id) pairs for an m2m change made from either
+    side of CustomUser.managers.
+    """
+    if reverse:
+        return [(employee_id, instance.pk) for employee_id in pk_set]
+    return [(instance.pk, manager_id) for manager_id in pk_set]
+
+
+@receiver(m2m_changed, sender=CustomUser.managers.through)
+def update_manager_closure(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keeps ManagerClosure in step with CustomUser.managers. Removals are
+    applied before the links are deleted, while they can still be read.
+    Links that would create a reporting cycle raise ValidationError before
+    anything is written; forms check first (see forms.ManagersFieldMixin)
+    so users see a form error instead.
+    """
+    if action == 'pre_add':
+        hierarchy.check_links(_links(instance, reverse, pk_set))
+    elif action == 'post_add':
+        hierarchy.add_links(_links(instance, reverse, pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        side = 'to_customuser_id' if reverse else 'from_customuser_id'
+        existing = sender.objects.filter(**{side: instance.pk})
+        if action == 'pre_remove':
+            other = 'from_customuser_id' if reverse else 'to_customuser_id'
+            existing = existing.filter(**{f"{other}__in": pk_set})
+        hierarchy.remove_links(existing.values_list('from_customuser_id', 'to_customuser_id'))
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    backends.invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.managers.through)
+def invalidate_cached_assignments(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        backends.invalidate_user(instance.pk, *(pk_set or ()))
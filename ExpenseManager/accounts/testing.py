@@ -0,0 +1,15 @@
+"""
+Fixtures shared by the apps' tests.
+"""
+from .models import CustomUser
+
+
+def make_user(username, company, role=CustomUser.Role.EMPLOYEE, managers=(), **fields):
+    """
+    Creates a user without a password (hashing one is slow) and assigns
+    their managers.
+    """
+    user = CustomUser.objects.create_user(username, company=company, role=role, **fields)
+    if managers:
+        user.managers.add(*managers)
+    return user
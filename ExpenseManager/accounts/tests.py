@@ -1,3 +1,322 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from approvals import approval_service
+from approvals.models import Approval
+from expenses.models import Expense, ExpenseCategory
+
+from . import backends, hierarchy, user_import
+from .closure import compute_closure
+from .forms import ProfileUpdateForm
+from .models import Company, CustomUser, ManagerClosure, UserImportJob
+from .testing import make_user
+
+
+class UserImportTests(TestCase):
+    CSV = (
+        'username,email,role,managers\n'
+        'boss,boss@example.com,MANAGER,\n'
+        'lead,lead@example.com,MANAGER,boss\n'
+        'dev,dev@example.com,EMPLOYEE,lead;boss\n'
+    )
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+
+    def run_import(self, text, **kwargs):
+        return user_import.import_users(io.StringIO(text), 'csv', self.company, **kwargs)
+
+    def test_creates_users_links_and_hierarchy(self):
+        result = self.run_import(self.CSV, batch_size=2)
+        self.assertEqual((result.created, result.skipped, result.links, result.errors), (3, 0, 3, []))
+        boss = CustomUser.objects.get(username='boss')
+        self.assertEqual(set(boss.all_subordinates().values_list('username', flat=True)), {'lead', 'dev'})
+        self.assertFalse(boss.has_usable_password())
+
+    def test_rerun_adds_links_of_users_created_by_an_interrupted_run(self):
+        # An interrupted run created the users but not the links.
+        for username, role in (('boss', 'MANAGER'), ('lead', 'MANAGER'), ('dev', 'EMPLOYEE')):
+            make_user(username, self.company, role)
+        result = self.run_import(self.CSV)
+        self.assertEqual((result.created, result.skipped, result.links), (0, 3, 3))
+        dev = CustomUser.objects.get(username='dev')
+        self.assertEqual(set(dev.managers.values_list('username', flat=True)), {'lead', 'boss'})
+        self.assertEqual(list(dev.approval_chain().values_list('username', 'level')), [('boss', 1), ('lead', 1)])
+
+        again = self.run_import(self.CSV)
+        self.assertEqual((again.created, again.links), (0, 0))
+
+    def test_rerun_linking_an_existing_user_to_a_new_manager_keeps_the_closure_exact(self):
+        make_user('boss', self.company, CustomUser.Role.MANAGER)
+        first = self.run_import('username,role,managers\nemp,EMPLOYEE,mgr\n')
+        self.assertEqual((first.created, first.links), (1, 0))
+        second = self.run_import('username,role,managers\nemp,EMPLOYEE,mgr\nmgr,MANAGER,boss\n')
+        self.assertEqual((second.created, second.skipped, second.links, second.errors), (1, 1, 2, []))
+
+        def closure():
+            return set(ManagerClosure.objects.values_list(
+                'ancestor__username', 'descendant__username', 'depth', 'paths'
+            ))
+        incremental = closure()
+        hierarchy.rebuild()
+        self.assertEqual(incremental, closure())
+        self.assertIn(('boss', 'emp', 2, 1), incremental)
+
+    def test_rejects_invalid_rows_and_unknown_managers(self):
+        result = self.run_import('username,role,managers\nok,EMPLOYEE,nobody\n,EMPLOYEE,\nx,ADMIN,\n')
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 2])
+
+    def test_users_of_another_company_are_not_linked(self):
+        make_user('dev', Company.objects.create(name='Other'))
+        result = self.run_import('username,role,managers\nboss,MANAGER,\ndev,EMPLOYEE,boss\n')
+        self.assertEqual((result.created, result.skipped, result.links), (1, 1, 0))
+        self.assertIn('another company', result.errors[0][1])
+
+
+class UserImportJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.company = Company.objects.create(name='Acme')
+        self.superuser = CustomUser.objects.create_superuser('root', 'root@example.com', 'pw', company=self.company)
+
+    def test_admin_upload_queues_a_job_for_the_worker(self):
+        self.client.force_login(self.superuser)
+        upload = SimpleUploadedFile('people.csv', b'username,role\nann,EMPLOYEE\n', content_type='text/csv')
+        response = self.client.post(
+            reverse('admin:accounts_company_import_users', args=[self.company.pk]), {'file': upload, 'workers': 1}
+        )
+        job = UserImportJob.objects.get()
+        self.assertRedirects(response, reverse('admin:accounts_userimportjob_change', args=[job.pk]))
+        self.assertEqual(job.status, UserImportJob.Status.QUEUED)
+        self.assertFalse(CustomUser.objects.filter(username='ann').exists())
+
+        claimed = user_import.claim_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(user_import.claim_job())
+        path = claimed.file.path
+        user_import.run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created), (UserImportJob.Status.DONE, 1))
+        self.assertFalse(job.file)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(CustomUser.objects.filter(username='ann', company=self.company).exists())
+
+
+class TrackedFieldsTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+
+    def test_only_changed_columns_are_written(self):
+        company = Company.objects.get(pk=self.company.pk)
+        company.name = 'Acme Ltd'
+        with CaptureQueriesContext(connection) as queries:
+            company.save()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"default_currency"', queries[0]['sql'])
+        self.assertEqual(company.changed_fields(), set())
+
+    def test_unchanged_save_still_saves_and_sends_signals(self):
+        received = []
+        handler = lambda sender, instance, **kwargs: received.append(instance.pk)
+        post_save.connect(handler, sender=Company)
+        self.addCleanup(post_save.disconnect, handler, sender=Company)
+        company = Company.objects.get(pk=self.company.pk)
+        with CaptureQueriesContext(connection) as queries:
+            company.save()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(received, [company.pk])
+
+    def test_saving_a_concurrently_deleted_row_reinserts_it(self):
+        company = Company.objects.get(pk=self.company.pk)
+        Company.objects.filter(pk=company.pk).delete()
+        company.name = 'Acme Ltd'
+        company.save()
+        self.assertEqual(Company.objects.get(pk=company.pk).name, 'Acme Ltd')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auth-tests'},
+})
+class CachedModelBackendTests(TestCase):
+    def setUp(self):
+        self.backend = backends.CachedModelBackend()
+        self.user = make_user('ann', Company.objects.create(name='Acme'))
+        self.backend.get_user(self.user.pk)
+
+    def test_cached_user_is_served_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).username, 'ann')
+
+    def test_deactivated_user_is_dropped(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_snapshot_cached_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request that read the row before the commit.
+            self.backend.get_user(self.user.pk)
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=True)
+            self.assertIsNotNone(self.backend.get_user(self.user.pk))
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_lost_generation_key_drops_every_snapshot(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(role=CustomUser.Role.MANAGER)
+        caches[backends.USER_CACHE_ALIAS].delete(backends.GENERATION_KEY)
+        self.assertEqual(self.backend.get_user(self.user.pk).role, CustomUser.Role.MANAGER)
+
+    def test_queryset_updates_need_a_new_generation(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(role=CustomUser.Role.MANAGER)
+        self.assertEqual(self.backend.get_user(self.user.pk).role, CustomUser.Role.EMPLOYEE)
+        backends.invalidate_all_users()
+        self.assertEqual(self.backend.get_user(self.user.pk).role, CustomUser.Role.MANAGER)
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.force_login(self.user)
+        url = reverse('employee_dashboard')
+        self.assertEqual(self.client.get(url).wsgi_request.user, self.user)
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertFalse(self.client.get(url).wsgi_request.user.is_authenticated)
+
+
+class ManagerHierarchyTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.boss = make_user('boss', self.company, CustomUser.Role.ADMIN)
+        self.lead = make_user('lead', self.company, CustomUser.Role.MANAGER, managers=[self.boss])
+        self.dev = make_user('dev', self.company, CustomUser.Role.MANAGER, managers=[self.lead])
+
+    def closure(self):
+        return set(ManagerClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'paths'))
+
+    def test_incremental_closure_matches_a_rebuild(self):
+        self.dev.managers.add(self.boss)
+        self.lead.managers.remove(self.boss)
+        incremental = self.closure()
+        hierarchy.rebuild()
+        self.assertEqual(self.closure(), incremental)
+        self.assertEqual(
+            incremental,
+            {(self.lead.pk, self.dev.pk, 1, 1), (self.boss.pk, self.dev.pk, 1, 1)},
+        )
+
+    def test_cycles_are_refused_before_anything_is_written(self):
+        before = self.closure()
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.boss.managers.add(self.dev)
+        self.assertFalse(self.boss.managers.exists())
+        self.assertEqual(self.closure(), before)
+
+    def test_forms_report_cycles_as_errors(self):
+        form = ProfileUpdateForm(
+            {'first_name': '', 'last_name': '', 'email': '', 'managers': [self.dev.pk]},
+            instance=self.boss, request_user=self.boss,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('reporting cycle', str(form.errors['managers']))
+
+    def test_compute_closure_counts_paths_and_skips_cycles(self):
+        closure, skipped = compute_closure([(3, 2), (3, 1), (2, 1)])
+        self.assertEqual(closure, {(2, 3, 1): 1, (1, 3, 1): 1, (1, 3, 2): 1, (1, 2, 1): 1})
+        self.assertEqual(skipped, [])
+        closure, skipped = compute_closure([(1, 2), (2, 1)])
+        self.assertEqual(len(skipped), 1)
+
+
+class ManagerAutocompleteAdminTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.admin = make_user('admin', self.company, CustomUser.Role.ADMIN, is_staff=True)
+        self.admin.user_permissions.add(Permission.objects.get(codename='view_customuser'))
+        make_user('manager', self.company, CustomUser.Role.MANAGER)
+        make_user('mallory', Company.objects.create(name='Other'), CustomUser.Role.MANAGER)
+
+    def search(self, user, term):
+        self.client.force_login(user)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': term, 'app_label': 'accounts', 'model_name': 'customuser', 'field_name': 'managers',
+        })
+        return {result['text'] for result in response.json()['results']}
+
+    def test_managers_are_offered_from_the_users_company_only(self):
+        self.assertEqual(self.search(self.admin, 'ma'), {'manager'})
+
+    def test_superusers_see_every_company(self):
+        root = CustomUser.objects.create_superuser('root', 'root@example.com', None, company=Company.objects.create(name='Ops'))
+        self.assertEqual(self.search(root, 'ma'), {'manager', 'mallory'})
+
+
+class PrefixSearchTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.admin = make_user('admin', self.company, CustomUser.Role.ADMIN)
+        make_user('Anna', self.company, CustomUser.Role.MANAGER)
+        make_user('bob', self.company, email='ANDY@example.com')
+        make_user('anne', Company.objects.create(name='Other'))
+        self.client.force_login(self.admin)
+
+    def test_directory_prefix_search_ignores_case(self):
+        response = self.client.get(reverse('employee_directory_json'), {'q': 'an'})
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual({row['username'] for row in rows}, {'Anna', 'bob'})
+
+    def test_manager_autocomplete_ignores_case(self):
+        response = self.client.get(reverse('manager_autocomplete'), {'q': 'aNN'})
+        self.assertEqual([row['username'] for row in response.json()['results']], ['Anna'])
+
+
+class ManagerDashboardTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name='Acme')
+        self.manager = make_user('manager', company, CustomUser.Role.MANAGER)
+        self.employee = make_user('employee', company, managers=[self.manager])
+        self.client.force_login(self.manager)
+
+    def expense(self, day):
+        return Expense.objects.create(
+            employee=self.employee, category=ExpenseCategory.objects.get_or_create(name='Travel')[0],
+            amount=Decimal('10.00'), currency='USD', date=day, converted_amount=Decimal('10.00'),
+            required_approvals=1,
+        )
+
+    def test_approved_this_month_goes_by_approval_time(self):
+        today = timezone.localdate()
+        old_expense = self.expense(today - timedelta(days=400))
+        approval_service.record_decision(old_expense, self.manager, Approval.Decision.APPROVED)
+        approved_last_month = self.expense(today)
+        approval_service.record_decision(approved_last_month, self.manager, Approval.Decision.APPROVED)
+        Approval.objects.filter(expense=approved_last_month).update(reviewed_at=timezone.now() - timedelta(days=40))
+        # Edited after its approval, e.g. a receipt replaced or an amount backfilled.
+        approved_last_month.description = 'Edited'
+        approved_last_month.save()
+
+        response = self.client.get(reverse('manager_dashboard'))
+        [row] = response.context['subordinates']
+        self.assertEqual(row.approved_this_month, Decimal('10.00'))
@@ -0,0 +1,97 @@
+"""
+In-memory change tracking for model instances.
+"""
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers the values of the concrete fields an instance was loaded (or
+    last saved) with, so changes can be detected without another query.
+    save() on a loaded instance then only writes the changed columns, plus
+    auto_now fields. It is otherwise a normal save: signals are sent, an
+    unchanged instance is saved in full, and a row deleted since it was
+    loaded is inserted again.
+
+    Values are compared with ==, so in-place mutation of mutable values
+    (e.g. a dict in a JSONField) is not detected.
+    """
+    _loaded_values = None
+    _write_only = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self, attnames=None):
+        if self._loaded_values is None:
+            self._loaded_values = {}
+        if attnames is None:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+        for attname in attnames:
+            # Deferred fields are absent from __dict__ and not tracked.
+            if attname in self.__dict__:
+                self._loaded_values[attname] = self.__dict__[attname]
+
+    @property
+    def loaded_values(self):
+        """
+        {attname: value} as loaded from or last saved to the database.
+        """
+        return self._loaded_values or {}
+
+    def changed_fields(self):
+        """
+        Names of concrete fields whose value differs from the loaded one.
+        Fields that were never loaded count as changed once assigned.
+        """
+        loaded = self.loaded_values
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname in self.__dict__
+            and (field.attname not in loaded or self.__dict__[field.attname] != loaded[field.attname])
+        }
+
+    def has_changed(self, field_name):
+        return field_name in self.changed_fields()
+
+    def save(self, *args, **kwargs):
+        narrow = (
+            not args
+            and self._loaded_values is not None
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        )
+        changed = self.changed_fields() if narrow else None
+        if changed:
+            self._write_only = changed | {
+                field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)
+            }
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._write_only = None
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._snapshot()
+        else:
+            self._snapshot([self._meta.get_field(name).attname for name in update_fields])
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Narrowed here rather than via update_fields, so that when the UPDATE
+        # matches no row Django still falls back to an INSERT.
+        if self._write_only:
+            values = [value for value in values if value[0].name in self._write_only]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            self._snapshot()
+        else:
+            self._snapshot([getattr(self._meta.get_field(name), 'attname', name) for name in fields])
@@ -13,6 +13,8 @@ urlpatterns = [
 
     # Dashboard placeholder views
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),
+    path('dashboard/admin/employees.json', views.employee_directory_json, name='employee_directory_json'),
+    path('managers/autocomplete.json', views.manager_autocomplete, name='manager_autocomplete'),
     path('dashboard/manager/', views.manager_dashboard, name='manager_dashboard'),
     path('dashboard/employee/', views.employee_dashboard, name='employee_dashboard'),
 
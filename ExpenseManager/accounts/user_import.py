@@ -0,0 +1,353 @@
+"""
+Bulk employee import from CSV or JSON Lines files.
+
+Each row describes one user of the target company:
+
+    username    required
+    email, first_name, last_name
+    role        EMPLOYEE (default) or MANAGER
+    password    optional; users without one get an unusable password and
+                are expected to use password reset
+    managers    usernames of their managers, existing or in the same file
+                (separated by ';' in CSV, a list in JSON Lines)
+
+Rows are read and validated as a stream and written in batches with
+bulk_create. Password hashing, which dominates the cost, runs on a process
+pool. Usernames that already exist are skipped, but the manager links of
+their rows are still added when missing, so an import that failed part way
+can be re-run with the same file.
+
+Imports uploaded through the admin are stored as UserImportJobs and run by
+the `user_import_worker` management command (claim_job/run_job), so the
+request never hashes passwords or starts processes.
+"""
+import csv
+import io
+import json
+import os
+import socket
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import hierarchy
+from .models import CustomUser, UserImportJob
+
+IMPORTABLE_ROLES = (CustomUser.Role.EMPLOYEE, CustomUser.Role.MANAGER)
+MANAGING_ROLES = (CustomUser.Role.ADMIN, CustomUser.Role.MANAGER)
+LOOKUP_CHUNK_SIZE = 500
+
+validate_username = UnicodeUsernameValidator()
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    links: int = 0
+    # (line number or None, message)
+    errors: list = field(default_factory=list)
+
+
+def detect_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Yields (line number, row dict or None, parse error) from a text stream.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object.'
+            continue
+        yield line_number, row, None
+
+
+def clean_row(row):
+    """
+    Validates one row and returns (user fields, password, manager usernames).
+    Raises ValidationError.
+    """
+    username = str(row.get('username') or '').strip()
+    if not username:
+        raise ValidationError('Missing username.')
+    if len(username) > CustomUser._meta.get_field('username').max_length:
+        raise ValidationError(f"Username {username!r} is too long.")
+    validate_username(username)
+
+    email = str(row.get('email') or '').strip()
+    if email:
+        validate_email(email)
+
+    role = str(row.get('role') or CustomUser.Role.EMPLOYEE).strip().upper()
+    if role not in IMPORTABLE_ROLES:
+        raise ValidationError(f"Role must be one of {', '.join(IMPORTABLE_ROLES)}.")
+
+    managers = row.get('managers') or []
+    if isinstance(managers, str):
+        managers = managers.split(';')
+    managers = [str(name).strip() for name in managers if str(name).strip()]
+
+    fields = {
+        'username': username,
+        'email': email,
+        'first_name': str(row.get('first_name') or '').strip()[:150],
+        'last_name': str(row.get('last_name') or '').strip()[:150],
+        'role': role,
+    }
+    return fields, str(row.get('password') or ''), managers
+
+
+class UserImporter:
+    """
+    Imports rows (as yielded by read_rows) into `company`.
+    """
+
+    def __init__(self, company, workers=1, batch_size=500, progress=None):
+        self.company = company
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.progress = progress
+        self.result = ImportResult()
+        self.seen = set()
+        # (line, employee username, manager username) for every imported row,
+        # including rows whose user already existed.
+        self.links = []
+        self.created_usernames = set()
+
+    def run(self, rows):
+        pool = None
+        if self.workers > 1:
+            # Children must not share the parent's database connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup)
+        try:
+            batch = []
+            for line, row, error in rows:
+                if error:
+                    self.result.errors.append((line, error))
+                    continue
+                try:
+                    fields, password, managers = clean_row(row)
+                except ValidationError as e:
+                    self.result.errors.append((line, ' '.join(e.messages)))
+                    continue
+                if fields['username'] in self.seen:
+                    self.result.errors.append((line, f"Duplicate username {fields['username']!r}."))
+                    continue
+                self.seen.add(fields['username'])
+                batch.append((line, fields, password, managers))
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch, pool)
+                    batch = []
+            if batch:
+                self._write_batch(batch, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self._write_links()
+        return self.result
+
+    def _write_batch(self, batch, pool):
+        existing = set(
+            CustomUser.objects.filter(username__in=[fields['username'] for _, fields, _, _ in batch])
+            .values_list('username', flat=True)
+        )
+        new = [entry for entry in batch if entry[1]['username'] not in existing]
+        self.result.skipped += len(batch) - len(new)
+
+        passwords = [password for _, _, password, _ in new if password]
+        if pool is not None:
+            hashed = iter(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (self.workers * 4))))
+        else:
+            hashed = iter([make_password(password) for password in passwords])
+        unusable = make_password(None)
+
+        users = [
+            CustomUser(
+                company=self.company,
+                password=next(hashed) if password else unusable,
+                **fields,
+            )
+            for _, fields, password, _ in new
+        ]
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+
+        for line, fields, _, managers in batch:
+            self.links.extend((line, fields['username'], manager) for manager in managers)
+        self.created_usernames.update(fields['username'] for _, fields, _, _ in new)
+        self.result.created += len(users)
+        if self.progress:
+            self.progress(self.result)
+
+    def _write_links(self):
+        """
+        Adds the manager links of all imported rows. Links of users created
+        by this run go in with one bulk insert; users that already existed
+        (e.g. created by an interrupted run) get their missing links one
+        user at a time through CustomUser.managers, so the usual signals
+        keep the hierarchy, inboxes and pending expenses up to date.
+        """
+        if not self.links:
+            return
+        usernames = list({name for _, employee, manager in self.links for name in (employee, manager)})
+        users = {}
+        for start in range(0, len(usernames), LOOKUP_CHUNK_SIZE):
+            chunk = CustomUser.objects.filter(
+                company=self.company, username__in=usernames[start:start + LOOKUP_CHUNK_SIZE]
+            )
+            users.update((username, (pk, role)) for username, pk, role in chunk.values_list('username', 'pk', 'role'))
+
+        new_links, existing_links = set(), {}
+        for line, employee, manager in self.links:
+            if employee not in users:
+                self.result.errors.append((line, f"User {employee!r} belongs to another company."))
+            elif manager not in users:
+                self.result.errors.append((line, f"Unknown manager {manager!r}."))
+            elif users[manager][1] not in MANAGING_ROLES:
+                self.result.errors.append((line, f"{manager!r} is not a manager."))
+            elif employee in self.created_usernames:
+                new_links.add((users[employee][0], users[manager][0]))
+            else:
+                existing_links.setdefault(users[employee][0], {})[users[manager][0]] = line
+
+        # New users first: until the existing users below are linked to them,
+        # their only subordinates are other new users, which the bulk path
+        # of the closure relies on. The existing users' links then go
+        # through add_links, which extends the paths of everyone below.
+        try:
+            with transaction.atomic():
+                CustomUser.managers.through.objects.bulk_create(
+                    [
+                        CustomUser.managers.through(from_customuser_id=employee_id, to_customuser_id=manager_id)
+                        for employee_id, manager_id in new_links
+                    ],
+                    batch_size=2000,
+                )
+                # bulk_create sends no m2m_changed, so the closure is updated here.
+                hierarchy.add_links_for_new_users(new_links)
+        except ValidationError as e:
+            self.result.errors.append((None, f"No manager links of new users were imported: {' '.join(e.messages)}"))
+        else:
+            self.result.links += len(new_links)
+        self._add_existing_links(existing_links)
+
+    def _add_existing_links(self, links):
+        """
+        Adds the missing links of {existing employee id: {manager id: line}}.
+        """
+        if not links:
+            return
+        present = set(
+            CustomUser.managers.through.objects.filter(from_customuser_id__in=links)
+            .values_list('from_customuser_id', 'to_customuser_id')
+        )
+        for employee_id, managers in links.items():
+            missing = [manager_id for manager_id in managers if (employee_id, manager_id) not in present]
+            if not missing:
+                continue
+            try:
+                with transaction.atomic():
+                    CustomUser(pk=employee_id).managers.add(*missing)
+            except ValidationError as e:
+                self.result.errors.append((min(managers[m] for m in missing), ' '.join(e.messages)))
+                continue
+            self.result.links += len(missing)
+
+
+def import_users(stream, fmt, company, workers=1, batch_size=500, progress=None):
+    """
+    Imports users from a text stream in `fmt` ('csv' or 'jsonl') into
+    `company` and returns an ImportResult.
+    """
+    return UserImporter(company, workers, batch_size, progress).run(read_rows(stream, fmt))
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_job(worker_id=None):
+    """
+    Moves the oldest queued UserImportJob to RUNNING and returns it, or None
+    when the queue is empty. The conditional UPDATE makes sure two workers
+    never claim the same job.
+    """
+    worker_id = worker_id or new_worker_id()
+    with transaction.atomic():
+        job_id = (
+            UserImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=UserImportJob.Status.QUEUED)
+            .order_by('created_at')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = UserImportJob.objects.filter(id=job_id, status=UserImportJob.Status.QUEUED).update(
+            status=UserImportJob.Status.RUNNING, worker_id=worker_id, started_at=timezone.now(),
+        )
+    return UserImportJob.objects.select_related('company').get(pk=job_id) if claimed else None
+
+
+def run_job(job, batch_size=500):
+    """
+    Runs a claimed job, saving its counts after every batch, and deletes its
+    file once done. Returns the ImportResult.
+    """
+    def progress(result):
+        job.created, job.skipped = result.created, result.skipped
+        job.save(update_fields=['created', 'skipped'])
+
+    try:
+        with job.file.open('rb') as f:
+            stream = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+            result = import_users(stream, job.format, job.company, job.workers, batch_size, progress)
+    except Exception as e:
+        job.status = UserImportJob.Status.FAILED
+        job.errors = [[None, f"{type(e).__name__}: {e}"]]
+        raise
+    else:
+        job.status = UserImportJob.Status.DONE
+        job.created, job.skipped, job.links = result.created, result.skipped, result.links
+        job.errors = [list(error) for error in result.errors]
+    finally:
+        job.finished_at = timezone.now()
+        job.file.delete(save=False)
+        job.save(update_fields=['status', 'created', 'skipped', 'links', 'errors', 'file', 'finished_at'])
+    return result
+
+
+def requeue_stale(stale_after):
+    """
+    Puts jobs left RUNNING by a worker that died back on the queue; imports
+    are safe to re-run. Returns the number of jobs requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return UserImportJob.objects.filter(status=UserImportJob.Status.RUNNING, started_at__lt=cutoff).update(
+        status=UserImportJob.Status.QUEUED,
+    )
@@ -1,3 +1,7 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.views.generic import CreateView, UpdateView
@@ -5,9 +9,14 @@ from django.contrib.auth.views import LoginView as BaseLoginView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 
+from approvals.models import Approval
 from .models import CustomUser, Company
 from .forms import CustomUserCreationForm, ProfileUpdateForm, EditRoleForm
+from .pagination import paginate, prefix_match
 
 
 def index(request):
@@ -85,7 +94,8 @@ class ProfileView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         if request_user == profile_user:
             return True
 
-        if request_user.company == profile_user.company and \
+        # Compare ids: request.user comes from the cache without its company.
+        if request_user.company_id == profile_user.company_id and \
                 (request_user.role in [CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]):
             return True
 
@@ -115,18 +125,119 @@ def dashboard_redirect(request):
 # --- Placeholder Dashboard Views ---
 # In a real app, these would be more complex views.
 
+DIRECTORY_PAGE_SIZE = 50
+
+
+def _employee_directory(request):
+    """
+    The requesting admin's company employees, filtered by the `q`
+    (username or email prefix, any case) and `role` query parameters.
+    Prefixes are matched as index ranges rather than LIKE patterns so the
+    (company, lower(username)) and (company, lower(email)) indexes are used.
+    """
+    employees = CustomUser.objects.filter(company_id=request.user.company_id).only(
+        'id', 'username', 'email', 'role'
+    )
+    role = request.GET.get('role')
+    if role in CustomUser.Role.values:
+        employees = employees.filter(role=role)
+    prefix = request.GET.get('q', '').strip()
+    if prefix:
+        employees = employees.filter(prefix_match('username', prefix) | prefix_match('email', prefix))
+    return employees
+
+
 @login_required
 @user_passes_test(lambda u: u.role == CustomUser.Role.ADMIN)
 def admin_dashboard(request):
-    company = request.user.company
-    employees = CustomUser.objects.filter(company=company)
-    return render(request, 'accounts/admin_dashboard.html', {'employees': employees})
+    page = paginate(
+        _employee_directory(request), ('username', 'id'), request.GET.get('cursor'),
+        per_page=DIRECTORY_PAGE_SIZE, descending=False,
+    )
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+    return render(request, 'accounts/admin_dashboard.html', {
+        'employees': page,
+        'page': page,
+        'roles': CustomUser.Role.choices,
+        'filters': filters.urlencode(),
+    })
+
+
+@login_required
+@user_passes_test(lambda u: u.role == CustomUser.Role.ADMIN)
+def employee_directory_json(request):
+    """
+    Streams the whole (filtered) employee directory as a JSON array, reading
+    users in chunks so memory stays flat for any company size.
+    """
+    def rows():
+        yield '['
+        employees = _employee_directory(request).order_by('username').values('id', 'username', 'email', 'role')
+        for i, employee in enumerate(employees.iterator(chunk_size=2000)):
+            yield (',' if i else '') + json.dumps(employee)
+        yield ']'
+
+    return StreamingHttpResponse(rows(), content_type='application/json')
+
+
+MANAGER_AUTOCOMPLETE_LIMIT = 20
+MANAGER_DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'MANAGER_DASHBOARD_CACHE_TIMEOUT', 60)
+
+
+@login_required
+@user_passes_test(lambda u: u.role in [CustomUser.Role.MANAGER, CustomUser.Role.ADMIN])
+def manager_autocomplete(request):
+    """
+    Up to MANAGER_AUTOCOMPLETE_LIMIT admins and managers of the requesting
+    user's company whose username starts with `q` (any case), for
+    ManagerAutocompleteWidget. `exclude` drops one user id (the user being
+    edited). Matched as an index range on (company, lower(username)).
+    """
+    managers = CustomUser.objects.filter(
+        company_id=request.user.company_id,
+        role__in=[CustomUser.Role.ADMIN, CustomUser.Role.MANAGER],
+    )
+    prefix = request.GET.get('q', '').strip()
+    if prefix:
+        managers = managers.filter(prefix_match('username', prefix))
+    exclude = request.GET.get('exclude', '')
+    if exclude.isdigit():
+        managers = managers.exclude(pk=exclude)
+    rows = managers.order_by('username').values_list('id', 'username', 'first_name', 'last_name')
+    return JsonResponse({'results': [
+        {'id': pk, 'username': username, 'name': f"{first_name} {last_name}".strip()}
+        for pk, username, first_name, last_name in rows[:MANAGER_AUTOCOMPLETE_LIMIT]
+    ]})
 
 
 @login_required
 @user_passes_test(lambda u: u.role in [CustomUser.Role.MANAGER, CustomUser.Role.ADMIN])
 def manager_dashboard(request):
-    subordinates = request.user.subordinates.all()
+    """
+    Direct reports with their pending expense count, expenses approved this
+    month (in the company currency) and oldest pending submission, aggregated in one grouped query
+    and cached for MANAGER_DASHBOARD_CACHE_TIMEOUT seconds. "Approved this
+    month" goes by when the expense was approved, i.e. an approving review
+    this month (no reviews are taken once an expense is approved), not by
+    its date or its last change.
+    """
+    key = f"manager-dashboard:{request.user.pk}"
+    subordinates = cache.get(key)
+    if subordinates is None:
+        pending = Q(expense__status='PENDING')
+        month_start = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        approved_this_month = Q(expense__status='APPROVED') & Q(Exists(Approval.objects.filter(
+            expense=OuterRef('expense'), decision=Approval.Decision.APPROVED, reviewed_at__gte=month_start,
+        )))
+        subordinates = list(
+            request.user.subordinates.only('id', 'username', 'email', 'role').annotate(
+                pending_count=Count('expense', filter=pending),
+                approved_this_month=Sum('expense__converted_amount', filter=approved_this_month),
+                oldest_pending=Min('expense__created_at', filter=pending),
+            ).order_by('username')
+        )
+        cache.set(key, subordinates, MANAGER_DASHBOARD_CACHE_TIMEOUT)
     return render(request, 'accounts/manager_dashboard.html', {'subordinates': subordinates})
 
 
@@ -137,7 +248,7 @@ def employee_dashboard(request):
 @login_required
 @user_passes_test(lambda u: u.role == CustomUser.Role.ADMIN)
 def edit_employee_role(request, pk):
-    employee = get_object_or_404(CustomUser, pk=pk, company=request.user.company)
+    employee = get_object_or_404(CustomUser, pk=pk, company_id=request.user.company_id)
     if request.method == 'POST':
         form = EditRoleForm(request.POST, instance=employee)
         if form.is_valid():
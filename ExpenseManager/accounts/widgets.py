@@ -0,0 +1,32 @@
+from django import forms
+from django.urls import reverse_lazy
+
+
+class ManagerAutocompleteWidget(forms.SelectMultiple):
+    """
+    A SelectMultiple that renders only the selected managers and looks up
+    others as the user types, through the manager_autocomplete endpoint.
+    Validation is unchanged: the field's queryset is only queried for the
+    submitted ids.
+    """
+    template_name = 'accounts/widgets/manager_autocomplete.html'
+
+    def __init__(self, attrs=None, url=reverse_lazy('manager_autocomplete')):
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(v) for v in value if v not in self.choices.field.empty_values}
+        if not selected:
+            return []
+        queryset = self.choices.queryset.filter(pk__in=selected).only('pk', 'username')
+        options = [
+            self.create_option(name, user.pk, self.choices.field.label_from_instance(user), True, index)
+            for index, user in enumerate(queryset)
+        ]
+        return [(None, options, 0)]
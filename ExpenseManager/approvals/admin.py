@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import Approval, ApprovalInboxItem, ApprovalRule, ApprovalRuleStep
 
-# Register your models here.
+
+class ApprovalRuleStepInline(admin.TabularInline):
+    model = ApprovalRuleStep
+    extra = 1
+
+
+class ApprovalRuleAdmin(admin.ModelAdmin):
+    list_display = ('company', 'rule_type', 'percentage', 'specific_approver', 'updated_at')
+    inlines = [ApprovalRuleStepInline]
+
+
+admin.site.register(Approval)
+admin.site.register(ApprovalInboxItem)
+admin.site.register(ApprovalRule, ApprovalRuleAdmin)
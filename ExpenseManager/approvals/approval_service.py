@@ -0,0 +1,195 @@
+"""
+Recording manager reviews. Each expense keeps approved/rejected/required
+counters, and its company's compiled approval rule (approvals.rules) turns
+them into a status without counting Approval rows. The counters only count
+reviews by the employee's current managers; decisions of other designated
+approvers are read by the rules that name them.
+"""
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from expenses import rollups
+from expenses.models import Expense
+from . import inbox, rules
+from .models import Approval, ApprovalInboxItem
+
+RECOMPUTE_BATCH_SIZE = 2000
+
+COUNTER_FIELDS = {
+    Approval.Decision.APPROVED: 'approved_count',
+    Approval.Decision.REJECTED: 'rejected_count',
+}
+TALLY_FIELDS = ('pk', 'employee__company_id', 'approved_count', 'rejected_count', 'required_approvals', 'status')
+
+
+def required_approvals_for(employee):
+    """
+    Number of reviews an expense submitted now by `employee` needs.
+    """
+    return employee.managers.count()
+
+
+def _is_manager_of(manager, employee_id):
+    ManagerLink = get_user_model().managers.through
+    return ManagerLink.objects.filter(from_customuser_id=employee_id, to_customuser_id=manager.pk).exists()
+
+
+def evaluate_statuses(tallies):
+    """
+    Evaluates each company's approval rule for expenses given as dicts of
+    TALLY_FIELDS and returns {expense id: status}. Approvals are loaded,
+    in one query, only for expenses whose rule looks at who decided.
+    """
+    evaluators = {row['pk']: rules.get_evaluator(row['employee__company_id']) for row in tallies}
+    need_decisions = [pk for pk, evaluator in evaluators.items() if evaluator.needs_decisions]
+    decisions = {pk: {} for pk in need_decisions}
+    if need_decisions:
+        approvals = Approval.objects.filter(expense_id__in=need_decisions)
+        for expense_id, manager_id, decision in approvals.values_list('expense_id', 'manager_id', 'decision'):
+            decisions[expense_id][manager_id] = decision
+    return {
+        row['pk']: evaluators[row['pk']].evaluate(
+            row['approved_count'], row['rejected_count'], row['required_approvals'], decisions.get(row['pk'])
+        )
+        for row in tallies
+    }
+
+
+def apply_statuses(tallies, statuses):
+    """
+    Saves the statuses that changed, with one UPDATE per status, moves them
+    in the spend rollups and takes expenses that are no longer pending out
+    of every inbox.
+    """
+    changed = {}
+    for row in tallies:
+        status = statuses[row['pk']]
+        if status != row['status']:
+            changed.setdefault(status, []).append(row['pk'])
+    now = timezone.now()
+    for status, expense_ids in changed.items():
+        rollups.change_status(expense_ids, status)
+        Expense.objects.filter(pk__in=expense_ids).update(status=status, updated_at=now)
+        if status != 'PENDING':
+            inbox.close_expenses(expense_ids)
+    return changed
+
+
+@transaction.atomic
+def record_decision(expense, manager, decision, comments=''):
+    """
+    Stores a manager's review and updates the expense's tallies and status
+    in the same transaction. The counter is incremented in the database
+    before the tallies are read back, so the expense row is already locked
+    for writing and concurrent reviews cannot evaluate stale counts. Raises
+    ValidationError when the company's rule does not take this reviewer's
+    decision yet (a later step of a sequential rule).
+    """
+    evaluator = rules.get_evaluator(expense.employee.company_id)
+    decisions = {}
+    if evaluator.needs_decisions:
+        decisions = dict(Approval.objects.filter(expense=expense).values_list('manager_id', 'decision'))
+    if not evaluator.accepts_review(manager.pk, decisions):
+        raise ValidationError('This expense is waiting for an earlier approver.')
+
+    approval = Approval.objects.create(
+        expense=expense,
+        manager=manager,
+        decision=decision,
+        comments=comments,
+    )
+
+    counter = COUNTER_FIELDS[decision]
+    rows = Expense.objects.filter(pk=expense.pk)
+    # Reviewers who are not the employee's managers add 0; the UPDATE still
+    # takes the row lock.
+    increment = 1 if _is_manager_of(manager, expense.employee_id) else 0
+    rows.update(**{counter: F(counter) + increment})
+    tallies = [rows.values(*TALLY_FIELDS).get()]
+    statuses = evaluate_statuses(tallies)
+    apply_statuses(tallies, statuses)
+    if evaluator.ordered:
+        inbox.add_next_reviewers([expense.pk])
+
+    expense.approved_count = tallies[0]['approved_count']
+    expense.rejected_count = tallies[0]['rejected_count']
+    expense.required_approvals = tallies[0]['required_approvals']
+    expense.status = statuses[expense.pk]
+    # These now match the row, so a later save() does not rewrite them.
+    expense._snapshot(['approved_count', 'rejected_count', 'required_approvals', 'status'])
+    return approval
+
+
+@transaction.atomic
+def record_bulk_decision(manager, expense_ids, decision, comments=''):
+    """
+    Applies one decision to many expenses at once. Only expenses still in
+    the manager's inbox are reviewed; the rest are ignored. Approvals are
+    bulk inserted and tallies and statuses updated with set-based
+    statements, so the query count does not depend on the number of
+    expenses. Returns the ids of the reviewed expenses.
+    """
+    waiting = ApprovalInboxItem.objects.filter(manager=manager, expense_id__in=expense_ids)
+    reviewed_ids = list(waiting.values_list('expense_id', flat=True))
+    if not reviewed_ids:
+        return []
+
+    Approval.objects.bulk_create([
+        Approval(expense_id=expense_id, manager=manager, decision=decision, comments=comments)
+        for expense_id in reviewed_ids
+    ])
+    # bulk_create sends no post_save, so the inbox rows are removed here.
+    waiting.filter(expense_id__in=reviewed_ids).delete()
+
+    counter = COUNTER_FIELDS[decision]
+    expenses = Expense.objects.filter(pk__in=reviewed_ids)
+    expenses.filter(employee__managers=manager).update(**{counter: F(counter) + 1})
+    tallies = list(expenses.values(*TALLY_FIELDS))
+    apply_statuses(tallies, evaluate_statuses(tallies))
+    inbox.add_next_reviewers(reviewed_ids)
+    return reviewed_ids
+
+
+def _count_per_row(queryset, group_by):
+    return Coalesce(Subquery(
+        queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')[:1]
+    ), Value(0))
+
+
+@transaction.atomic
+def recompute_pending(employee_ids=None):
+    """
+    Re-derives required_approvals and the review tallies of pending
+    expenses (of `employee_ids`, or of everyone) from the current manager
+    assignments and the Approval rows of those managers (reviews by managers
+    who were since unassigned no longer count), then re-evaluates their
+    status. Expenses left without managers stay pending. Tallies
+    are refreshed with one UPDATE and statuses applied in batches with one
+    UPDATE per status. Returns the number of expenses whose status changed.
+    """
+    pending = Expense.objects.filter(status='PENDING')
+    if employee_ids is not None:
+        pending = pending.filter(employee_id__in=employee_ids)
+
+    ManagerLink = get_user_model().managers.through
+    decisions = Approval.objects.filter(expense=OuterRef('pk'), manager__subordinates=OuterRef('employee_id'))
+    pending.update(
+        required_approvals=_count_per_row(
+            ManagerLink.objects.filter(from_customuser=OuterRef('employee_id')), 'from_customuser'
+        ),
+        approved_count=_count_per_row(decisions.filter(decision=Approval.Decision.APPROVED), 'expense'),
+        rejected_count=_count_per_row(decisions.filter(decision=Approval.Decision.REJECTED), 'expense'),
+    )
+
+    expense_ids = list(pending.order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(expense_ids), RECOMPUTE_BATCH_SIZE):
+        batch = expense_ids[start:start + RECOMPUTE_BATCH_SIZE]
+        tallies = list(Expense.objects.filter(pk__in=batch).values(*TALLY_FIELDS))
+        for updated in apply_statuses(tallies, evaluate_statuses(tallies)).values():
+            changed += len(updated)
+    return changed
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApprovalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'approvals'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from . import signals
+
+        signals.connect_assignment_signals(get_user_model())
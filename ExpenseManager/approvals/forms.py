@@ -12,4 +12,23 @@ class ReviewForm(forms.Form):
             'rows': 3
         }),
         required=False
-    )
\ No newline at end of file
+    )
+
+
+class ExpenseIdsField(forms.Field):
+    """
+    A list of expense ids posted as repeated form values (checkboxes).
+    """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return sorted({int(v) for v in value})
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Invalid expense selection.')
+
+
+class BulkReviewForm(ReviewForm):
+    expense_ids = ExpenseIdsField(error_messages={'required': 'Select at least one expense.'})
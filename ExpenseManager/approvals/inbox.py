@@ -0,0 +1,174 @@
+"""
+Maintenance of the materialized approval inbox (ApprovalInboxItem).
+
+A row exists for every (reviewer, expense) pair where the expense is still
+PENDING, the reviewer is someone its company's approval rule is waiting on
+(approvals.rules: the employee's managers, the rule's specific approver, or
+the current step of a sequential rule) and they have not reviewed it yet.
+approvals.signals calls into this module when expenses are submitted,
+reviews land, manager assignments change and rules change; code that
+bypasses signals (bulk_create, queryset updates) must call it directly.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from expenses.models import Expense
+from . import rules
+from .models import Approval, ApprovalInboxItem
+
+BATCH_SIZE = 2000
+
+
+def _decisions(expense_ids):
+    """
+    {expense id: {reviewer id: decision}} for reviews already made.
+    """
+    decisions = {}
+    approvals = Approval.objects.filter(expense_id__in=expense_ids)
+    for expense_id, manager_id, decision in approvals.values_list('expense_id', 'manager_id', 'decision'):
+        decisions.setdefault(expense_id, {})[manager_id] = decision
+    return decisions
+
+
+def _company_ids(employee_ids):
+    users = get_user_model().objects.filter(pk__in=set(employee_ids))
+    return dict(users.values_list('pk', 'company_id'))
+
+
+def _create_items(expenses, managers_by_employee):
+    """
+    Inserts inbox rows for `expenses` (objects with id, employee_id and
+    created_at) for each reviewer their company's rule is waiting on, given
+    their employee's managers.
+    """
+    if not expenses:
+        return 0
+    decisions = _decisions([expense.id for expense in expenses])
+    companies = _company_ids(expense.employee_id for expense in expenses)
+    items = []
+    for expense in expenses:
+        evaluator = rules.get_evaluator(companies.get(expense.employee_id))
+        made = decisions.get(expense.id, {})
+        reviewers = evaluator.reviewers(managers_by_employee.get(expense.employee_id, ()), made)
+        items.extend(
+            ApprovalInboxItem(manager_id=reviewer_id, expense_id=expense.id, submitted_at=expense.created_at)
+            # Nobody reviews their own expense.
+            for reviewer_id in dict.fromkeys(reviewers)
+            if reviewer_id not in made and reviewer_id != expense.employee_id
+        )
+    ApprovalInboxItem.objects.bulk_create(items, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(items)
+
+
+def _managers_by_employee(employee_ids, manager_ids=None):
+    links = get_user_model().managers.through.objects.filter(from_customuser_id__in=employee_ids)
+    if manager_ids is not None:
+        links = links.filter(to_customuser_id__in=manager_ids)
+    managers = {}
+    for employee_id, manager_id in links.values_list('from_customuser_id', 'to_customuser_id'):
+        managers.setdefault(employee_id, []).append(manager_id)
+    return managers
+
+
+def add_expenses(expenses):
+    """
+    Puts newly submitted pending expenses into their managers' inboxes.
+    """
+    expenses = [expense for expense in expenses if expense.status == 'PENDING']
+    if not expenses:
+        return 0
+    managers = _managers_by_employee({expense.employee_id for expense in expenses})
+    return _create_items(expenses, managers)
+
+
+def add_assignments(employee_ids, manager_ids):
+    """
+    Adds the pending expenses of `employee_ids` to the inboxes of
+    `manager_ids` after those managers were assigned to them (all their
+    managers when `manager_ids` is None), and to those of their rule's
+    designated approvers.
+    """
+    managers = _managers_by_employee(employee_ids, manager_ids)
+    return _add_pending(Expense.objects.filter(employee_id__in=employee_ids, status='PENDING'), managers)
+
+
+def _add_pending(expenses, managers):
+    pending = expenses.only('id', 'employee_id', 'created_at').order_by('pk')
+    created = 0
+    batch = []
+    for expense in pending.iterator(chunk_size=BATCH_SIZE):
+        batch.append(expense)
+        if len(batch) >= BATCH_SIZE:
+            created += _create_items(batch, managers)
+            batch = []
+    if batch:
+        created += _create_items(batch, managers)
+    return created
+
+
+def remove_assignments(employee_ids=None, manager_ids=None):
+    """
+    Drops inbox rows after manager assignments were removed. Either side
+    may be None to mean "all" (e.g. when an assignment set is cleared).
+    Rows of removed managers who are also their rule's designated approver
+    are put back.
+    """
+    items = ApprovalInboxItem.objects.all()
+    if employee_ids is not None:
+        items = items.filter(expense__employee_id__in=employee_ids)
+    if manager_ids is not None:
+        items = items.filter(manager_id__in=manager_ids)
+    affected = set(items.values_list('expense__employee_id', flat=True))
+    removed = items.delete()[0]
+    designated = [
+        employee_id for employee_id, company_id in _company_ids(affected).items()
+        if rules.get_evaluator(company_id).needs_decisions
+    ]
+    if designated:
+        add_assignments(designated, [])
+    return removed
+
+
+def remove_review(manager_id, expense_id):
+    """
+    Takes an expense out of a manager's inbox once they reviewed it.
+    """
+    ApprovalInboxItem.objects.filter(manager_id=manager_id, expense_id=expense_id).delete()
+
+
+def add_next_reviewers(expense_ids):
+    """
+    Hands pending expenses under a sequential rule to their next step's
+    approver after a review.
+    """
+    expenses = list(
+        Expense.objects.filter(pk__in=expense_ids, status='PENDING')
+        .values_list('pk', 'employee__company_id', named=True)
+    )
+    ordered = [expense.pk for expense in expenses if rules.get_evaluator(expense.employee__company_id).ordered]
+    if not ordered:
+        return 0
+    return _add_pending(Expense.objects.filter(pk__in=ordered), {})
+
+
+def close_expenses(expense_ids):
+    """
+    Removes expenses that are no longer pending from every inbox.
+    """
+    ApprovalInboxItem.objects.filter(expense_id__in=expense_ids).delete()
+
+
+@transaction.atomic
+def rebuild(company_id=None):
+    """
+    Recomputes the inbox (of one company's expenses, or all of it) from
+    expenses, approvals, manager assignments and approval rules. Returns
+    the number of rows created.
+    """
+    items = ApprovalInboxItem.objects.all()
+    pending = Expense.objects.filter(status='PENDING')
+    if company_id is not None:
+        items = items.filter(expense__employee__company_id=company_id)
+        pending = pending.filter(employee__company_id=company_id)
+    items.delete()
+    return add_assignments(pending.values('employee_id'), None)
@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from approvals import rules
+from approvals.models import ApprovalRule
+
+
+def _synthetic_expenses(count, approvers, rng):
+    """
+    Returns (approved, rejected, required, decisions) tuples for `count`
+    expenses, each reviewed by a random subset of `approvers` managers
+    (ids 1..approvers).
+    """
+    expenses = []
+    for _ in range(count):
+        decisions = {}
+        for manager_id in range(1, approvers + 1):
+            roll = rng.random()
+            if roll < 0.55:
+                decisions[manager_id] = rules.APPROVED
+            elif roll < 0.75:
+                decisions[manager_id] = rules.REJECTED
+        approved = sum(1 for decision in decisions.values() if decision == rules.APPROVED)
+        expenses.append((approved, len(decisions) - approved, approvers, decisions))
+    return expenses
+
+
+class Command(BaseCommand):
+    help = ('Measures approval rule evaluation throughput for every rule type on synthetic '
+            'expenses and approval sets, entirely in memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=200000, help='Number of synthetic expenses.')
+        parser.add_argument('--approvers', type=int, default=8, help='Managers per expense.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes; the fastest is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        approvers = max(1, options['approvers'])
+        expenses = _synthetic_expenses(options['expenses'], approvers, random.Random(options['seed']))
+        self.stdout.write(f"{len(expenses)} expenses, {approvers} approvers each, "
+                          f"{sum(len(e[3]) for e in expenses)} approvals in total\n")
+
+        steps = list(range(1, min(approvers, 3) + 1))
+        definitions = [
+            (ApprovalRule.RuleType.PERCENTAGE, 60, None, ()),
+            (ApprovalRule.RuleType.SPECIFIC, 60, 1, ()),
+            (ApprovalRule.RuleType.HYBRID, 60, 1, ()),
+            (ApprovalRule.RuleType.SEQUENTIAL, 60, None, steps),
+        ]
+
+        self.stdout.write(f"{'rule':12} {'evals/s':>12} {'ns/eval':>9}   approved/rejected/pending")
+        for definition in definitions:
+            evaluator = rules.compile_rule(*definition)
+            evaluate = evaluator.evaluate
+            best = None
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                statuses = [evaluate(*expense) for expense in expenses]
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            shares = '/'.join(
+                f"{100 * statuses.count(status) / len(statuses):.0f}%"
+                for status in (rules.APPROVED, rules.REJECTED, rules.PENDING)
+            )
+            self.stdout.write(
+                f"{definition[0]:12} {len(expenses) / best:12.0f} {best / len(expenses) * 1e9:9.0f}   {shares}"
+            )
+
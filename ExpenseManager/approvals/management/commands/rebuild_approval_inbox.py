@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from approvals import inbox
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the materialized approval inbox from pending expenses, reviews and '
+            'manager assignments, e.g. after data was changed without signals.')
+
+    def handle(self, *args, **options):
+        created = inbox.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Approval inbox rebuilt with {created} item(s)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import CustomUser
+from approvals import approval_service
+
+
+class Command(BaseCommand):
+    help = ('Recomputes required approvals, review tallies and status of pending expenses '
+            'from the current manager assignments, approvals and approval rules.')
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help='Only recompute expenses of this employee (repeatable).')
+        target.add_argument('--company', type=int, help='Only recompute expenses of this company id.')
+
+    def handle(self, *args, **options):
+        employee_ids = None
+        if options['users']:
+            users = CustomUser.objects.filter(username__in=options['users'])
+            employee_ids = list(users.values_list('pk', flat=True))
+            if len(employee_ids) != len(set(options['users'])):
+                found = set(users.values_list('username', flat=True))
+                missing = ', '.join(sorted(set(options['users']) - found))
+                raise CommandError(f"Unknown user(s): {missing}")
+        elif options['company'] is not None:
+            employee_ids = CustomUser.objects.filter(company_id=options['company']).values('pk')
+
+        changed = approval_service.recompute_pending(employee_ids)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed pending expenses; {changed} changed status."))
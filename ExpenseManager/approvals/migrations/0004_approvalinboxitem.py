@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    Approval = apps.get_model('approvals', 'Approval')
+    ApprovalInboxItem = apps.get_model('approvals', 'ApprovalInboxItem')
+    ManagerLink = apps.get_model('accounts', 'CustomUser').managers.through
+
+    managers = {}
+    for employee_id, manager_id in ManagerLink.objects.values_list('from_customuser_id', 'to_customuser_id'):
+        managers.setdefault(employee_id, []).append(manager_id)
+    reviewed = set(
+        Approval.objects.filter(expense__status='PENDING').values_list('manager_id', 'expense_id')
+    )
+    pending = Expense.objects.filter(status='PENDING').values_list('id', 'employee_id', 'created_at')
+    ApprovalInboxItem.objects.bulk_create(
+        (
+            ApprovalInboxItem(manager_id=manager_id, expense_id=expense_id, submitted_at=created_at)
+            for expense_id, employee_id, created_at in pending.iterator(chunk_size=2000)
+            for manager_id in managers.get(employee_id, ())
+            if (manager_id, expense_id) not in reviewed
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvals', '0003_alter_approval_decision'),
+        ('expenses', '0005_expense_approval_tallies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalInboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitted_at', models.DateTimeField()),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_items', to='expenses.expense')),
+                ('manager', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['manager', 'submitted_at', 'expense'], name='inbox_manager_submitted_idx')],
+                'constraints': [models.UniqueConstraint(fields=('manager', 'expense'), name='unique_inbox_item')],
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_company_options_alter_customuser_options_and_more'),
+        ('approvals', '0004_approvalinboxitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule_type', models.CharField(choices=[('PERCENTAGE', 'Percentage of approvers'), ('SPECIFIC', 'Specific approver'), ('HYBRID', 'Percentage or specific approver'), ('SEQUENTIAL', 'Sequential approvers')], default='PERCENTAGE', max_length=10)),
+                ('percentage', models.PositiveSmallIntegerField(default=60, help_text='Share of approvers (in %) needed to approve. The expense is rejected once this share can no longer be reached.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='approval_rule', to='accounts.company')),
+                ('specific_approver', models.ForeignKey(blank=True, help_text='Approver whose decision is final (specific and hybrid rules).', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ApprovalRuleStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveSmallIntegerField()),
+                ('approver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='approvals.approvalrule')),
+            ],
+            options={
+                'ordering': ['order'],
+                'constraints': [models.UniqueConstraint(fields=('rule', 'order'), name='unique_rule_step_order')],
+            },
+        ),
+    ]
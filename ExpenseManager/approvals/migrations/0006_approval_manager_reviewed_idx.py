@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvals', '0005_approvalrule'),
+        ('expenses', '0005_expense_approval_tallies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(fields=['manager', '-reviewed_at'], name='approval_manager_reviewed_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from accounts.models import Company
 from expenses.models import Expense
 
 class Approval(models.Model):
@@ -17,6 +19,90 @@ class Approval(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['expense', 'manager'], name='unique_manager_review')
         ]
+        indexes = [
+            models.Index(fields=['manager', '-reviewed_at'], name='approval_manager_reviewed_idx'),
+        ]
+
+    def __str__(self):
+        return f"Review of {self.expense} by {self.manager.username} - {self.get_decision_display()}"
+
+class ApprovalInboxItem(models.Model):
+    """
+    One pending expense waiting for one manager's review. Rows are kept in
+    step by approvals.inbox so the approval queue is a range scan over
+    (manager, submitted_at) instead of a query over the whole team.
+    """
+    manager = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inbox_items')
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='inbox_items')
+    submitted_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['manager', 'expense'], name='unique_inbox_item')
+        ]
+        indexes = [
+            models.Index(fields=['manager', 'submitted_at', 'expense'], name='inbox_manager_submitted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.expense} awaiting {self.manager.username}"
+
+
+
+class ApprovalRule(models.Model):
+    """
+    How a company turns its managers' reviews into an expense status.
+    Companies without a rule use the 60% percentage rule. Rules are
+    compiled and cached by approvals.rules.
+    """
+    class RuleType(models.TextChoices):
+        PERCENTAGE = 'PERCENTAGE', 'Percentage of approvers'
+        SPECIFIC = 'SPECIFIC', 'Specific approver'
+        HYBRID = 'HYBRID', 'Percentage or specific approver'
+        SEQUENTIAL = 'SEQUENTIAL', 'Sequential approvers'
+
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name='approval_rule')
+    rule_type = models.CharField(max_length=10, choices=RuleType.choices, default=RuleType.PERCENTAGE)
+    percentage = models.PositiveSmallIntegerField(
+        default=60,
+        help_text='Share of approvers (in %) needed to approve. The expense is rejected '
+                  'once this share can no longer be reached.',
+    )
+    specific_approver = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text='Approver whose decision is final (specific and hybrid rules).',
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def clean(self):
+        if not 1 <= self.percentage <= 100:
+            raise ValidationError({'percentage': 'Enter a percentage between 1 and 100.'})
+        if self.rule_type in (self.RuleType.SPECIFIC, self.RuleType.HYBRID) and not self.specific_approver_id:
+            raise ValidationError({'specific_approver': 'This rule type needs a specific approver.'})
+        if self.specific_approver_id and self.specific_approver.company_id != self.company_id:
+            raise ValidationError({'specific_approver': 'The approver must belong to the same company.'})
+
+    def __str__(self):
+        return f"{self.company} - {self.get_rule_type_display()}"
+
+
+class ApprovalRuleStep(models.Model):
+    """
+    One approver in a sequential rule. Steps are decided in `order`.
+    """
+    rule = models.ForeignKey(ApprovalRule, on_delete=models.CASCADE, related_name='steps')
+    order = models.PositiveSmallIntegerField()
+    approver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        ordering = ['order']
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'order'], name='unique_rule_step_order')
+        ]
+
+    def clean(self):
+        if self.approver_id and self.rule_id and self.approver.company_id != self.rule.company_id:
+            raise ValidationError({'approver': 'The approver must belong to the same company.'})
 
     def __str__(self):
-        return f"Review of {self.expense} by {self.manager.username} - {self.get_decision_display()}"
\ No newline at end of file
+        return f"Step {self.order}: {self.approver.username}"
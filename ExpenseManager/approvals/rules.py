@@ -0,0 +1,196 @@
+"""
+Approval rule engine.
+
+A company's ApprovalRule is compiled once into a small evaluator object and
+cached in-process per company, so deciding an expense's status is an
+in-memory check over its tallies (and, for rules that look at who decided,
+its approvals). Evaluators also say who should be reviewing an expense now
+(reviewers()), which is what approvals.inbox puts in inboxes, and whether a
+review is accepted at this point (accepts_review()). approvals.signals
+invalidates the cache when rules change; APPROVAL_RULE_CACHE_TTL bounds how
+long other processes keep a stale rule.
+"""
+import time
+
+from django.conf import settings
+
+from .models import Approval, ApprovalRule
+
+APPROVED = Approval.Decision.APPROVED
+REJECTED = Approval.Decision.REJECTED
+PENDING = 'PENDING'
+
+CACHE_TTL = getattr(settings, 'APPROVAL_RULE_CACHE_TTL', 300)
+
+
+class PercentageRule:
+    """
+    Approved once `percentage` % of the required approvers approved;
+    rejected once so many rejected that the percentage cannot be reached.
+    An expense with no required approvers (the employee has no managers)
+    stays pending until someone is assigned to review it.
+    """
+    needs_decisions = False
+    ordered = False
+
+    def __init__(self, percentage):
+        self.percentage = percentage
+
+    def reviewers(self, manager_ids, decisions):
+        return list(manager_ids)
+
+    def accepts_review(self, reviewer_id, decisions):
+        return True
+
+    def evaluate(self, approved_count, rejected_count, required_approvals, decisions=None):
+        if required_approvals == 0:
+            return PENDING
+        if approved_count * 100 >= self.percentage * required_approvals:
+            return APPROVED
+        if rejected_count * 100 > (100 - self.percentage) * required_approvals:
+            return REJECTED
+        return PENDING
+
+
+class SpecificApproverRule:
+    """
+    The specific approver's decision is final; other reviews do not count.
+    """
+    needs_decisions = True
+    ordered = False
+
+    def __init__(self, approver_id):
+        self.approver_id = approver_id
+
+    def reviewers(self, manager_ids, decisions):
+        return [self.approver_id]
+
+    def accepts_review(self, reviewer_id, decisions):
+        return True
+
+    def evaluate(self, approved_count, rejected_count, required_approvals, decisions=None):
+        return decisions.get(self.approver_id, PENDING)
+
+
+class HybridRule:
+    """
+    The specific approver's decision is final; until they decide, the
+    percentage rule applies.
+    """
+    needs_decisions = True
+    ordered = False
+
+    def __init__(self, percentage, approver_id):
+        self.percentage_rule = PercentageRule(percentage)
+        self.approver_id = approver_id
+
+    def reviewers(self, manager_ids, decisions):
+        return [*manager_ids, self.approver_id]
+
+    def accepts_review(self, reviewer_id, decisions):
+        return True
+
+    def evaluate(self, approved_count, rejected_count, required_approvals, decisions=None):
+        decision = decisions.get(self.approver_id)
+        if decision is not None:
+            return decision
+        return self.percentage_rule.evaluate(approved_count, rejected_count, required_approvals)
+
+
+class SequentialRule:
+    """
+    Every step's approver has to approve, in order; a rejection at any
+    step rejects the expense. Only the approver of the first step without
+    a decision may review, so later steps never decide ahead of earlier
+    ones.
+    """
+    needs_decisions = True
+    ordered = True
+
+    def __init__(self, approver_ids):
+        self.approver_ids = tuple(approver_ids)
+
+    def current_approver(self, decisions):
+        for approver_id in self.approver_ids:
+            decision = decisions.get(approver_id)
+            if decision is None:
+                return approver_id
+            if decision != APPROVED:
+                return None
+        return None
+
+    def reviewers(self, manager_ids, decisions):
+        approver_id = self.current_approver(decisions)
+        return [] if approver_id is None else [approver_id]
+
+    def accepts_review(self, reviewer_id, decisions):
+        return reviewer_id == self.current_approver(decisions)
+
+    def evaluate(self, approved_count, rejected_count, required_approvals, decisions=None):
+        for approver_id in self.approver_ids:
+            decision = decisions.get(approver_id)
+            if decision != APPROVED:
+                return REJECTED if decision == REJECTED else PENDING
+        return APPROVED
+
+
+DEFAULT_RULE = PercentageRule(60)
+
+
+def compile_rule(rule_type, percentage=60, specific_approver_id=None, step_approver_ids=()):
+    """
+    Builds the evaluator for a rule definition. Incomplete definitions
+    (no approver, no steps) fall back to the percentage rule.
+    """
+    Type = ApprovalRule.RuleType
+    if rule_type == Type.SPECIFIC and specific_approver_id:
+        return SpecificApproverRule(specific_approver_id)
+    if rule_type == Type.HYBRID and specific_approver_id:
+        return HybridRule(percentage, specific_approver_id)
+    if rule_type == Type.SEQUENTIAL and step_approver_ids:
+        return SequentialRule(step_approver_ids)
+    return PercentageRule(percentage)
+
+
+def load_evaluator(company_id):
+    """
+    Reads and compiles a company's rule, bypassing the cache.
+    """
+    rule = ApprovalRule.objects.filter(company_id=company_id).prefetch_related('steps').first()
+    if rule is None:
+        return DEFAULT_RULE
+    return compile_rule(
+        rule.rule_type,
+        rule.percentage,
+        rule.specific_approver_id,
+        [step.approver_id for step in rule.steps.all()],
+    )
+
+
+# company id -> (expiry on the monotonic clock, evaluator)
+_evaluators = {}
+
+
+def get_evaluator(company_id):
+    """
+    Returns the compiled rule for a company, from the cache when possible.
+    """
+    if company_id is None:
+        return DEFAULT_RULE
+    now = time.monotonic()
+    cached = _evaluators.get(company_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    evaluator = load_evaluator(company_id)
+    _evaluators[company_id] = (now + CACHE_TTL, evaluator)
+    return evaluator
+
+
+def invalidate(company_id=None):
+    """
+    Drops a company's compiled rule, or every cached rule.
+    """
+    if company_id is None:
+        _evaluators.clear()
+    else:
+        _evaluators.pop(company_id, None)
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from expenses.models import Expense
+from . import approval_service, inbox, rules
+from .models import Approval, ApprovalRule, ApprovalRuleStep
+
+
+@receiver(post_save, sender=Expense)
+def update_inbox_for_expense(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        inbox.add_expenses([instance])
+    elif instance.status != 'PENDING' and (update_fields is None or 'status' in update_fields):
+        inbox.close_expenses([instance.pk])
+
+
+@receiver(post_save, sender=Approval)
+def remove_reviewed_expense(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        inbox.remove_review(instance.manager_id, instance.expense_id)
+
+
+def _rebuild_inbox_on_commit(company_id):
+    # Who reviews depends on the rule; rebuilt once the rule and its steps
+    # are all saved.
+    transaction.on_commit(lambda: inbox.rebuild(company_id))
+
+
+@receiver([post_save, post_delete], sender=ApprovalRule)
+def invalidate_company_rule(sender, instance, **kwargs):
+    rules.invalidate(instance.company_id)
+    _rebuild_inbox_on_commit(instance.company_id)
+
+
+@receiver([post_save, post_delete], sender=ApprovalRuleStep)
+def invalidate_rules_for_step(sender, instance, **kwargs):
+    # The step's rule may already be deleted (cascade), so drop every
+    # cached rule rather than looking up its company.
+    rules.invalidate()
+    company_id = ApprovalRule.objects.filter(pk=instance.rule_id).values_list('company_id', flat=True).first()
+    if company_id is not None:
+        _rebuild_inbox_on_commit(company_id)
+
+
+def update_inbox_for_assignments(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keeps inboxes in step with CustomUser.managers, changed from either
+    side (user.managers or manager.subordinates).
+    """
+    if action == 'post_add':
+        if reverse:
+            inbox.add_assignments(pk_set, [instance.pk])
+        else:
+            inbox.add_assignments([instance.pk], pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            inbox.remove_assignments(employee_ids=pk_set, manager_ids=[instance.pk])
+        else:
+            inbox.remove_assignments(employee_ids=[instance.pk], manager_ids=pk_set)
+    elif action == 'pre_clear':
+        # post_clear does not say which rows were removed.
+        if reverse:
+            inbox.remove_assignments(manager_ids=[instance.pk])
+        else:
+            inbox.remove_assignments(employee_ids=[instance.pk])
+
+
+def recompute_for_assignments(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Recomputes pending expenses of employees whose managers changed, since
+    their required approver count changed with them. Demotions go through
+    here too: CustomUser.save clears the demoted user's subordinates.
+    """
+    if action == 'pre_clear' and reverse:
+        # Remember who loses this manager; post_clear has no pk_set.
+        instance._cleared_subordinate_ids = list(instance.subordinates.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        approval_service.recompute_pending(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        if reverse:
+            approval_service.recompute_pending(instance.__dict__.pop('_cleared_subordinate_ids', []))
+        else:
+            approval_service.recompute_pending([instance.pk])
+
+
+def connect_assignment_signals(user_model):
+    # Connection order matters: the inbox is updated before the recompute
+    # closes expenses that no longer need reviews.
+    m2m_changed.connect(
+        update_inbox_for_assignments,
+        sender=user_model.managers.through,
+        dispatch_uid='approvals.update_inbox_for_assignments',
+    )
+    m2m_changed.connect(
+        recompute_for_assignments,
+        sender=user_model.managers.through,
+        dispatch_uid='approvals.recompute_for_assignments',
+    )
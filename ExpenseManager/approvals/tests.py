@@ -1,3 +1,324 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Company, CustomUser
+from accounts.testing import make_user
+from expenses.models import Expense, ExpenseCategory
+from . import approval_service, rules, views
+from .models import Approval, ApprovalInboxItem, ApprovalRule, ApprovalRuleStep
+
+
+def submit(employee, amount='10.00', category=None):
+    return Expense.objects.create(
+        employee=employee,
+        category=category or ExpenseCategory.objects.get_or_create(name='Travel')[0],
+        amount=Decimal(amount),
+        currency='USD',
+        date=date(2026, 1, 15),
+        required_approvals=approval_service.required_approvals_for(employee),
+    )
+
+
+class RecomputePendingTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.admin = make_user('admin', self.company, CustomUser.Role.ADMIN)
+        self.manager = make_user('manager', self.company, CustomUser.Role.MANAGER)
+        self.other_manager = make_user('other', self.company, CustomUser.Role.MANAGER)
+        self.employee = make_user('employee', self.company, managers=[self.manager])
+
+    def test_removing_last_manager_leaves_expenses_pending(self):
+        expense = submit(self.employee)
+        self.employee.managers.remove(self.manager)
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'PENDING')
+        self.assertEqual(expense.required_approvals, 0)
+
+    def test_demoting_sole_manager_leaves_expenses_pending(self):
+        expense = submit(self.employee)
+        self.manager.role = CustomUser.Role.EMPLOYEE
+        self.manager.save()
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'PENDING')
+
+    def test_command_without_arguments_does_not_approve_managerless_expenses(self):
+        managerless = submit(self.admin)
+        expense = submit(self.employee)
+        call_command('recompute_expense_status', stdout=open('/dev/null', 'w'))
+        managerless.refresh_from_db()
+        expense.refresh_from_db()
+        self.assertEqual(managerless.status, 'PENDING')
+        self.assertEqual(expense.status, 'PENDING')
+
+    def test_reviews_of_unassigned_managers_no_longer_count(self):
+        self.employee.managers.add(self.other_manager)
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.other_manager, Approval.Decision.APPROVED)
+        self.assertEqual((expense.approved_count, expense.status), (1, 'PENDING'))
+        self.employee.managers.remove(self.other_manager)
+        expense.refresh_from_db()
+        self.assertEqual((expense.required_approvals, expense.approved_count), (1, 0))
+        self.assertEqual(expense.status, 'PENDING')
+
+    def test_adding_manager_recomputes_required_approvals(self):
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.manager, Approval.Decision.APPROVED)
+        self.assertEqual(expense.status, 'APPROVED')
+        pending = submit(self.employee)
+        self.employee.managers.add(self.other_manager)
+        pending.refresh_from_db()
+        self.assertEqual(pending.required_approvals, 2)
+
+    def test_review_by_non_manager_is_not_counted(self):
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.other_manager, Approval.Decision.APPROVED)
+        expense.refresh_from_db()
+        self.assertEqual((expense.approved_count, expense.status), (0, 'PENDING'))
+
+
+class ApprovalRuleTests(TestCase):
+    def setUp(self):
+        # Compiled rules are cached per company id, which rolled back tests reuse.
+        self.addCleanup(rules.invalidate)
+        self.company = Company.objects.create(name='Acme')
+        self.manager = make_user('manager', self.company, CustomUser.Role.MANAGER)
+        self.cfo = make_user('cfo', self.company, CustomUser.Role.MANAGER)
+        self.ceo = make_user('ceo', self.company, CustomUser.Role.ADMIN)
+        self.employee = make_user('employee', self.company, managers=[self.manager])
+
+    def inbox(self, user):
+        return set(user.inbox_items.values_list('expense_id', flat=True))
+
+    def test_percentage_rule(self):
+        rule = rules.PercentageRule(60)
+        self.assertEqual(rule.evaluate(2, 0, 3), 'APPROVED')
+        self.assertEqual(rule.evaluate(1, 0, 3), 'PENDING')
+        self.assertEqual(rule.evaluate(0, 2, 3), 'REJECTED')
+        self.assertEqual(rule.evaluate(0, 0, 0), 'PENDING')
+
+    def test_hybrid_rule_specific_decision_is_final(self):
+        rule = rules.HybridRule(60, approver_id=7)
+        self.assertEqual(rule.evaluate(0, 2, 3, {7: 'APPROVED'}), 'APPROVED')
+        self.assertEqual(rule.evaluate(2, 0, 3, {}), 'APPROVED')
+
+    def test_specific_approver_who_is_not_a_manager_gets_the_expense(self):
+        ApprovalRule.objects.create(
+            company=self.company, rule_type=ApprovalRule.RuleType.SPECIFIC, specific_approver=self.cfo
+        )
+        expense = submit(self.employee)
+        self.assertEqual(self.inbox(self.cfo), {expense.pk})
+        self.assertEqual(self.inbox(self.manager), set())
+
+        reviewed = approval_service.record_bulk_decision(self.cfo, [expense.pk], Approval.Decision.APPROVED)
+        self.assertEqual(reviewed, [expense.pk])
+        expense.refresh_from_db()
+        self.assertEqual(expense.status, 'APPROVED')
+
+    def test_sequential_rule_is_reviewed_in_order(self):
+        rule = ApprovalRule.objects.create(company=self.company, rule_type=ApprovalRule.RuleType.SEQUENTIAL)
+        ApprovalRuleStep.objects.create(rule=rule, order=1, approver=self.cfo)
+        ApprovalRuleStep.objects.create(rule=rule, order=2, approver=self.ceo)
+        expense = submit(self.employee)
+        self.assertEqual((self.inbox(self.cfo), self.inbox(self.ceo)), ({expense.pk}, set()))
+
+        with self.assertRaises(ValidationError):
+            approval_service.record_decision(expense, self.ceo, Approval.Decision.APPROVED)
+        approval_service.record_decision(expense, self.cfo, Approval.Decision.APPROVED)
+        self.assertEqual(expense.status, 'PENDING')
+        self.assertEqual((self.inbox(self.cfo), self.inbox(self.ceo)), (set(), {expense.pk}))
+
+        approval_service.record_decision(expense, self.ceo, Approval.Decision.APPROVED)
+        self.assertEqual(expense.status, 'APPROVED')
+        self.assertFalse(ApprovalInboxItem.objects.exists())
+
+    def test_rule_change_rebuilds_company_inbox(self):
+        expense = submit(self.employee)
+        with self.captureOnCommitCallbacks(execute=True):
+            ApprovalRule.objects.create(
+                company=self.company, rule_type=ApprovalRule.RuleType.HYBRID, specific_approver=self.cfo
+            )
+        self.assertEqual(self.inbox(self.manager), {expense.pk})
+        self.assertEqual(self.inbox(self.cfo), {expense.pk})
+
+    def test_specific_approver_must_belong_to_the_company(self):
+        outsider = make_user('outsider', Company.objects.create(name='Other'), CustomUser.Role.MANAGER)
+        rule = ApprovalRule(company=self.company, rule_type=ApprovalRule.RuleType.SPECIFIC, specific_approver=outsider)
+        with self.assertRaises(ValidationError):
+            rule.full_clean()
+
+
+class ApprovalInboxViewTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.manager = make_user('manager', self.company, CustomUser.Role.MANAGER)
+        employee = make_user('employee', self.company, managers=[self.manager])
+        self.expenses = [submit(employee) for _ in range(5)]
+        self.client.force_login(self.manager)
+
+    def get(self, cursor=None):
+        response = self.client.get(reverse('expense_approvals'), {'cursor': cursor} if cursor else {})
+        return response.context['page'], [expense.pk for expense in response.context['expenses']]
+
+    @mock.patch.object(views, 'INBOX_PAGE_SIZE', 2)
+    def test_keyset_pages_walk_the_inbox_oldest_first(self):
+        seen, pages, cursor = [], [], None
+        while True:
+            page, ids = self.get(cursor)
+            seen += ids
+            pages.append((page, ids))
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [expense.pk for expense in self.expenses])
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(pages[0][0].has_previous)
+
+        page, ids = self.get(pages[2][0].previous_cursor)
+        self.assertEqual(ids, pages[1][1])
+
+
+class ApprovalTallyTests(TestCase):
+    def setUp(self):
+        self.addCleanup(rules.invalidate)
+        self.company = Company.objects.create(name='Acme')
+        self.managers = [make_user(f'manager{i}', self.company, CustomUser.Role.MANAGER) for i in range(3)]
+        self.employee = make_user('employee', self.company, managers=self.managers)
+
+    def tallies(self, expense):
+        expense.refresh_from_db()
+        return expense.approved_count, expense.rejected_count, expense.required_approvals, expense.status
+
+    def test_counters_follow_the_reviews(self):
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.managers[0], Approval.Decision.APPROVED)
+        self.assertEqual(self.tallies(expense), (1, 0, 3, 'PENDING'))
+        approval_service.record_decision(expense, self.managers[1], Approval.Decision.APPROVED)
+        self.assertEqual(self.tallies(expense), (2, 0, 3, 'APPROVED'))
+
+        rejected = submit(self.employee)
+        approval_service.record_decision(rejected, self.managers[0], Approval.Decision.REJECTED)
+        approval_service.record_decision(rejected, self.managers[1], Approval.Decision.REJECTED)
+        self.assertEqual(self.tallies(rejected), (0, 2, 3, 'REJECTED'))
+
+    def test_repeated_review_is_refused_and_not_counted(self):
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.managers[0], Approval.Decision.APPROVED)
+        with self.assertRaises(IntegrityError):
+            approval_service.record_decision(expense, self.managers[0], Approval.Decision.APPROVED)
+        self.assertEqual(self.tallies(expense), (1, 0, 3, 'PENDING'))
+
+    def test_recompute_restores_counters_from_the_reviews(self):
+        expense = submit(self.employee)
+        approval_service.record_decision(expense, self.managers[0], Approval.Decision.APPROVED)
+        approval_service.record_decision(expense, self.managers[1], Approval.Decision.REJECTED)
+        Expense.objects.filter(pk=expense.pk).update(approved_count=0, rejected_count=5, required_approvals=9)
+        approval_service.recompute_pending([self.employee.pk])
+        self.assertEqual(self.tallies(expense), (1, 1, 3, 'PENDING'))
+
+
+class BulkReviewTests(TestCase):
+    def setUp(self):
+        self.addCleanup(rules.invalidate)
+        self.company = Company.objects.create(name='Acme')
+        self.manager = make_user('manager', self.company, CustomUser.Role.MANAGER)
+        self.other_manager = make_user('other', self.company, CustomUser.Role.MANAGER)
+        self.employee = make_user('employee', self.company, managers=[self.manager])
+        self.client.force_login(self.manager)
+
+    def test_only_expenses_awaiting_the_manager_are_reviewed(self):
+        waiting = [submit(self.employee) for _ in range(2)]
+        reviewed = submit(self.employee)
+        approval_service.record_decision(reviewed, self.manager, Approval.Decision.REJECTED)
+        foreign = submit(make_user('outsider', self.company, managers=[self.other_manager]))
+
+        response = self.client.post(reverse('bulk_review_expenses'), {
+            'decision': Approval.Decision.APPROVED,
+            'comments': 'Fine',
+            'expense_ids': [expense.pk for expense in (*waiting, reviewed, foreign)],
+        }, follow=True)
+
+        self.assertRedirects(response, reverse('expense_approvals'))
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['2 expense(s) marked as approved.',
+             '2 expense(s) were skipped because they no longer await your review.'],
+        )
+        self.assertEqual(
+            set(Approval.objects.filter(manager=self.manager, comments='Fine').values_list('expense_id', flat=True)),
+            {expense.pk for expense in waiting},
+        )
+        self.assertEqual(set(Expense.objects.filter(pk__in=[e.pk for e in waiting]).values_list('status', flat=True)),
+                         {'APPROVED'})
+        foreign.refresh_from_db()
+        self.assertEqual((foreign.status, foreign.approved_count), ('PENDING', 0))
+
+    def test_query_count_does_not_grow_with_the_selection(self):
+        def count_queries(size):
+            ids = [submit(self.employee).pk for _ in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                approval_service.record_bulk_decision(self.manager, ids, Approval.Decision.APPROVED)
+            return len(queries)
+
+        # The first run also compiles the rule and creates the APPROVED rollup row.
+        count_queries(1)
+        self.assertEqual(count_queries(2), count_queries(8))
+
+    def test_employees_cannot_bulk_review(self):
+        expense = submit(self.employee)
+        self.client.force_login(self.employee)
+        self.client.post(reverse('bulk_review_expenses'), {
+            'decision': Approval.Decision.APPROVED, 'expense_ids': [expense.pk],
+        })
+        self.assertFalse(Approval.objects.exists())
+
+
+class ApprovalHistoryViewTests(TestCase):
+    def setUp(self):
+        self.addCleanup(rules.invalidate)
+        company = Company.objects.create(name='Acme')
+        self.manager = make_user('manager', company, CustomUser.Role.MANAGER)
+        self.other_manager = make_user('other', company, CustomUser.Role.MANAGER)
+        self.employee = make_user('employee', company, managers=[self.manager, self.other_manager])
+        self.client.force_login(self.manager)
+
+    def review(self, count, decision=Approval.Decision.APPROVED):
+        expenses = [submit(self.employee) for _ in range(count)]
+        for expense in expenses:
+            approval_service.record_decision(expense, self.manager, decision)
+            approval_service.record_decision(expense, self.other_manager, Approval.Decision.REJECTED)
+        return expenses
+
+    def get(self, cursor=None):
+        response = self.client.get(reverse('approval_history'), {'cursor': cursor} if cursor else {})
+        return response.context['page'], list(response.context['expenses'])
+
+    def test_query_count_does_not_depend_on_page_length(self):
+        self.review(2)
+        self.get()  # Caches the session user.
+        with CaptureQueriesContext(connection) as short_page:
+            self.get()
+        self.review(6)
+        with CaptureQueriesContext(connection) as long_page:
+            self.get()
+        self.assertEqual(len(short_page), len(long_page))
 
-# Create your tests here.
+    @mock.patch.object(views, 'HISTORY_PAGE_SIZE', 2)
+    def test_keyset_pages_list_own_reviews_newest_first(self):
+        expenses = self.review(3) + self.review(2, Approval.Decision.REJECTED)
+        seen, cursor = [], None
+        while True:
+            page, rows = self.get(cursor)
+            seen += [(expense.pk, expense.my_decision_display) for expense in rows]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        labels = ['Approved'] * 3 + ['Rejected'] * 2
+        self.assertEqual(seen, [(expense.pk, label) for expense, label in zip(expenses, labels)][::-1])
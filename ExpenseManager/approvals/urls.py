@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.ExpenseApprovalView.as_view(), name='expense_approvals'),
+    path('review/bulk/', views.BulkReviewExpensesView.as_view(), name='bulk_review_expenses'),
     path('review/<int:expense_id>/', views.ReviewExpenseView.as_view(), name='review_expense'),
     path('history/', views.ApprovalHistoryView.as_view(), name='approval_history'),
 ]
\ No newline at end of file
@@ -1,56 +1,68 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
+from django.db.models import F, FilteredRelation, Q
 from expenses.models import Expense
-from .models import Approval
-from .forms import ReviewForm
+from .forms import BulkReviewForm, ReviewForm
+from .models import Approval, ApprovalInboxItem
+from . import approval_service
 from accounts.models import CustomUser
+from accounts.pagination import paginate
 
+INBOX_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 50
 
-def _update_expense_status(expense):
-    """
-    Checks the current approvals for an expense and updates its status
-    based on the 60% approval / 40%+ rejection rule.
-    """
-    employee = expense.employee
-    total_managers = employee.managers.count()
-
-    if total_managers == 0:
-        expense.status = 'APPROVED'
-        expense.save()
-        return
 
-    approvals = expense.approvals.all()
-    approved_count = approvals.filter(decision=Approval.Decision.APPROVED).count()
-    rejected_count = approvals.filter(decision=Approval.Decision.REJECTED).count()
+class ExpenseApprovalView(LoginRequiredMixin, View):
+    def get(self, request):
+        if request.user.role not in [CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]:
+            return redirect('dashboard_redirect')
 
-    approval_percentage = (approved_count / total_managers) * 100
-    rejection_percentage = (rejected_count / total_managers) * 100
+        # Oldest first; keyset pages cost the same however deep they are
+        # (inbox_manager_submitted_idx covers the keys).
+        items = ApprovalInboxItem.objects.filter(manager=request.user).select_related('expense__employee')
+        page = paginate(
+            items, ('submitted_at', 'expense_id'), request.GET.get('cursor'),
+            per_page=INBOX_PAGE_SIZE, descending=False,
+        )
+        pending_expenses = [item.expense for item in page]
 
-    if approval_percentage >= 60:
-        expense.status = 'APPROVED'
-    elif rejection_percentage > 40:
-        expense.status = 'REJECTED'
-    else:
-        expense.status = 'PENDING'
+        return render(request, 'approvals/expense_approval_list.html', {
+            'expenses': pending_expenses,
+            'page': page,
+            'bulk_form': BulkReviewForm(),
+        })
 
-    expense.save()
 
-class ExpenseApprovalView(LoginRequiredMixin, View):
-    def get(self, request):
+class BulkReviewExpensesView(LoginRequiredMixin, View):
+    """
+    Applies one decision and comment to every expense ticked in the
+    approval queue.
+    """
+    def post(self, request):
         if request.user.role not in [CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]:
             return redirect('dashboard_redirect')
 
-        subordinates = request.user.subordinates.all()
+        form = BulkReviewForm(request.POST)
+        if not form.is_valid():
+            for errors in form.errors.values():
+                for error in errors:
+                    messages.error(request, error)
+            return redirect('expense_approvals')
 
-        pending_expenses = Expense.objects.filter(
-            employee__in=subordinates,
-            status='PENDING'
-        ).exclude(
-            approvals__manager=request.user
+        decision = form.cleaned_data['decision']
+        reviewed = approval_service.record_bulk_decision(
+            request.user, form.cleaned_data['expense_ids'], decision, form.cleaned_data['comments']
         )
-
-        return render(request, 'approvals/expense_approval_list.html', {'expenses': pending_expenses})
+        skipped = len(form.cleaned_data['expense_ids']) - len(reviewed)
+        messages.success(
+            request, f"{len(reviewed)} expense(s) marked as {decision.lower()}."
+        )
+        if skipped:
+            messages.warning(request, f"{skipped} expense(s) were skipped because they no longer await your review.")
+        return redirect('expense_approvals')
 
 
 class ApprovalHistoryView(LoginRequiredMixin, View):
@@ -58,9 +70,24 @@ class ApprovalHistoryView(LoginRequiredMixin, View):
         if request.user.role not in [CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]:
             return redirect('dashboard_redirect')
 
-        reviewed_expenses = Expense.objects.filter(approvals__manager=request.user).distinct()
+        # The manager's own review is joined once and its columns annotated,
+        # so the page needs no per-row queries.
+        reviewed_expenses = (
+            Expense.objects.annotate(
+                my_review=FilteredRelation('approvals', condition=Q(approvals__manager=request.user)),
+            )
+            .filter(my_review__isnull=False)
+            .annotate(my_decision=F('my_review__decision'), my_reviewed_at=F('my_review__reviewed_at'))
+            .select_related('employee')
+        )
+        page = paginate(
+            reviewed_expenses, ('my_reviewed_at', 'id'), request.GET.get('cursor'), per_page=HISTORY_PAGE_SIZE
+        )
+        decision_labels = dict(Approval.Decision.choices)
+        for expense in page:
+            expense.my_decision_display = decision_labels[expense.my_decision]
 
-        return render(request, 'approvals/approval_history.html', {'expenses': reviewed_expenses})
+        return render(request, 'approvals/approval_history.html', {'expenses': page, 'page': page})
 
 
 class ReviewExpenseView(LoginRequiredMixin, View):
@@ -70,18 +97,7 @@ class ReviewExpenseView(LoginRequiredMixin, View):
             return redirect('expense_approvals')
 
         form = ReviewForm()
-
-        # Calculate counts in the view
-        approved_count = expense.approvals.filter(decision='APPROVED').count()
-        rejected_count = expense.approvals.filter(decision='REJECTED').count()
-
-        context = {
-            'expense': expense,
-            'form': form,
-            'approved_count': approved_count,
-            'rejected_count': rejected_count,
-        }
-        return render(request, 'approvals/review_expense.html', context)
+        return render(request, 'approvals/review_expense.html', {'expense': expense, 'form': form})
 
     def post(self, request, expense_id):
         expense = get_object_or_404(Expense, id=expense_id)
@@ -91,25 +107,11 @@ class ReviewExpenseView(LoginRequiredMixin, View):
             decision = form.cleaned_data['decision']
             comments = form.cleaned_data['comments']
 
-            Approval.objects.create(
-                expense=expense,
-                manager=request.user,
-                decision=decision,
-                comments=comments
-            )
-
-            _update_expense_status(expense)
-
-            return redirect('expense_approvals')
+            try:
+                approval_service.record_decision(expense, request.user, decision, comments)
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                return redirect('expense_approvals')
 
-        # Recalculate counts for the context if the form is invalid
-        approved_count = expense.approvals.filter(decision='APPROVED').count()
-        rejected_count = expense.approvals.filter(decision='REJECTED').count()
-
-        context = {
-            'expense': expense,
-            'form': form,
-            'approved_count': approved_count,
-            'rejected_count': rejected_count,
-        }
-        return render(request, 'approvals/review_expense.html', context)
\ No newline at end of file
+        return render(request, 'approvals/review_expense.html', {'expense': expense, 'form': form})
\ No newline at end of file
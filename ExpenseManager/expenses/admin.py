@@ -1,6 +1,14 @@
 from django.contrib import admin
-from .models import Expense, ExpenseCategory, Receipt
+from .models import (
+    CategorySpendRollup, EmployeeSpendRollup, Expense, ExpenseCategory, OcrJob, Receipt, ReceiptBlob,
+    ReceiptFingerprint,
+)
 
 admin.site.register(Expense)
 admin.site.register(ExpenseCategory)
-admin.site.register(Receipt)
\ No newline at end of file
+admin.site.register(Receipt)
+admin.site.register(ReceiptBlob)
+admin.site.register(OcrJob)
+admin.site.register(ReceiptFingerprint)
+admin.site.register(CategorySpendRollup)
+admin.site.register(EmployeeSpendRollup)
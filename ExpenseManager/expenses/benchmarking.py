@@ -0,0 +1,52 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of the current process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _measured_call(func, args, kwargs):
+    rss_before = peak_rss_bytes()
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    return result, elapsed, peak_rss_bytes() - rss_before
+
+
+def measure_in_fresh_process(func, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) in a new process and returns
+    (result, seconds, peak_memory_bytes). Peak memory is how far the call
+    raised the process's peak RSS, which (unlike tracemalloc) includes
+    Pillow's and other native allocations.
+    """
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1, initializer=django.setup) as pool:
+        return pool.submit(_measured_call, func, args, kwargs).result()
+
+
+def percentile(values, pct):
+    """
+    Returns the pct-th percentile of values (nearest-rank method).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def format_bytes(num):
+    return f"{num / (1024 * 1024):.1f} MB"
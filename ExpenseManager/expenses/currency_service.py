@@ -0,0 +1,165 @@
+"""
+Currency conversion from local daily rate tables.
+
+Rates are read from EXCHANGE_RATES_DIR, which holds one CSV file per day
+named YYYY-MM-DD.csv with a `currency,rate` header. Each rate is the number
+of units of that currency per one unit of EXCHANGE_RATES_BASE, so any pair
+is converted through the base. A date without a file (weekends, holidays)
+uses the latest earlier table.
+
+Tables and pair rates are cached in-process with functools.lru_cache. The
+list of tables is re-read whenever the directory's mtime changes, so added
+or renamed-into-place files are picked up; call clear_cache() after editing
+an existing file in place. Expenses store their amount in the
+company currency (converted_amount) when they are created, so reports
+aggregate that column instead of converting rows when they are read.
+"""
+import bisect
+import csv
+import os
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.conf import settings
+
+RATES_DIR = getattr(settings, 'EXCHANGE_RATES_DIR', os.path.join(settings.BASE_DIR, 'exchange_rates'))
+RATES_BASE = getattr(settings, 'EXCHANGE_RATES_BASE', 'USD')
+CENT = Decimal('0.01')
+
+
+class RateUnavailable(LookupError):
+    pass
+
+
+def available_dates():
+    """
+    Sorted dates that have a rate table.
+    """
+    try:
+        mtime = os.stat(RATES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return ()
+    return _list_dates(mtime)
+
+
+@lru_cache(maxsize=1)
+def _list_dates(mtime):
+    try:
+        names = os.listdir(RATES_DIR)
+    except FileNotFoundError:
+        return ()
+    dates = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext != '.csv':
+            continue
+        try:
+            dates.append(date.fromisoformat(stem))
+        except ValueError:
+            continue
+    return tuple(sorted(dates))
+
+
+@lru_cache(maxsize=64)
+def _load_table(day):
+    """
+    {currency: units per one RATES_BASE} from the table for `day`.
+    """
+    rates = {RATES_BASE: Decimal(1)}
+    with open(os.path.join(RATES_DIR, f"{day.isoformat()}.csv"), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                rate = Decimal(row['rate'])
+            except (KeyError, TypeError, InvalidOperation):
+                continue
+            if rate > 0:
+                rates[row['currency'].strip().upper()] = rate
+    return rates
+
+
+def _table_date(day):
+    """
+    The date of the table that applies to `day`: its own or the latest
+    earlier one.
+    """
+    if not isinstance(day, date) or isinstance(day, datetime):
+        raise TypeError(f"Expected a date, got {day!r}.")
+    dates = available_dates()
+    index = bisect.bisect_right(dates, day)
+    if index == 0:
+        raise RateUnavailable(f"No exchange rate table on or before {day}.")
+    return dates[index - 1]
+
+
+def get_rate(base, quote, day):
+    """
+    Units of `quote` per one unit of `base` on `day`. Raises RateUnavailable.
+    """
+    base, quote = base.upper(), quote.upper()
+    if base == quote:
+        return Decimal(1)
+    # Cached under the table's date, not `day`, so a table added later for
+    # `day` replaces the earlier one it fell back to.
+    return _rate(base, quote, _table_date(day))
+
+
+@lru_cache(maxsize=4096)
+def _rate(base, quote, table_date):
+    table = _load_table(table_date)
+    try:
+        return table[quote] / table[base]
+    except KeyError as e:
+        raise RateUnavailable(f"No {e.args[0]} rate in the {table_date} table.") from None
+
+
+def convert(amount, base, quote, day):
+    """
+    `amount` in `base` converted to `quote`, rounded to cents.
+    """
+    return (Decimal(amount) * get_rate(base, quote, day)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def convert_many(items, quote):
+    """
+    Converts (amount, currency, date) tuples to `quote` in one pass: each
+    distinct (currency, date) is resolved once. Returns a list in input
+    order with None where no rate is available.
+    """
+    items = list(items)
+    rates = {}
+    for _, currency, day in items:
+        key = (currency.upper(), day)
+        if key not in rates:
+            try:
+                rates[key] = get_rate(key[0], quote, day)
+            except RateUnavailable:
+                rates[key] = None
+    results = []
+    for amount, currency, day in items:
+        rate = rates[(currency.upper(), day)]
+        results.append(None if rate is None else (Decimal(amount) * rate).quantize(CENT, rounding=ROUND_HALF_UP))
+    return results
+
+
+def apply_conversion(expenses, quote):
+    """
+    Sets converted_amount and converted_currency on unsaved or loaded
+    expenses. Expenses without an available rate get a null amount, which
+    the convert_expense_amounts command fills in once the rate exists.
+    """
+    expenses = list(expenses)
+    # to_python: unsaved expenses may still hold the date as a string.
+    amounts = convert_many(
+        ((e.amount, e.currency, e._meta.get_field('date').to_python(e.date)) for e in expenses), quote
+    )
+    for expense, amount in zip(expenses, amounts):
+        expense.converted_amount = amount
+        expense.converted_currency = quote
+    return expenses
+
+
+def clear_cache():
+    _list_dates.cache_clear()
+    _load_table.cache_clear()
+    _rate.cache_clear()
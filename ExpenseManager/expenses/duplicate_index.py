@@ -0,0 +1,176 @@
+"""
+Near-duplicate receipt detection.
+
+Each receipt gets a 64-bit difference hash (dHash), which changes only a
+few bits when a photo is recompressed, resized or slightly cropped.
+Lookups use multi-index hashing: the hash is split into four 16-bit bands
+stored in indexed columns. If two hashes differ in at most `d` bits, at
+least one band differs in at most d // 4 bits (pigeonhole), so candidates
+are the rows whose band equals one of a handful of precomputed neighbour
+values. Only those candidates are compared bit by bit.
+
+Receipts printed by the same till look alike at hash resolution, so among
+matches at the same distance one for the same expense amount is preferred.
+The amount does not gate matches: a resubmitted receipt is still flagged
+when its amount was typed differently.
+
+Hashes are computed off the request, by the OCR worker (see ocr_queue).
+"""
+from functools import lru_cache
+from itertools import chain, combinations
+
+from django.conf import settings
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import ReceiptFingerprint
+
+HASH_SIZE = 8
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Largest Hamming distance still reported as a likely duplicate.
+MAX_DISTANCE = getattr(settings, 'RECEIPT_DUPLICATE_MAX_DISTANCE', 6)
+
+
+def dhash(image_file):
+    """
+    Computes the 64-bit difference hash of an image (path or file object):
+    each bit says whether a pixel is brighter than its right neighbour on
+    a 9x8 grayscale thumbnail.
+    """
+    image = Image.open(image_file)
+    # Decode JPEGs at reduced size; only a 9x8 thumbnail is needed.
+    image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    ImageOps.exif_transpose(image, in_place=True)
+    image = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = image.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def to_signed(value):
+    """
+    Maps an unsigned 64-bit hash onto the signed range of BigIntegerField.
+    """
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def split_bands(value):
+    value = to_unsigned(value)
+    return [(value >> (BAND_BITS * i)) & BAND_MASK for i in range(BANDS)]
+
+
+def hamming(a, b):
+    return (to_unsigned(a) ^ to_unsigned(b)).bit_count()
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """
+    All masks with at most `radius` of the band's bits set.
+    """
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for k in range(radius + 1)
+        for bits in combinations(range(BAND_BITS), k)
+    )
+
+
+def candidate_filter(value, max_distance=MAX_DISTANCE):
+    """
+    Builds the Q matching every fingerprint that can be within
+    `max_distance` bits of `value`.
+    """
+    masks = _flip_masks(max_distance // BANDS)
+    query = Q()
+    for i, band in enumerate(split_bands(value)):
+        query |= Q(**{f'band{i}__in': [band ^ mask for mask in masks]})
+    return query
+
+
+def find_duplicate(company_id, value, amount=None, max_distance=MAX_DISTANCE, exclude_receipt_id=None,
+                   others=()):
+    """
+    Returns (receipt_id, distance) of the closest indexed receipt of the
+    company within `max_distance` bits of `value`, or None. Ties go to a
+    receipt for the same expense `amount`. `others` adds (receipt_id, hash,
+    amount) candidates that are not stored yet, e.g. earlier rows of a batch.
+    """
+    candidates = ReceiptFingerprint.objects.filter(company_id=company_id).filter(
+        candidate_filter(value, max_distance)
+    )
+    if exclude_receipt_id is not None:
+        candidates = candidates.exclude(receipt_id=exclude_receipt_id)
+
+    best, best_rank = None, None
+    for receipt_id, other, other_amount in chain(
+        candidates.values_list('receipt_id', 'dhash', 'receipt__expense__amount'), others
+    ):
+        distance = hamming(value, other)
+        rank = (distance, amount is None or other_amount != amount)
+        if distance <= max_distance and (best_rank is None or rank < best_rank):
+            best, best_rank = (receipt_id, distance), rank
+    return best
+
+
+def build_fingerprint(receipt, value, company_id, duplicate=None):
+    """
+    Returns an unsaved fingerprint for a receipt with (unsigned) hash `value`.
+    """
+    bands = split_bands(value)
+    return ReceiptFingerprint(
+        receipt=receipt,
+        company_id=company_id,
+        dhash=to_signed(value),
+        band0=bands[0], band1=bands[1], band2=bands[2], band3=bands[3],
+        possible_duplicate_of_id=duplicate[0] if duplicate else None,
+        distance=duplicate[1] if duplicate else None,
+    )
+
+
+def hash_image(image_file):
+    """
+    dhash() of an image, or None if it cannot be read.
+    """
+    try:
+        return dhash(image_file)
+    except (OSError, ValueError):
+        return None
+
+
+def index_hash(receipt, value, company_id=None):
+    """
+    Flags the closest earlier receipt of the same company as a possible
+    duplicate of a receipt whose image hashes to `value`, and stores the
+    fingerprint.
+    """
+    if company_id is None:
+        company_id = receipt.expense.employee.company_id
+    duplicate = find_duplicate(company_id, value, receipt.expense.amount, exclude_receipt_id=receipt.pk)
+    fingerprint = build_fingerprint(receipt, value, company_id, duplicate)
+    fingerprint.save()
+    return fingerprint
+
+
+def index_receipt(receipt, company_id=None):
+    """
+    Hashes a receipt image and indexes it (see index_hash). Returns the
+    fingerprint, or None if the image cannot be read.
+    """
+    try:
+        with receipt.image.open('rb') as image_file:
+            value = hash_image(image_file)
+    except OSError:
+        return None
+    if value is None:
+        return None
+    return index_hash(receipt, value, company_id)
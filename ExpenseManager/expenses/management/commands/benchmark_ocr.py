@@ -0,0 +1,121 @@
+import io
+import itertools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from expenses import ocr_service
+from expenses.benchmarking import format_bytes, peak_rss_bytes, percentile
+from expenses.synthetic_receipts import LAYOUTS, encode_image, generate_receipt, render_receipt
+
+ACCURACY_FIELDS = ('amount', 'date', 'currency', 'merchant', 'line_items')
+
+
+def _timed_ocr(image_bytes, preprocessing):
+    """
+    Runs the OCR pipeline on one receipt inside a worker process and returns
+    (parsed data, error, seconds, worker peak RSS).
+    """
+    started = time.perf_counter()
+    try:
+        data, error = ocr_service.run_ocr(io.BytesIO(image_bytes), preprocessing=preprocessing, use_cache=False), ''
+    except Exception as e:
+        data, error = {}, f"{type(e).__name__}: {e}"
+    return data, error, time.perf_counter() - started, peak_rss_bytes()
+
+
+def _csv(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the OCR pipeline (image -> Tesseract -> parse_ocr_text) on synthetic receipts '
+            'rendered locally, reporting throughput, latency percentiles, peak memory and '
+            'field-extraction accuracy per receipt variant.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=60, help='Number of receipts.')
+        parser.add_argument('--scales', type=_csv, default=['0.75', '1.5', '3'],
+                            help='Comma-separated resolution multipliers (1.0 is about 200 DPI).')
+        parser.add_argument('--noise', type=_csv, default=['0', '0.5'],
+                            help='Comma-separated noise levels between 0 and 1.')
+        parser.add_argument('--layouts', type=_csv, default=list(LAYOUTS),
+                            help=f"Comma-separated layouts out of {', '.join(LAYOUTS)}.")
+        parser.add_argument('--fonts', type=_csv, default=[''],
+                            help="Comma-separated TrueType font paths (empty: Pillow's default font).")
+        parser.add_argument('--workers', type=int, default=1, help='OCR processes.')
+        parser.add_argument('--no-preprocessing', action='store_true',
+                            help='Feed Tesseract the images as rendered.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        unknown = set(options['layouts']) - set(LAYOUTS)
+        if unknown:
+            raise CommandError(f"Unknown layout(s): {', '.join(sorted(unknown))}")
+        try:
+            scales = [float(scale) for scale in options['scales']]
+            noise_levels = [float(noise) for noise in options['noise']]
+        except ValueError as e:
+            raise CommandError(e)
+
+        variants = list(itertools.product(options['layouts'], scales, noise_levels, options['fonts']))
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"Rendering {options['count']} receipts across {len(variants)} variants...")
+        receipts = []
+        for variant in itertools.islice(itertools.cycle(variants), options['count']):
+            layout, scale, noise, font = variant
+            # Pillow's default font has no glyphs for most currency symbols.
+            lines, truth = generate_receipt(rng, symbols=bool(font))
+            image = render_receipt(lines, layout=layout, scale=scale, font_path=font or None, noise=noise, rng=rng)
+            receipts.append((variant, image.size, encode_image(image, layout), truth))
+
+        preprocessing = ocr_service.NO_PREPROCESSING if options['no_preprocessing'] else None
+        workers = max(1, options['workers'])
+        connections.close_all()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            outcomes = list(pool.map(_timed_ocr, [data for _, _, data, _ in receipts],
+                                     itertools.repeat(preprocessing)))
+        wall = time.perf_counter() - started
+
+        by_variant = {}
+        for (variant, size, _, truth), (data, error, seconds, rss) in zip(receipts, outcomes):
+            by_variant.setdefault(variant, []).append((size, truth, data, error, seconds, rss))
+
+        self.stdout.write(
+            f"\n{'layout':8} {'scale':>5} {'noise':>5} {'font':12} {'pixels':>11} {'n':>3} "
+            f"{'p50':>7} {'p95':>7}  " + ' '.join(f"{field[:8]:>8}" for field in ACCURACY_FIELDS)
+        )
+        for variant, rows in by_variant.items():
+            layout, scale, noise, font = variant
+            latencies = [row[4] for row in rows]
+            width, height = rows[0][0]
+            self.stdout.write(
+                f"{layout:8} {scale:5.2f} {noise:5.2f} {(font or 'default')[-12:]:12} "
+                f"{f'{width}x{height}':>11} {len(rows):3} "
+                f"{percentile(latencies, 50) * 1000:5.0f}ms {percentile(latencies, 95) * 1000:5.0f}ms  "
+                + ' '.join(f"{self._accuracy(rows, field):>8}" for field in ACCURACY_FIELDS)
+            )
+
+        all_rows = [row for rows in by_variant.values() for row in rows]
+        latencies = [row[4] for row in all_rows]
+        errors = [row[3] for row in all_rows if row[3]]
+        self.stdout.write(
+            f"\nTotal: {len(all_rows)} receipts in {wall:.1f}s with {workers} worker(s) = "
+            f"{len(all_rows) / wall:.2f} receipts/s; latency p50 {percentile(latencies, 50) * 1000:.0f}ms, "
+            f"p95 {percentile(latencies, 95) * 1000:.0f}ms; peak worker RSS "
+            f"{format_bytes(max(row[5] for row in all_rows))}"
+        )
+        self.stdout.write('Accuracy: ' + ', '.join(
+            f"{field} {self._accuracy(all_rows, field)}" for field in ACCURACY_FIELDS
+        ))
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{len(errors)} receipt(s) failed, e.g. {errors[0]}"))
+
+    def _accuracy(self, rows, field):
+        correct = sum(1 for _, truth, data, _, _, _ in rows if data.get(field) == truth[field])
+        return f"{100 * correct / len(rows):.0f}%"
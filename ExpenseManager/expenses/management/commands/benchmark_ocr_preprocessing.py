@@ -0,0 +1,69 @@
+import os
+from statistics import mean
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import ocr_service
+from expenses.benchmarking import format_bytes, measure_in_fresh_process
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def _preprocess_only(path, options):
+    image = ocr_service.load_image(path, options)
+    return image.size
+
+
+class Command(BaseCommand):
+    help = ('Compares time and peak memory per receipt with and without the '
+            'OCR preprocessing pipeline. Each run happens in a fresh process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Receipt images or directories of images.')
+        parser.add_argument('--preprocess-only', action='store_true',
+                            help='Measure decoding and preprocessing without running Tesseract.')
+
+    def handle(self, *args, **options):
+        paths = list(self._iter_images(options['paths']))
+        if not paths:
+            raise CommandError('No images found.')
+
+        modes = [('original', ocr_service.NO_PREPROCESSING), ('preprocessed', {})]
+        totals = {name: {'seconds': [], 'memory': []} for name, _ in modes}
+
+        self.stdout.write(f"{'receipt':40} {'mode':13} {'output size':>13} {'time':>9} {'peak mem':>10}")
+        for path in paths:
+            for name, preprocessing in modes:
+                if options['preprocess_only']:
+                    size, seconds, memory = measure_in_fresh_process(_preprocess_only, path, preprocessing)
+                    size_label = f"{size[0]}x{size[1]}"
+                else:
+                    _, seconds, memory = measure_in_fresh_process(
+                        ocr_service.run_ocr, path, preprocessing=preprocessing, use_cache=False,
+                    )
+                    size_label = '-'
+                totals[name]['seconds'].append(seconds)
+                totals[name]['memory'].append(memory)
+                self.stdout.write(
+                    f"{os.path.basename(path)[:40]:40} {name:13} {size_label:>13} "
+                    f"{seconds * 1000:7.0f}ms {format_bytes(memory):>10}"
+                )
+
+        self.stdout.write('')
+        for name, _ in modes:
+            self.stdout.write(
+                f"{name:13} mean {mean(totals[name]['seconds']) * 1000:7.0f}ms, "
+                f"mean peak {format_bytes(mean(totals[name]['memory']))}, "
+                f"max peak {format_bytes(max(totals[name]['memory']))}"
+            )
+
+    def _iter_images(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(path, name)
+            elif os.path.isfile(path):
+                yield path
+            else:
+                raise CommandError(f"{path} does not exist.")
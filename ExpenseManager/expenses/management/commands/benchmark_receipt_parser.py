@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import ocr_service
+from expenses.models import OcrJob
+from expenses.synthetic_receipts import generate_corpus
+
+
+def _legacy_parse(text):
+    """
+    The previous parser (separate searches, patterns compiled per call and
+    strptime tried per format), kept here as the baseline.
+    """
+    amount = None
+    match = re.search(r'(?i)(?:total|amount)\s*[:\s]\s*\$?(\d+\.\d{2})', text)
+    if match:
+        amount = match.group(1)
+    parsed_date = None
+    match = re.search(r'(\d{4}-\d{2}-\d{2})|(\d{2}/\d{2}/\d{4})|(\d{2}-\d{2}-\d{4})', text)
+    if match:
+        for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y'):
+            try:
+                parsed_date = datetime.strptime(match.group(0), fmt).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                pass
+    return {'amount': amount, 'date': parsed_date, 'raw_text': text}
+
+
+class Command(BaseCommand):
+    help = ('Measures receipt text parsing throughput (and accuracy on synthetic receipts) '
+            'for the current parser against the previous one.')
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--synthetic', type=int, default=20000,
+                            help='Number of synthetic receipts to generate (default).')
+        source.add_argument('--corpus', help='Directory of .txt files or a .jsonl file with a raw_text field.')
+        source.add_argument('--from-db', action='store_true', help='Use raw text stored on finished OCR jobs.')
+        parser.add_argument('--limit', type=int, default=100000, help='Maximum texts loaded from --corpus/--from-db.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes; the fastest is reported.')
+
+    def handle(self, *args, **options):
+        texts, truths = self._load_corpus(options)
+        if not texts:
+            raise CommandError('The corpus is empty.')
+        self.stdout.write(f"Corpus: {len(texts)} receipts, {sum(map(len, texts)) / len(texts):.0f} chars on average")
+
+        results = {}
+        for name, parse in (('legacy', _legacy_parse), ('current', ocr_service.parse_ocr_text)):
+            best = None
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                parsed = [parse(text) for text in texts]
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = parsed
+            self.stdout.write(
+                f"{name:8} {len(texts) / best:10.0f} receipts/s  {best / len(texts) * 1e6:7.1f} us/receipt"
+            )
+
+        self.stdout.write('')
+        fields = ['amount', 'date', 'currency', 'merchant', 'line_items']
+        for name, parsed in results.items():
+            if truths:
+                scores = ', '.join(
+                    f"{field} {self._percent(sum(p.get(field) == t[field] for p, t in zip(parsed, truths)), len(truths))}"
+                    for field in fields
+                )
+                self.stdout.write(f"{name:8} accuracy: {scores}")
+            else:
+                found = ', '.join(
+                    f"{field} {self._percent(sum(bool(p.get(field)) for p in parsed), len(parsed))}"
+                    for field in fields
+                )
+                self.stdout.write(f"{name:8} fields found: {found}")
+
+    def _load_corpus(self, options):
+        limit = options['limit']
+        if options['from_db']:
+            texts = [
+                result.get('raw_text') or ''
+                for result in OcrJob.objects.filter(status=OcrJob.Status.DONE)
+                .values_list('result', flat=True)
+                .iterator(chunk_size=2000)
+                if result
+            ][:limit]
+            return texts, None
+        if options['corpus']:
+            path = options['corpus']
+            if os.path.isdir(path):
+                names = sorted(n for n in os.listdir(path) if n.endswith('.txt'))[:limit]
+                texts = []
+                for name in names:
+                    with open(os.path.join(path, name), encoding='utf-8') as f:
+                        texts.append(f.read())
+                return texts, None
+            with open(path, encoding='utf-8') as f:
+                return [json.loads(line)['raw_text'] for line, _ in zip(f, range(limit))], None
+
+        corpus = list(generate_corpus(options['synthetic']))
+        return [text for text, _ in corpus], [truth for _, truth in corpus]
+
+    def _percent(self, part, whole):
+        return f"{100 * part / whole:.1f}%"
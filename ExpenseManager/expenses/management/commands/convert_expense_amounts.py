@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from expenses import currency_service, rollups
+from expenses.models import Expense
+
+
+class Command(BaseCommand):
+    help = ("Stores each expense's amount in its company's currency. By default only "
+            "expenses without a converted amount are processed, e.g. after adding rate tables.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every expense, e.g. after correcting rate tables.')
+        parser.add_argument('--company', type=int, help='Only expenses of this company id.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        currency_service.clear_cache()
+        expenses = Expense.objects.only('id', 'amount', 'currency', 'date', 'employee__company__default_currency')
+        expenses = expenses.select_related('employee__company')
+        if not options['all']:
+            expenses = expenses.filter(converted_amount__isnull=True)
+        if options['company']:
+            expenses = expenses.filter(employee__company_id=options['company'])
+
+        converted = missing = 0
+        batch = []
+        for expense in expenses.order_by('pk').iterator(chunk_size=options['batch_size']):
+            batch.append(expense)
+            if len(batch) >= options['batch_size']:
+                done = self._convert(batch)
+                converted, missing = converted + done, missing + len(batch) - done
+                batch = []
+        if batch:
+            done = self._convert(batch)
+            converted, missing = converted + done, missing + len(batch) - done
+
+        # bulk_update bypasses the rollups' signals; totals are recomputed.
+        rollups.rebuild([options['company']] if options['company'] else None)
+        if missing:
+            self.stderr.write(self.style.WARNING(f"{missing} expense(s) have no exchange rate for their date."))
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} expense(s)."))
+
+    @transaction.atomic
+    def _convert(self, batch):
+        """
+        Converts one batch, grouped by company currency, and returns how many
+        expenses got an amount.
+        """
+        by_currency = {}
+        for expense in batch:
+            company = expense.employee.company
+            by_currency.setdefault(company.default_currency if company else expense.currency, []).append(expense)
+        for quote, expenses in by_currency.items():
+            currency_service.apply_conversion(expenses, quote)
+        Expense.objects.bulk_update(batch, ['converted_amount', 'converted_currency'])
+        return sum(1 for expense in batch if expense.converted_amount is not None)
@@ -0,0 +1,61 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from expenses import storage
+from expenses.models import Receipt, ReceiptBlob
+
+
+class Command(BaseCommand):
+    help = ('Moves receipts stored before content-addressed storage into it, so each distinct '
+            'file is stored once. Receipts already in it are left alone; the command can be rerun.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source-root', default=None,
+                            help='Directory the legacy receipt names are relative to. Before MEDIA_ROOT was set, '
+                                 'uploads went to the directory the server ran in (default: BASE_DIR).')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Do not delete the legacy files once moved.')
+
+    def handle(self, *args, **options):
+        source_root = options['source_root'] or settings.BASE_DIR
+        receipt_storage = storage.receipt_storage()
+        moved = missing = 0
+        freed = 0
+        receipts = Receipt.objects.filter(blob__isnull=True).exclude(image='').only('id', 'image', 'content_hash')
+        for receipt in receipts.order_by('pk').iterator():
+            legacy_name = receipt.image.name
+            path = os.path.join(source_root, legacy_name)
+            try:
+                f = open(path, 'rb')
+            except OSError:
+                missing += 1
+                self.stderr.write(self.style.WARNING(f"Receipt {receipt.pk}: {path} not found."))
+                continue
+            with f:
+                stored_name = receipt_storage.save(legacy_name, File(f))
+                digest = receipt_storage.digest(stored_name)
+                with transaction.atomic():
+                    try:
+                        blob = storage.acquire_stored(stored_name, digest, legacy_name)
+                    except FileNotFoundError:
+                        # Deleted with the last reference to the same content meanwhile.
+                        receipt_storage.save(legacy_name, File(f))
+                        blob = storage.acquire_stored(stored_name, digest, legacy_name)
+                    Receipt.objects.filter(pk=receipt.pk).update(image=blob.name, content_hash=digest, blob=blob)
+            moved += 1
+            if options['keep_originals'] or os.path.abspath(path) == receipt_storage.path(blob.name):
+                continue
+            if not Receipt.objects.filter(image=legacy_name, blob__isnull=True).exists():
+                freed += os.path.getsize(path)
+                os.unlink(path)
+
+        if missing:
+            self.stderr.write(self.style.WARNING(f"{missing} receipt file(s) were not found."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} receipt(s); {ReceiptBlob.objects.count()} distinct file(s) stored, "
+            f"{freed} bytes freed."
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from accounts.models import Company
+from expenses import export
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"{value} is not a valid YYYY-MM-DD date.")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = ("Streams a company's expenses, with employee, category, receipts and approval "
+            "decisions, as CSV or JSON Lines. Memory use does not grow with the number of rows.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', required=True, help='Company id or name.')
+        parser.add_argument('--from', dest='date_from', type=_date, help='First expense date (inclusive).')
+        parser.add_argument('--to', dest='date_to', type=_date, help='Last expense date (inclusive).')
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help='Output file (default: standard output).')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE,
+                            help='Expenses fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        company = options['company']
+        lookup = {'pk': company} if company.isdigit() else {'name': company}
+        try:
+            company = Company.objects.get(**lookup)
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} does not exist.")
+
+        queryset = export.export_queryset(company.pk, options['date_from'], options['date_to'])
+        lines = export.stream(queryset, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
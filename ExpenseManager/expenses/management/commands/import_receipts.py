@@ -0,0 +1,249 @@
+import hashlib
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import django
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts.models import CustomUser
+from approvals import approval_service, inbox
+from expenses import currency_service, duplicate_index, ocr_service, rollups, storage
+from expenses.models import Expense, ExpenseCategory, OcrJob, Receipt, ReceiptFingerprint
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+# Open archives, so each file does not re-read the zip's central directory.
+_open_archives = {}
+
+
+def _read_entry(source, name):
+    if zipfile.is_zipfile(source):
+        archive = _open_archives.get(source)
+        if archive is None:
+            archive = _open_archives[source] = zipfile.ZipFile(source)
+        return archive.read(name)
+    with open(os.path.join(source, name), 'rb') as f:
+        return f.read()
+
+
+def _ocr_entry(data):
+    """
+    Runs perceptual hashing and OCR on one file's bytes inside a worker
+    process. Returns (parsed data, error message, dhash or None) and records
+    any exception as the error, so one bad scan cannot stop the import.
+    """
+    value = None
+    try:
+        value = duplicate_index.hash_image(io.BytesIO(data))
+        return ocr_service.run_ocr(io.BytesIO(data)), '', value
+    except Exception as e:
+        return {}, f"{type(e).__name__}: {e}", value
+
+
+class Command(BaseCommand):
+    help = ('Imports a directory or zip archive of scanned receipts as expenses for one user, '
+            'running OCR on a process pool. Files imported by an earlier run are skipped, '
+            'so an interrupted import can simply be restarted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory or .zip archive containing receipt images.')
+        parser.add_argument('--user', required=True, help='Username the expenses are submitted for.')
+        parser.add_argument('--category', default='Uncategorized', help='Expense category name.')
+        parser.add_argument('--currency', default=None,
+                            help="Currency of the expenses (default: the company's currency).")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Receipts written per transaction.')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not (os.path.isdir(source) or zipfile.is_zipfile(source)):
+            raise CommandError(f"{source} is neither a directory nor a zip archive.")
+
+        try:
+            self.user = CustomUser.objects.select_related('company').get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+        self.required_approvals = approval_service.required_approvals_for(self.user)
+        self.category, _ = ExpenseCategory.objects.get_or_create(name=options['category'])
+        self.currency = options['currency'] or (
+            self.user.company.default_currency if self.user.company else 'USD'
+        )
+        self.company_currency = self.user.company.default_currency if self.user.company else self.currency
+        self.source = source
+        self.image_field = Receipt._meta.get_field('image')
+        self.receipt_storage = storage.receipt_storage()
+
+        already_imported = set(
+            Receipt.objects.filter(expense__employee=self.user)
+            .exclude(content_hash='')
+            .values_list('content_hash', flat=True)
+        )
+        self.imported = self.skipped = self.failed = 0
+        self.started = time.monotonic()
+
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size']
+        batch = []
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            pending = {}
+            entries = self._iter_new_entries(already_imported)
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded number of files in flight so memory stays
+                # flat no matter how large the source is.
+                while not exhausted and len(pending) < workers * 4:
+                    entry = next(entries, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    name, data = entry
+                    pending[pool.submit(_ocr_entry, data)] = (name, data)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, data = pending.pop(future)
+                    # Stored now, so the batch holds names rather than bytes.
+                    stored_name = self.receipt_storage.save(
+                        self.image_field.generate_filename(None, os.path.basename(name)), ContentFile(data)
+                    )
+                    batch.append((name, stored_name, *future.result()))
+
+                if len(batch) >= batch_size:
+                    self._write_batch(batch)
+                    batch = []
+
+        if batch:
+            self._write_batch(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.imported} imported, {self.skipped} already present, "
+            f"{self.failed} without OCR data."
+        ))
+
+    def _iter_new_entries(self, already_imported):
+        """
+        Yields (name, bytes) for every image in the source whose content
+        has not been imported for this user yet. Each file is read once;
+        its bytes go to the OCR worker and then to the receipt storage.
+        """
+        if zipfile.is_zipfile(self.source):
+            with zipfile.ZipFile(self.source) as archive:
+                names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        else:
+            names = []
+            for root, _, files in os.walk(self.source):
+                names.extend(os.path.relpath(os.path.join(root, f), self.source) for f in files)
+
+        for name in sorted(names):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            data = _read_entry(self.source, name)
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in already_imported:
+                self.skipped += 1
+                continue
+            already_imported.add(digest)
+            yield name, data
+
+    @transaction.atomic
+    def _write_batch(self, batch):
+        """
+        Creates the expenses, receipts, finished OCR jobs and fingerprints for one
+        batch in a single transaction and adds the expenses to the approval inbox.
+        Receipts carry their content hash, which is what lets a restarted import
+        skip this batch.
+        """
+        expenses = Expense.objects.bulk_create(currency_service.apply_conversion([
+            Expense(
+                employee=self.user,
+                category=self.category,
+                amount=self._parse_amount(ocr_data.get('amount')),
+                currency=self.currency,
+                description=f"Imported receipt {os.path.basename(name)}",
+                date=self._parse_date(ocr_data.get('date')),
+                required_approvals=self.required_approvals,
+            )
+            for name, _, ocr_data, _, _ in batch
+        ], self.company_currency))
+        # bulk_create sends no post_save, so the approval inbox and the
+        # spend rollups are updated here.
+        inbox.add_expenses(expenses)
+        rollups.add_expenses(expenses)
+
+        receipts = []
+        for expense, (name, stored_name, _, _, _) in zip(expenses, batch):
+            # The stored name is derived from the content hash.
+            digest = self.receipt_storage.digest(stored_name)
+            try:
+                blob = storage.acquire_stored(stored_name, digest, name)
+            except FileNotFoundError:
+                # Deleted with the last reference to the same content since it was stored.
+                self.receipt_storage.save(stored_name, ContentFile(_read_entry(self.source, name)))
+                blob = storage.acquire_stored(stored_name, digest, name)
+            receipts.append(Receipt(expense=expense, image=blob.name, content_hash=digest, blob=blob))
+        receipts = Receipt.objects.bulk_create(receipts)
+
+        now = timezone.now()
+        OcrJob.objects.bulk_create([
+            OcrJob(
+                receipt=receipt,
+                status=OcrJob.Status.FAILED if error else OcrJob.Status.DONE,
+                result=ocr_data or None,
+                error=error,
+                attempts=1,
+                started_at=now,
+                finished_at=now,
+            )
+            for receipt, (_, _, ocr_data, error, _) in zip(receipts, batch)
+        ])
+
+        self._index_fingerprints(receipts, expenses, [value for *_, value in batch])
+
+        self.imported += len(batch)
+        self.failed += sum(1 for _, _, _, error, _ in batch if error)
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(
+            f"{self.imported} imported, {self.skipped} skipped, {self.failed} OCR failures "
+            f"({self.imported / elapsed:.1f} receipts/s)"
+        )
+
+    def _index_fingerprints(self, receipts, expenses, hashes):
+        """
+        Flags likely duplicates among earlier receipts of the company and
+        within the batch itself, then stores the fingerprints in bulk.
+        """
+        company_id = self.user.company_id
+        fingerprints = []
+        seen = []
+        for receipt, expense, value in zip(receipts, expenses, hashes):
+            if value is None:
+                continue
+            duplicate = duplicate_index.find_duplicate(company_id, value, expense.amount, others=seen)
+            fingerprints.append(duplicate_index.build_fingerprint(receipt, value, company_id, duplicate))
+            seen.append((receipt.pk, value, expense.amount))
+        ReceiptFingerprint.objects.bulk_create(fingerprints)
+
+    def _parse_date(self, value):
+        try:
+            return (parse_date(value) if value else None) or date.today()
+        except ValueError:
+            return date.today()
+
+    def _parse_amount(self, amount):
+        try:
+            return Decimal(amount) if amount else Decimal('0.00')
+        except InvalidOperation:
+            return Decimal('0.00')
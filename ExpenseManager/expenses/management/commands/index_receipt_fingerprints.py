@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from expenses import duplicate_index
+from expenses.models import Receipt
+
+
+class Command(BaseCommand):
+    help = ('Computes perceptual hashes for receipts that do not have one yet, '
+            'flagging likely duplicates. Receipts are indexed oldest first, so '
+            'the earlier copy of a duplicate pair is the one others point to.')
+
+    def handle(self, *args, **options):
+        receipts = (
+            Receipt.objects.filter(fingerprint__isnull=True)
+            .select_related('expense__employee')
+            .order_by('id')
+        )
+        indexed = flagged = unreadable = 0
+        for receipt in receipts.iterator(chunk_size=500):
+            fingerprint = duplicate_index.index_receipt(receipt)
+            if fingerprint is None:
+                unreadable += 1
+                continue
+            indexed += 1
+            flagged += fingerprint.possible_duplicate_of_id is not None
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} receipt(s), {flagged} flagged as possible duplicates, "
+            f"{unreadable} unreadable."
+        ))
@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from expenses import ocr_queue
+
+
+class Command(BaseCommand):
+    help = 'Processes queued receipt OCR jobs on a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of OCR processes (default: number of CPUs).')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Jobs claimed per poll (default: 4 per worker).')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Seconds after which a RUNNING job is considered abandoned.')
+        parser.add_argument('--max-attempts', type=int, default=3,
+                            help='Attempts before a job is marked as failed.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling forever.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size'] or workers * 4
+        max_attempts = options['max_attempts']
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        self.stdout.write(f"OCR worker started with {workers} process(es).")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            while True:
+                requeued = ocr_queue.requeue_stale(options['stale_after'], max_attempts)
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)."))
+
+                jobs = ocr_queue.claim_jobs(batch_size)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self._process_batch(pool, jobs, max_attempts)
+
+    def _process_batch(self, pool, jobs, max_attempts):
+        started = time.monotonic()
+        futures = {pool.submit(ocr_queue.run_job, job.receipt.image.path): job for job in jobs}
+        failed = 0
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result, error, image_hash = future.result()
+                if image_hash is not None:
+                    ocr_queue.record_hash(job, image_hash)
+                if error:
+                    raise RuntimeError(error)
+                ocr_queue.complete_job(job, result)
+            except Exception as e:
+                failed += 1
+                ocr_queue.fail_job(job, e, max_attempts)
+                self.stderr.write(f"OCR job {job.pk} failed: {e}")
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f"Processed {len(jobs)} job(s) in {elapsed:.2f}s "
+            f"({len(jobs) / elapsed:.1f}/s, {failed} failed)."
+        )
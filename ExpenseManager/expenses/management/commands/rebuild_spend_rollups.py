@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from expenses import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the spend rollup tables from the expenses, e.g. to backfill them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies',
+                            help='Only this company id (repeatable).')
+
+    def handle(self, *args, **options):
+        rows = rollups.rebuild(options['companies'])
+        self.stdout.write(self.style.SUCCESS(f"Spend rollups rebuilt with {rows} row(s)."))
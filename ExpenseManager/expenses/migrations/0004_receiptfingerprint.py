@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_company_options_alter_customuser_options_and_more'),
+        ('expenses', '0003_receipt_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dhash', models.BigIntegerField()),
+                ('band0', models.IntegerField()),
+                ('band1', models.IntegerField()),
+                ('band2', models.IntegerField()),
+                ('band3', models.IntegerField()),
+                ('distance', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.company')),
+                ('possible_duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='expenses.receipt')),
+                ('receipt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint', to='expenses.receipt')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'band0'], name='fingerprint_band0_idx'), models.Index(fields=['company', 'band1'], name='fingerprint_band1_idx'), models.Index(fields=['company', 'band2'], name='fingerprint_band2_idx'), models.Index(fields=['company', 'band3'], name='fingerprint_band3_idx')],
+            },
+        ),
+    ]
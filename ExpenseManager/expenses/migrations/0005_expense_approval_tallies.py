@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_tallies(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    Approval = apps.get_model('approvals', 'Approval')
+    ManagerLink = apps.get_model('accounts', 'CustomUser').managers.through
+
+    def count_of(queryset, group_by):
+        return Coalesce(Subquery(
+            queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')[:1]
+        ), Value(0))
+
+    def decisions(decision):
+        # Like approval_service.recompute_pending, only reviews by the
+        # employee's current managers count.
+        return count_of(
+            Approval.objects.filter(
+                expense=OuterRef('pk'), decision=decision, manager__subordinates=OuterRef('employee_id')
+            ),
+            'expense',
+        )
+
+    Expense.objects.update(
+        approved_count=decisions('APPROVED'),
+        rejected_count=decisions('REJECTED'),
+        required_approvals=count_of(
+            ManagerLink.objects.filter(from_customuser=OuterRef('employee_id')), 'from_customuser'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_company_options_alter_customuser_options_and_more'),
+        ('approvals', '0003_alter_approval_decision'),
+        ('expenses', '0004_receiptfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='approved_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='rejected_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='required_approvals',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def copy_same_currency_amounts(apps, schema_editor):
+    """
+    Expenses already in their company's currency need no rate; the others
+    are converted by the convert_expense_amounts command.
+    """
+    Expense = apps.get_model('expenses', 'Expense')
+    Expense.objects.filter(
+        Q(currency=F('employee__company__default_currency')) | Q(employee__company__isnull=True),
+        converted_amount__isnull=True,
+    ).update(converted_amount=F('amount'), converted_currency=F('currency'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_expense_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='converted_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='converted_currency',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.RunPython(copy_same_currency_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    CategorySpendRollup = apps.get_model('expenses', 'CategorySpendRollup')
+    EmployeeSpendRollup = apps.get_model('expenses', 'EmployeeSpendRollup')
+
+    zero = Value(Decimal('0.00'))
+    expenses = Expense.objects.filter(employee__company__isnull=False).annotate(month=TruncMonth('date')).order_by()
+    CategorySpendRollup.objects.bulk_create(
+        (
+            CategorySpendRollup(
+                company_id=row['employee__company_id'], month=row['month'], category_id=row['category_id'],
+                status=row['status'], expense_count=row['n'], total_amount=row['total'],
+            )
+            for row in expenses.values('employee__company_id', 'month', 'category_id', 'status').annotate(
+                n=Count('pk'), total=Coalesce(Sum('converted_amount'), zero),
+            )
+        ),
+        batch_size=2000,
+    )
+    EmployeeSpendRollup.objects.bulk_create(
+        (
+            EmployeeSpendRollup(
+                company_id=row['employee__company_id'], month=row['month'], employee_id=row['employee_id'],
+                expense_count=row['n'], total_amount=row['total'], approved_amount=row['approved'],
+            )
+            for row in expenses.values('employee__company_id', 'month', 'employee_id').annotate(
+                n=Count('pk'), total=Coalesce(Sum('converted_amount'), zero),
+                approved=Coalesce(Sum('converted_amount', filter=Q(status='APPROVED')), zero),
+            )
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_employee_directory_indexes'),
+        ('expenses', '0007_expense_converted_amount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month.')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected')], max_length=10)),
+                ('expense_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='expenses.expensecategory')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.company')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'month', 'category', 'status'), name='unique_category_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmployeeSpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month.')),
+                ('expense_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('approved_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.company')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'month', 'employee'), name='unique_employee_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
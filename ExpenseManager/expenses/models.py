@@ -1,13 +1,18 @@
+
 from django.db import models
 from django.conf import settings
 
+from accounts.tracking import TrackedFieldsMixin
+
+from . import storage
+
 class ExpenseCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.name
 
-class Expense(models.Model):
+class Expense(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('APPROVED', 'Approved'),
@@ -21,15 +26,183 @@ class Expense(models.Model):
     description = models.TextField()
     date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Review tallies, kept in step with the Approval rows by
+    # approvals.approval_service so status checks never count approvals.
+    approved_count = models.PositiveIntegerField(default=0)
+    rejected_count = models.PositiveIntegerField(default=0)
+    required_approvals = models.PositiveIntegerField(default=0)
+    # Amount in the company's currency on the expense date, set on creation
+    # by expenses.currency_service; null until a rate table covers it.
+    converted_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    converted_currency = models.CharField(max_length=3, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Expense history pages: (date, id) cursors per employee, with
+            # or without a status filter.
+            models.Index(fields=['employee', 'date'], name='expense_employee_date_idx'),
+            models.Index(fields=['employee', 'status', 'date'], name='expense_employee_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.employee.username} - {self.amount} {self.currency}"
 
+class ReceiptBlob(models.Model):
+    """
+    One stored receipt file, shared by every receipt with the same content
+    (see expenses.storage). ref_count is the number of receipts using it.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash} ({self.ref_count} receipt(s))"
+
+
 class Receipt(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='receipts')
-    image = models.ImageField(upload_to='receipts/')
+    image = models.ImageField(upload_to='receipts/', storage=storage.receipt_storage)
+    # SHA-256 of the image bytes, used to recognise re-imported files.
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Null for receipts stored before content-addressed storage; see the
+    # deduplicate_receipts command.
+    blob = models.ForeignKey(
+        ReceiptBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='receipts'
+    )
+
+    def __str__(self):
+        return f"Receipt for {self.expense}"
+
+    def save(self, *args, **kwargs):
+        replaced_blob_id = None
+        if self.image and self._image_changed():
+            # Stores the file, unless its content is already stored, and
+            # takes a reference to it; the previous image's reference is
+            # dropped once the receipt points at the new one.
+            replaced_blob_id = self.blob_id
+            self.blob = storage.acquire(self.image)
+            self.content_hash = self.blob.content_hash
+        elif self.image and not self.content_hash:
+            self.content_hash = storage.content_hash(self.image)
+        super().save(*args, **kwargs)
+        if replaced_blob_id is not None:
+            storage.release(replaced_blob_id)
+
+    def _image_changed(self):
+        """
+        Whether `image` holds a new upload, or a stored file other than its
+        blob's. Receipts stored before blobs existed are left to the
+        deduplicate_receipts command.
+        """
+        if not self.image._committed:
+            return True
+        if self.blob_id is None:
+            return self._state.adding
+        return self.image.name != self.blob.name
+
+class OcrJob(models.Model):
+    """
+    A queued OCR run for a receipt. Jobs are created on submission and
+    processed out of band by the `ocr_worker` management command.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    receipt = models.OneToOneField(Receipt, on_delete=models.CASCADE, related_name='ocr_job')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ocrjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"OCR job for {self.receipt} ({self.get_status_display()})"
+
+
+class ReceiptFingerprint(models.Model):
+    """
+    Perceptual hash (64-bit dHash) of a receipt image. The hash is also
+    stored as four 16-bit bands, each indexed per company, so near-duplicate
+    lookups are index probes instead of a scan (see duplicate_index.py).
+    """
+    receipt = models.OneToOneField(Receipt, on_delete=models.CASCADE, related_name='fingerprint')
+    company = models.ForeignKey('accounts.Company', on_delete=models.CASCADE, null=True, blank=True)
+    dhash = models.BigIntegerField()
+    band0 = models.IntegerField()
+    band1 = models.IntegerField()
+    band2 = models.IntegerField()
+    band3 = models.IntegerField()
+    possible_duplicate_of = models.ForeignKey(
+        Receipt, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    distance = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'band0'], name='fingerprint_band0_idx'),
+            models.Index(fields=['company', 'band1'], name='fingerprint_band1_idx'),
+            models.Index(fields=['company', 'band2'], name='fingerprint_band2_idx'),
+            models.Index(fields=['company', 'band3'], name='fingerprint_band3_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fingerprint of {self.receipt}"
+
+
+class CategorySpendRollup(models.Model):
+    """
+    Expense count and company-currency total per company, month, category
+    and status, kept in step with Expense by expenses.rollups.
+    """
+    company = models.ForeignKey('accounts.Company', on_delete=models.CASCADE, related_name='+')
+    month = models.DateField(help_text='First day of the month.')
+    category = models.ForeignKey(ExpenseCategory, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=10, choices=Expense.STATUS_CHOICES)
+    expense_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'month', 'category', 'status'], name='unique_category_rollup')
+        ]
+
+    def __str__(self):
+        return f"{self.company} {self.month:%Y-%m} {self.category} {self.status}"
+
+
+class EmployeeSpendRollup(models.Model):
+    """
+    Expense count, company-currency total and approved total per company,
+    month and employee, kept in step with Expense by expenses.rollups.
+    """
+    company = models.ForeignKey('accounts.Company', on_delete=models.CASCADE, related_name='+')
+    month = models.DateField(help_text='First day of the month.')
+    employee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    expense_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    approved_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'month', 'employee'], name='unique_employee_rollup')
+        ]
 
     def __str__(self):
-        return f"Receipt for {self.expense}"
\ No newline at end of file
+        return f"{self.company} {self.month:%Y-%m} {self.employee}"
@@ -0,0 +1,129 @@
+"""
+DB-backed queue for receipt OCR.
+
+Submissions only enqueue an OcrJob; the `ocr_worker` management command
+claims queued jobs in batches, runs Tesseract and perceptual hashing on a
+process pool and records the parsed result (or the error) back on the job
+and the hash as the receipt's fingerprint.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import duplicate_index, ocr_service
+from .models import OcrJob, ReceiptFingerprint
+
+
+def enqueue(receipt):
+    """
+    Queues OCR for a receipt and returns the job.
+    """
+    return OcrJob.objects.create(receipt=receipt)
+
+
+def run_job(image_path):
+    """
+    Runs OCR and perceptual hashing for one job inside a worker process.
+    Returns (parsed data, error message, dhash or None). Engine exceptions
+    are returned as messages because some of them (e.g. pytesseract's)
+    cannot be unpickled in the parent, which would break the whole pool,
+    and so that the hash is kept when OCR fails.
+    """
+    value = duplicate_index.hash_image(image_path)
+    try:
+        return ocr_service.run_ocr(image_path), '', value
+    except Exception as e:
+        return {}, f"{type(e).__name__}: {e}", value
+
+
+def new_worker_id():
+    """
+    Returns a token identifying one claim made by one worker process.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_jobs(limit, worker_id=None):
+    """
+    Atomically moves up to `limit` queued jobs to RUNNING and returns them.
+
+    The claim is a conditional UPDATE tagged with a per-claim token, so two
+    workers polling at the same time never pick up the same job, even on
+    databases without SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    worker_id = worker_id or new_worker_id()
+    with transaction.atomic():
+        candidate_ids = list(
+            OcrJob.objects.select_for_update(skip_locked=True)
+            .filter(status=OcrJob.Status.QUEUED)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not candidate_ids:
+            return []
+        OcrJob.objects.filter(id__in=candidate_ids, status=OcrJob.Status.QUEUED).update(
+            status=OcrJob.Status.RUNNING,
+            worker_id=worker_id,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+    return list(
+        OcrJob.objects.filter(worker_id=worker_id, status=OcrJob.Status.RUNNING)
+        .select_related('receipt')
+    )
+
+
+def record_hash(job, value):
+    """
+    Stores the fingerprint of the job's receipt, flagging likely duplicates,
+    unless an earlier attempt already did.
+    """
+    if not ReceiptFingerprint.objects.filter(receipt_id=job.receipt_id).exists():
+        duplicate_index.index_hash(job.receipt, value)
+
+
+def complete_job(job, result):
+    """
+    Records a successful OCR result on the job.
+    """
+    job.status = OcrJob.Status.DONE
+    job.result = result
+    job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+
+
+def fail_job(job, error, max_attempts):
+    """
+    Records an OCR error. The job goes back on the queue until it has been
+    tried `max_attempts` times.
+    """
+    job.error = str(error)
+    if job.attempts < max_attempts:
+        job.status = OcrJob.Status.QUEUED
+        job.finished_at = None
+    else:
+        job.status = OcrJob.Status.FAILED
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def requeue_stale(stale_after, max_attempts):
+    """
+    Releases jobs left RUNNING by a worker that died mid-batch. Jobs that
+    have used up their attempts are marked FAILED instead.
+    Returns the number of jobs requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = OcrJob.objects.filter(status=OcrJob.Status.RUNNING, started_at__lt=cutoff)
+    stale.filter(attempts__gte=max_attempts).update(
+        status=OcrJob.Status.FAILED,
+        error='Worker did not finish the job in time.',
+        finished_at=timezone.now(),
+    )
+    return stale.filter(attempts__lt=max_attempts).update(status=OcrJob.Status.QUEUED)
@@ -1,53 +1,354 @@
+import hashlib
+import io
+import json
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageOps
 import re
-from datetime import datetime
+from datetime import date as date_cls
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import caches
+
+# Extra command-line options passed to Tesseract. Part of the OCR cache key,
+# so changing them never serves results produced with other settings.
+TESSERACT_CONFIG = getattr(settings, 'OCR_TESSERACT_CONFIG', '')
+
+# Image preprocessing applied before Tesseract. Override any step with the
+# OCR_PREPROCESSING setting, or per call through run_ocr(preprocessing=...).
+DEFAULT_PREPROCESSING = {
+    # Rotate according to the EXIF orientation tag written by phone cameras.
+    'exif_transpose': True,
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, so a
+    # 12 MP photo is never fully decoded at its original size.
+    'draft': True,
+    # Downscale so that text ends up at roughly this resolution (None keeps
+    # the original size). Images are never upscaled.
+    'target_dpi': 300,
+    # Physical width assumed for the short side of images without usable DPI
+    # metadata (phone photos): an 80 mm thermal receipt plus some margin.
+    'assumed_width_inches': 3.5,
+    'grayscale': True,
+    # Convert to pure black and white. A threshold of None picks one per
+    # image with Otsu's method.
+    'binarize': True,
+    'threshold': None,
+}
+PREPROCESSING = {**DEFAULT_PREPROCESSING, **getattr(settings, 'OCR_PREPROCESSING', {})}
+
+# Feeds Tesseract the image exactly as uploaded.
+NO_PREPROCESSING = {
+    'exif_transpose': False,
+    'draft': False,
+    'target_dpi': None,
+    'grayscale': False,
+    'binarize': False,
+}
+
+# DPI metadata below this is the camera default (usually 72), not a scan.
+MIN_TRUSTED_DPI = 150
 
 def extract_text_from_image(image_file):
     """
     Extracts text from an image file using pytesseract.
     """
     try:
-        image = Image.open(image_file)
-        text = pytesseract.image_to_string(image)
-        return parse_ocr_text(text)
+        return run_ocr(image_file)
     except Exception as e:
         print(f"Error processing image: {e}")
         return {}
 
+def run_ocr(image_file, preprocessing=None, use_cache=True):
+    """
+    Runs Tesseract on an image (a path or file object) and parses the result.
+    Unlike extract_text_from_image, errors are raised to the caller so the
+    background worker can record them on the OCR job.
+    `preprocessing` overrides individual PREPROCESSING steps for this call.
+    """
+    options = {**PREPROCESSING, **(preprocessing or {})}
+    image_bytes = _read_image_bytes(image_file)
+    key = ocr_cache_key(image_bytes, options)
+    ocr_cache = caches['ocr']
+
+    text = ocr_cache.get(key) if use_cache else None
+    if text is None:
+        image = load_image(io.BytesIO(image_bytes), options)
+        text = pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+        if use_cache:
+            ocr_cache.set(key, text)
+    return parse_ocr_text(text)
+
+def load_image(image_file, options=None):
+    """
+    Opens an image and runs the preprocessing pipeline on it: draft-mode
+    decoding, EXIF orientation fix, grayscale conversion, downscaling to the
+    target DPI and binarization, each step switchable through `options`.
+    """
+    options = {**PREPROCESSING, **(options or {})}
+    image = Image.open(image_file)
+    scale = _scale_factor(image, options)
+    # The short side does not depend on EXIF orientation, so the target can
+    # be fixed before decoding.
+    target_short_side = max(1, round(min(image.size) * scale))
+
+    if options['draft'] and image.format == 'JPEG':
+        mode = 'L' if options['grayscale'] or options['binarize'] else 'RGB'
+        image.draft(mode, (round(image.width * scale), round(image.height * scale)))
+
+    if options['exif_transpose']:
+        # In place, so images without an orientation tag are not copied.
+        ImageOps.exif_transpose(image, in_place=True)
+
+    # The draft decode may already have done part of the reduction.
+    factor = target_short_side / min(image.size)
+    if factor < 1:
+        size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=1.5)
+
+    # Converted after resizing so the full-size image is only held once.
+    if (options['grayscale'] or options['binarize']) and image.mode != 'L':
+        image = image.convert('L')
+
+    if options['binarize']:
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = _otsu_threshold(image)
+        image = image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+    image.load()
+    return image
+
+def _scale_factor(image, options):
+    """
+    Returns the factor (at most 1) that brings the image to the target DPI.
+    """
+    target_dpi = options['target_dpi']
+    if not target_dpi:
+        return 1.0
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0] >= MIN_TRUSTED_DPI:
+        scale = target_dpi / float(dpi[0])
+    else:
+        scale = target_dpi * options['assumed_width_inches'] / min(image.size)
+    return min(scale, 1.0)
+
+def _otsu_threshold(image):
+    """
+    Picks the gray level that best separates ink from paper (Otsu's method),
+    computed from the 256-bin histogram of a mode 'L' image.
+    """
+    histogram = image.histogram()
+    total = sum(histogram)
+    total_sum = sum(level * count for level, count in enumerate(histogram))
+    background_count = 0
+    background_sum = 0
+    best_threshold, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (total_sum - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+@lru_cache(maxsize=None)
+def ocr_engine_version():
+    """
+    Identifies the OCR engine and its configuration for cache keys.
+    """
+    return f"tesseract-{pytesseract.get_tesseract_version()}|{TESSERACT_CONFIG}"
+
+def ocr_cache_key(image_bytes, options=None):
+    """
+    Content-addressed cache key: the same image bytes OCR'd by the same
+    engine version, configuration and preprocessing always map to the same key.
+    The raw text is cached rather than the parsed fields so parser changes
+    take effect without invalidating the cache.
+    """
+    options = {**PREPROCESSING, **(options or {})}
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    pipeline = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+    return f"ocr:{ocr_engine_version()}:{pipeline}:{digest}"
+
+def _read_image_bytes(image_file):
+    """
+    Reads an image given as a path or a file object, rewinding file objects
+    so callers (e.g. Django's storage) can still read them afterwards.
+    """
+    if isinstance(image_file, str) or hasattr(image_file, '__fspath__'):
+        with open(image_file, 'rb') as f:
+            return f.read()
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    data = image_file.read()
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+    return data
+
+# Receipt text parsing. All patterns are compiled once at import; the
+# parser walks the text a single time, line by line.
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR'}
+CURRENCY_CODES = ('USD', 'EUR', 'GBP', 'JPY', 'INR', 'CAD', 'AUD', 'CHF', 'CNY', 'SGD', 'AED')
+
+# A money value with exactly two decimals, optionally with thousands
+# separators ("1,234.56" or "1.234,56"). Digits glued to it (dates like
+# 01.02.2025) are not money. Currency symbols and codes next to the value
+# are checked by slicing rather than in the pattern, which keeps the
+# pattern cheap to try at every position.
+MONEY_RE = re.compile(r'(?<![\d.,/-])(?:\d{1,3}(?:[.,]\d{3})+[.,]\d{2}|\d+[.,]\d{2})(?![.,]?\d)')
+CURRENCY_CODE_RE = re.compile(r'\b(?:' + '|'.join(CURRENCY_CODES) + r')\b')
+DATE_RE = re.compile(
+    r'(?<!\d)(?:'
+    r'(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2})'
+    r'|(?P<us_m>\d{2})/(?P<us_d>\d{2})/(?P<us_y>\d{4})'
+    r'|(?P<eu_d>\d{2})[-.](?P<eu_m>\d{2})[-.](?P<eu_y>\d{4})'
+    r')(?!\d)'
+)
+# Keywords of priced lines, matched against the lowercased line. The final
+# amount is labelled by one of the ranked groups, strongest first; the
+# other groups mark lines that are neither the total nor a purchased item.
+LABEL_RE = re.compile(
+    r'\b(?:(?P<sub>sub\s*-?\s*total)'
+    r'|(?P<strong>grand\s+total|total\s+due|amount\s+due|balance\s+due|total\s+amount|amount\s+paid)'
+    r'|(?P<total>total)|(?P<amount>amount)'
+    r'|(?P<other>tax|vat|gst|tip|gratuity|change|cash|card|visa|mastercard|amex|balance|tender(?:ed)?|discount|paid|due))\b'
+)
+TOTAL_RANKS = {'strong': 3, 'total': 2, 'amount': 1}
+# Header lines that are not the merchant name (matched lowercased).
+MERCHANT_NOISE_RE = re.compile(
+    r'\b(?:receipt|invoice|welcome|thank|tel|phone|fax|www|http|order|table|server|cashier)\b|@'
+)
+LETTERS_RE = re.compile(r'[^\W\d_]{3,}')
+MERCHANT_SEARCH_LINES = 5
+
+_STRIP_SEPARATORS = str.maketrans('', '', ',.')
+# Trailing characters dropped from line item descriptions.
+_ITEM_STRIP_CHARS = ' \t.:-*' + ''.join(CURRENCY_SYMBOLS)
+
 def parse_ocr_text(text):
     """
-    Parses the extracted text to find relevant information like amount and date.
+    Parses the extracted text to find the total amount, date, currency,
+    merchant name and line items. The date and currency code are the first
+    ones in the text; everything else comes from a single pass over the lines.
+    Amounts are returned as strings with two decimals and the date as
+    YYYY-MM-DD; fields that cannot be found are None (line_items is empty).
     """
-    data = {
-        'amount': find_amount(text),
-        'date': find_date(text),
-        'raw_text': text
+    date = None
+    for date_match in DATE_RE.finditer(text):
+        date = _parse_date_match(date_match)
+        if date is not None:
+            break
+    code_match = CURRENCY_CODE_RE.search(text)
+    currency = code_match.group(0) if code_match else None
+
+    amount = currency_symbol = merchant = None
+    total_rank = 0
+    pending_total_rank = 0
+    line_items = []
+    header_lines_seen = 0
+    find_money = MONEY_RE.finditer
+    find_label = LABEL_RE.search
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        money = None
+        for money in find_money(line):
+            if currency_symbol is None:
+                currency_symbol = _adjacent_symbol(line, money)
+        # `money` is now the last value on the line, which is the line's price.
+
+        label = find_label(line.lower())
+        rank = TOTAL_RANKS.get(label.lastgroup, 0) if label else 0
+        header_lines_seen += 1
+
+        if money is None:
+            # A label alone on its line ("TOTAL" / "12.34") applies to the next price.
+            if rank > pending_total_rank:
+                pending_total_rank = rank
+            if merchant is None and header_lines_seen <= MERCHANT_SEARCH_LINES and LETTERS_RE.search(line) \
+                    and not MERCHANT_NOISE_RE.search(line.lower()) and not DATE_RE.search(line):
+                merchant = line
+            continue
+
+        value = _normalize_amount(money.group(0))
+        rank = rank or pending_total_rank
+        pending_total_rank = 0
+        if rank and rank >= total_rank:
+            amount, total_rank = value, rank
+        elif label is None:
+            description = line[:money.start()].rstrip(_ITEM_STRIP_CHARS)
+            if description[-3:] in CURRENCY_CODES:
+                description = description[:-3].rstrip(_ITEM_STRIP_CHARS)
+            if LETTERS_RE.search(description):
+                line_items.append({'description': description, 'amount': value})
+
+    if currency is None and currency_symbol is not None:
+        currency = CURRENCY_SYMBOLS[currency_symbol]
+
+    return {
+        'amount': amount,
+        'date': date,
+        'currency': currency,
+        'currency_symbol': currency_symbol,
+        'merchant': merchant,
+        'line_items': line_items,
+        'raw_text': text,
     }
-    return data
 
-def find_amount(text):
+def _adjacent_symbol(line, money):
     """
-    Finds the total amount from the text using regular expressions.
+    Returns the currency symbol written right before or after a money
+    match (one space allowed), or None.
     """
-    # This regex looks for a line that starts with "Total" or "Amount" and captures the number that follows
-    match = re.search(r'(?i)(?:total|amount)\s*[:\s]\s*\$?(\d+\.\d{2})', text)
-    if match:
-        return match.group(1)
+    before = line[max(0, money.start() - 2):money.start()].rstrip()
+    if before and before[-1] in CURRENCY_SYMBOLS:
+        return before[-1]
+    after = line[money.end():money.end() + 2].lstrip()
+    if after and after[0] in CURRENCY_SYMBOLS:
+        return after[0]
     return None
 
-def find_date(text):
+def _normalize_amount(number):
+    """
+    Turns "1,234.56" or "1.234,56" into "1234.56".
     """
-    Finds the date from the text using regular expressions.
+    integer = number[:-3].translate(_STRIP_SEPARATORS).lstrip('0') or '0'
+    return f"{integer}.{number[-2:]}"
+
+def _parse_date_match(match):
+    """
+    Builds a YYYY-MM-DD string from a DATE_RE match, or None if the match
+    is not a real calendar date.
     """
-    # This regex looks for a date in the format YYYY-MM-DD, MM/DD/YYYY, or DD-MM-YYYY
-    match = re.search(r'(\d{4}-\d{2}-\d{2})|(\d{2}/\d{2}/\d{4})|(\d{2}-\d{2}-\d{4})', text)
-    if match:
-        date_str = match.group(0)
-        # Attempt to parse the date to a consistent format (YYYY-MM-DD)
-        for fmt in ('%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y'):
+    groups = match.groupdict()
+    for prefix in ('iso', 'us', 'eu'):
+        if groups[f'{prefix}_y']:
             try:
-                return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
+                return date_cls(
+                    int(groups[f'{prefix}_y']), int(groups[f'{prefix}_m']), int(groups[f'{prefix}_d'])
+                ).isoformat()
             except ValueError:
-                pass
-    return None
\ No newline at end of file
+                return None
+    return None
+
+def find_amount(text):
+    """
+    Finds the total amount from the text.
+    """
+    return parse_ocr_text(text)['amount']
+
+def find_date(text):
+    """
+    Finds the date from the text.
+    """
+    return parse_ocr_text(text)['date']
@@ -0,0 +1,220 @@
+"""
+Maintenance of the spend rollup tables (CategorySpendRollup and
+EmployeeSpendRollup).
+
+Every expense contributes one count and its converted_amount (zero until
+converted) to one row of each table. Changes are applied as deltas with
+F() updates, so concurrent writers do not overwrite each other.
+expenses.signals covers expenses created, saved or deleted one at a time.
+Code that bypasses signals calls this module itself: bulk_create callers
+use add_expenses, and status UPDATEs go through change_status. Rows are
+keyed by the employee's current company, so expenses.signals also moves an
+employee's expenses when their company changes on save(); company changes
+made with QuerySet.update() need rebuild(), which recomputes the tables
+from Expense.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import CategorySpendRollup, EmployeeSpendRollup, Expense
+
+ZERO = Decimal('0.00')
+FACT_FIELDS = ('employee_id', 'category_id', 'date', 'status', 'converted_amount')
+
+
+def _company_ids(employee_ids):
+    users = get_user_model().objects.filter(pk__in=set(employee_ids))
+    return dict(users.values_list('pk', 'company_id'))
+
+
+def _facts(rows, companies):
+    """
+    (company, month, category, employee, status, amount) for expense values
+    given as dicts of FACT_FIELDS. Expenses of users without a company are
+    not rolled up.
+    """
+    for row in rows:
+        company_id = companies.get(row['employee_id'])
+        if company_id is None:
+            continue
+        yield (
+            company_id, row['date'].replace(day=1), row['category_id'], row['employee_id'],
+            row['status'], row['converted_amount'] or ZERO,
+        )
+
+
+def _instance_values(expense):
+    # to_python: values assigned in code may still be strings.
+    return {field: Expense._meta.get_field(field).to_python(getattr(expense, field)) for field in FACT_FIELDS}
+
+
+def _deltas(facts, sign):
+    categories = defaultdict(lambda: [0, ZERO])
+    employees = defaultdict(lambda: [0, ZERO, ZERO])
+    for company_id, month, category_id, employee_id, status, amount in facts:
+        category = categories[(company_id, month, category_id, status)]
+        category[0] += sign
+        category[1] += sign * amount
+        employee = employees[(company_id, month, employee_id)]
+        employee[0] += sign
+        employee[1] += sign * amount
+        if status == 'APPROVED':
+            employee[2] += sign * amount
+    return categories, employees
+
+
+def _merge(*deltas):
+    categories, employees = defaultdict(lambda: [0, ZERO]), defaultdict(lambda: [0, ZERO, ZERO])
+    for category_deltas, employee_deltas in deltas:
+        for merged, delta in ((categories, category_deltas), (employees, employee_deltas)):
+            for key, values in delta.items():
+                merged[key] = [a + b for a, b in zip(merged[key], values)]
+    return categories, employees
+
+
+def _upsert(model, lookup, fields, values):
+    """
+    Adds `values` to the `fields` of the row matching `lookup`, creating it
+    when missing. A negative change for a missing row is dropped: that row
+    was already deleted along with its company, category or employee.
+    """
+    changes = {field: F(field) + value for field, value in zip(fields, values) if value}
+    if not changes:
+        return
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    if values[0] <= 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **dict(zip(fields, values)))
+    except IntegrityError:
+        # Created concurrently since the UPDATE above.
+        model.objects.filter(**lookup).update(**changes)
+
+
+@transaction.atomic
+def _apply(deltas):
+    categories, employees = deltas
+    fields = ('expense_count', 'total_amount')
+    for (company_id, month, category_id, status), values in categories.items():
+        lookup = {'company_id': company_id, 'month': month, 'category_id': category_id, 'status': status}
+        _upsert(CategorySpendRollup, lookup, fields, values)
+    fields = ('expense_count', 'total_amount', 'approved_amount')
+    for (company_id, month, employee_id), values in employees.items():
+        lookup = {'company_id': company_id, 'month': month, 'employee_id': employee_id}
+        _upsert(EmployeeSpendRollup, lookup, fields, values)
+    # Empty rows would only pad reads. Only rows whose count just went down
+    # can have reached zero.
+    _delete_empty(CategorySpendRollup, ('company_id', 'month', 'category_id', 'status'), categories)
+    _delete_empty(EmployeeSpendRollup, ('company_id', 'month', 'employee_id'), employees)
+
+
+def _delete_empty(model, key_fields, deltas):
+    emptied = Q()
+    for key, values in deltas.items():
+        if values[0] < 0:
+            emptied |= Q(**dict(zip(key_fields, key)))
+    if emptied:
+        model.objects.filter(emptied, expense_count=0).delete()
+
+
+def add_expenses(expenses):
+    """
+    Counts new expenses, e.g. after bulk_create.
+    """
+    rows = [_instance_values(expense) for expense in expenses]
+    _apply(_deltas(_facts(rows, _company_ids(row['employee_id'] for row in rows)), +1))
+
+
+def remove_expenses(expenses):
+    rows = [_instance_values(expense) for expense in expenses]
+    _apply(_deltas(_facts(rows, _company_ids(row['employee_id'] for row in rows)), -1))
+
+
+def update_expense(expense):
+    """
+    Moves a saved expense's contribution from the values it was loaded with
+    (TrackedFieldsMixin) to its current ones.
+    """
+    new = _instance_values(expense)
+    # Fields that were never loaded (deferred) cannot have changed.
+    old = {field: expense.loaded_values.get(field, value) for field, value in new.items()}
+    if old == new:
+        return
+    companies = _company_ids([old['employee_id'], new['employee_id']])
+    _apply(_merge(_deltas(_facts([old], companies), -1), _deltas(_facts([new], companies), +1)))
+
+
+def move_employee(employee_id, old_company_id, new_company_id):
+    """
+    Moves an employee's expenses from the rollups of their old company to
+    those of their new one. Call after the change is saved.
+    """
+    rows = list(Expense.objects.filter(employee_id=employee_id).values(*FACT_FIELDS))
+    _apply(_merge(
+        _deltas(_facts(rows, {employee_id: old_company_id}), -1),
+        _deltas(_facts(rows, {employee_id: new_company_id}), +1),
+    ))
+
+
+def change_status(expense_ids, status):
+    """
+    Moves expenses to `status` in the rollups. Call before the UPDATE that
+    changes their status.
+    """
+    rows = list(
+        Expense.objects.filter(pk__in=expense_ids).exclude(status=status)
+        .values('employee__company_id', *FACT_FIELDS)
+    )
+    companies = {row['employee_id']: row['employee__company_id'] for row in rows}
+    moved = [{**row, 'status': status} for row in rows]
+    _apply(_merge(_deltas(_facts(rows, companies), -1), _deltas(_facts(moved, companies), +1)))
+
+
+@transaction.atomic
+def rebuild(company_ids=None):
+    """
+    Recomputes both rollup tables (for `company_ids`, or all companies) from
+    Expense with two grouped queries. Returns the number of rows written.
+    """
+    expenses = Expense.objects.filter(employee__company__isnull=False)
+    categories = CategorySpendRollup.objects.all()
+    employees = EmployeeSpendRollup.objects.all()
+    if company_ids is not None:
+        expenses = expenses.filter(employee__company_id__in=company_ids)
+        categories = categories.filter(company_id__in=company_ids)
+        employees = employees.filter(company_id__in=company_ids)
+    categories.delete()
+    employees.delete()
+
+    expenses = expenses.annotate(month=TruncMonth('date')).order_by()
+    amount = Coalesce(Sum('converted_amount'), Value(ZERO))
+    category_rows = [
+        CategorySpendRollup(
+            company_id=row['employee__company_id'], month=row['month'], category_id=row['category_id'],
+            status=row['status'], expense_count=row['expense_count'], total_amount=row['total_amount'],
+        )
+        for row in expenses.values('employee__company_id', 'month', 'category_id', 'status').annotate(
+            expense_count=Count('pk'), total_amount=amount,
+        )
+    ]
+    employee_rows = [
+        EmployeeSpendRollup(
+            company_id=row['employee__company_id'], month=row['month'], employee_id=row['employee_id'],
+            expense_count=row['expense_count'], total_amount=row['total_amount'],
+            approved_amount=row['approved_amount'],
+        )
+        for row in expenses.values('employee__company_id', 'month', 'employee_id').annotate(
+            expense_count=Count('pk'), total_amount=amount,
+            approved_amount=Coalesce(Sum('converted_amount', filter=Q(status='APPROVED')), Value(ZERO)),
+        )
+    ]
+    CategorySpendRollup.objects.bulk_create(category_rows, batch_size=2000)
+    EmployeeSpendRollup.objects.bulk_create(employee_rows, batch_size=2000)
+    return len(category_rows) + len(employee_rows)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import rollups, storage
+from .models import Expense, Receipt
+
+
+@receiver(post_save, sender=Expense)
+def update_spend_rollups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        rollups.add_expenses([instance])
+    elif instance._loaded_values is not None:
+        rollups.update_expense(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def move_spend_rollups(sender, instance, created, raw=False, **kwargs):
+    # loaded_values still holds the values from before this save.
+    if raw or created or 'company_id' not in instance.loaded_values:
+        return
+    old_company_id = instance.loaded_values['company_id']
+    if old_company_id != instance.company_id:
+        rollups.move_employee(instance.pk, old_company_id, instance.company_id)
+
+
+@receiver(post_delete, sender=Expense)
+def remove_from_spend_rollups(sender, instance, **kwargs):
+    rollups.remove_expenses([instance])
+
+
+@receiver(post_delete, sender=Receipt)
+def release_receipt_blob(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        storage.release(instance.blob_id)
@@ -0,0 +1,231 @@
+"""
+Content-addressed receipt storage.
+
+Receipt files are stored once per distinct content, under their SHA-256
+(receipts/ab/cd/abcd...), so re-uploading the same scan costs no space.
+Each stored file has a ReceiptBlob row whose ref_count is the number of
+receipts using it; acquire() takes a reference when a receipt is created
+and release() drops it when the receipt is deleted, removing the file and
+its thumbnails with the last reference. Both lock the blob row, and the
+file is only deleted under that lock once no reference is left, so an
+upload of the same content either keeps the file or finds it gone and
+stores it again.
+
+Thumbnails are generated on first request, one JPEG per size in
+RECEIPT_THUMBNAIL_SIZES, and kept on disk under RECEIPT_THUMBNAIL_ROOT.
+They can be deleted at any time and will be regenerated.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = getattr(settings, 'RECEIPT_THUMBNAIL_SIZES', {'sm': 320, 'md': 960})
+THUMBNAIL_QUALITY = 80
+
+
+def receipt_storage():
+    return storages['receipts']
+
+
+def _chunks(content):
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return content.chunks() if hasattr(content, 'chunks') else iter(lambda: content.read(65536), b'')
+
+
+def content_hash(content):
+    """
+    SHA-256 hex digest of a file object, read in chunks and rewound.
+    """
+    digest = hashlib.sha256()
+    for chunk in _chunks(content):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by their content hash and does not
+    write a file whose content is already stored.
+    """
+    prefix = 'receipts'
+    name_re = re.compile(r'^receipts/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})$')
+
+    def hashed_name(self, digest):
+        return f"{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def digest(self, name):
+        """
+        The content hash a stored name was derived from, or None for names
+        not written by this storage.
+        """
+        match = self.name_re.match(name or '')
+        return match.group(1) if match else None
+
+    def save(self, name, content, max_length=None):
+        """
+        Hashes `content` while copying it to a temporary file, then links
+        that file under its hashed name. The content is read once, a file is
+        only ever visible complete, and concurrent saves of the same bytes
+        end up with one file (the link fails for all but the first).
+        """
+        os.makedirs(self.location, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in _chunks(content):
+                    digest.update(chunk)
+                    out.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            hashed = self.hashed_name(digest.hexdigest())
+            path = self.path(hashed)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(temporary, path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # Filesystems without hard links; same bytes either way.
+                os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+        return hashed
+
+
+def _thumbnail_root():
+    return getattr(settings, 'RECEIPT_THUMBNAIL_ROOT', None) or os.path.join(settings.MEDIA_ROOT, 'thumbnails')
+
+
+def _thumbnail_paths(digest):
+    directory = os.path.join(_thumbnail_root(), digest[:2])
+    return {size: os.path.join(directory, f"{digest}-{size}.jpg") for size in THUMBNAIL_SIZES}
+
+
+def thumbnail(storage, name, digest, size):
+    """
+    Path of the `size` thumbnail of the stored file `name`, generating it
+    on first use. Raises KeyError for an unknown size and OSError when the
+    file cannot be read as an image.
+    """
+    path = _thumbnail_paths(digest)[size]
+    if os.path.exists(path):
+        return path
+    pixels = THUMBNAIL_SIZES[size]
+    with storage.open(name, 'rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.thumbnail((pixels, pixels))
+        image = image.convert('RGB')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name and renamed, so concurrent requests
+    # never serve a partial file.
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+def acquire(field_file):
+    """
+    Stores `field_file` if it is a new upload and takes a reference to its
+    blob. Returns the ReceiptBlob.
+    """
+    original_name = field_file.name
+    upload = None if field_file._committed else field_file.file
+    if upload is not None:
+        field_file.save(field_file.name, upload, save=False)
+    # The hashed name already says what the content hash is.
+    digest = field_file.storage.digest(field_file.name) or content_hash(field_file)
+    try:
+        blob = acquire_stored(field_file.name, digest, original_name)
+    except FileNotFoundError:
+        if upload is None:
+            raise
+        # The last reference to the same content was released meanwhile.
+        field_file.storage.save(field_file.name, upload)
+        blob = acquire_stored(field_file.name, digest, original_name)
+    # Point at the shared file, which may have been stored under another name.
+    field_file.name = blob.name
+    return blob
+
+
+def acquire_stored(name, digest, original_name=''):
+    """
+    Takes a reference to the blob of a file already saved to the receipt
+    storage as `name`, creating the blob on first use. Raises
+    FileNotFoundError if the file was deleted with the last reference to
+    the same content since it was saved; save it again and retry.
+    """
+    from .models import ReceiptBlob
+
+    with transaction.atomic():
+        blob = ReceiptBlob.objects.select_for_update().filter(content_hash=digest).first()
+        # A blob with references keeps its file; without, _delete_files may
+        # have removed it before this lock was taken.
+        if (blob is None or blob.ref_count == 0) and not receipt_storage().exists(name):
+            raise FileNotFoundError(f"{name} was deleted before it could be referenced.")
+        if blob is None:
+            blob, created = ReceiptBlob.objects.select_for_update().get_or_create(
+                content_hash=digest,
+                defaults={
+                    'name': name,
+                    'size': receipt_storage().size(name),
+                    'content_type': mimetypes.guess_type(original_name or name)[0] or '',
+                    'ref_count': 1,
+                },
+            )
+            if created:
+                return blob
+        ReceiptBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob
+
+
+def release(blob_id):
+    """
+    Drops one reference to a blob; once the transaction dropping the last
+    one commits, the blob, its file and its thumbnails are deleted.
+    """
+    from .models import ReceiptBlob
+
+    with transaction.atomic():
+        blob = ReceiptBlob.objects.select_for_update().filter(pk=blob_id, ref_count__gt=0).first()
+        if blob is None:
+            return
+        ReceiptBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+        if blob.ref_count == 1:
+            transaction.on_commit(lambda: _delete_files(blob.pk))
+
+
+def _delete_files(blob_id):
+    """
+    Deletes an unreferenced blob with its file and thumbnails, under the
+    row lock acquire_stored() takes, unless it was acquired again since.
+    """
+    from .models import ReceiptBlob
+
+    with transaction.atomic():
+        blob = ReceiptBlob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+        if blob is None:
+            return
+        receipt_storage().delete(blob.name)
+        for path in _thumbnail_paths(blob.content_hash).values():
+            if os.path.exists(path):
+                os.unlink(path)
+        blob.delete()
@@ -0,0 +1,152 @@
+"""
+Synthetic receipts with known contents, used by the benchmark commands to
+measure OCR and parsing speed and accuracy without real customer data.
+"""
+import io
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+MERCHANTS = [
+    'ACME STORE', 'Blue Bottle Coffee', 'City Taxi Co', 'Grand Hotel Central', 'Office Depot',
+    'Shell Station 114', 'Cafe de Paris', 'Metro Rail', 'Sunrise Diner', 'Tech Supplies Ltd',
+]
+ITEMS = [
+    'Coffee', 'Bagel', 'Sandwich', 'Taxi fare', 'Room night', 'Printer paper', 'Fuel',
+    'Train ticket', 'Lunch menu', 'USB cable', 'Parking', 'Water bottle', 'Notebook',
+]
+# (currency code, symbol, decimal separator, thousands separator)
+CURRENCIES = [
+    ('USD', '$', '.', ','),
+    ('EUR', '€', ',', '.'),
+    ('GBP', '£', '.', ','),
+    ('INR', '₹', '.', ','),
+]
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y']
+TOTAL_LABELS = ['TOTAL', 'Total', 'Grand Total', 'Amount Due', 'TOTAL DUE']
+
+
+def format_money(value, decimal_sep, thousands_sep):
+    integer, cents = f"{value:.2f}".split('.')
+    groups = []
+    while len(integer) > 3:
+        groups.insert(0, integer[-3:])
+        integer = integer[:-3]
+    groups.insert(0, integer)
+    return f"{thousands_sep.join(groups)}{decimal_sep}{cents}"
+
+
+def generate_receipt(rng=None, symbols=True):
+    """
+    Returns (lines, truth) for one random receipt. `truth` holds the values
+    the parser is expected to extract, in parse_ocr_text's format.
+    With symbols=False amounts carry the ISO code instead of the currency
+    symbol, for fonts that have no glyph for symbols like € or ₹.
+    """
+    rng = rng or random.Random()
+    code, symbol, decimal_sep, thousands_sep = rng.choice(CURRENCIES)
+    merchant = rng.choice(MERCHANTS)
+    receipt_date = date(2020, 1, 1) + timedelta(days=rng.randrange(2000))
+
+    items = []
+    for _ in range(rng.randint(1, 8)):
+        price = Decimal(rng.randint(50, 250000)) / 100
+        items.append((rng.choice(ITEMS), price))
+    subtotal = sum(price for _, price in items)
+    tax = (subtotal * Decimal('0.08')).quantize(Decimal('0.01'))
+    total = subtotal + tax
+
+    def money(value):
+        amount = format_money(value, decimal_sep, thousands_sep)
+        return f"{symbol}{amount}" if symbols else f"{code} {amount}"
+
+    lines = [merchant, f"{rng.randint(1, 999)} Main Street", f"Tel 555-{rng.randint(1000, 9999)}"]
+    lines.append(f"Date: {receipt_date.strftime(rng.choice(DATE_FORMATS))}")
+    lines.extend(f"{name:<20} {money(price)}" for name, price in items)
+    lines.append(f"Subtotal {money(subtotal)}")
+    lines.append(f"Tax {money(tax)}")
+    lines.append(f"{rng.choice(TOTAL_LABELS)}: {money(total)}")
+    lines.append('Thank you for your visit!')
+
+    truth = {
+        'amount': f"{total:.2f}",
+        'date': receipt_date.isoformat(),
+        'currency': code,
+        'merchant': merchant,
+        'line_items': [{'description': name, 'amount': f"{price:.2f}"} for name, price in items],
+    }
+    return lines, truth
+
+
+def generate_corpus(count, seed=0):
+    """
+    Yields (text, truth) for `count` reproducible random receipts.
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        lines, truth = generate_receipt(rng)
+        yield '\n'.join(lines), truth
+
+
+# thermal: a narrow 80 mm till roll; invoice: a wide A4-like page with
+# margins; photo: a thermal receipt photographed on a table, slightly
+# rotated and saved as JPEG like a phone upload.
+LAYOUTS = ('thermal', 'invoice', 'photo')
+
+
+def load_font(path, size):
+    """
+    Loads a TrueType font, or Pillow's bundled default font when path is None.
+    """
+    if path:
+        return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has a fixed-size bitmap default font.
+        return ImageFont.load_default()
+
+
+def render_receipt(lines, layout='thermal', scale=1.0, font_path=None, noise=0.0, rng=None):
+    """
+    Draws receipt lines into an image. `scale` multiplies the resolution
+    (1.0 is about 200 DPI) and `noise` (0 to 1) adds sensor noise and blur.
+    """
+    rng = rng or random.Random()
+    font = load_font(font_path, max(8, round(22 * scale)))
+    line_height = round(32 * scale)
+    margin = round((120 if layout == 'invoice' else 24) * scale)
+    width = round((1650 if layout == 'invoice' else 620) * scale)
+    height = margin * 2 + line_height * len(lines)
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, fill=0, font=font)
+
+    if noise:
+        grain = Image.effect_noise(image.size, 60 * noise)
+        image = Image.blend(image, grain, 0.35 * noise)
+        image = image.filter(ImageFilter.GaussianBlur(1.5 * noise * scale))
+
+    if layout == 'photo':
+        table = Image.new('L', (round(width * 1.6), round(height * 1.25)), 110)
+        table.paste(image, ((table.width - width) // 2, (table.height - height) // 2))
+        image = table.rotate(rng.uniform(-3, 3), resample=Image.Resampling.BICUBIC, fillcolor=110)
+        image = image.convert('RGB')
+    return image
+
+
+def encode_image(image, layout):
+    """
+    Serializes a rendered receipt the way it would typically be uploaded:
+    photos as JPEG, scans as PNG.
+    """
+    buffer = io.BytesIO()
+    if layout == 'photo':
+        image.save(buffer, 'JPEG', quality=85)
+    else:
+        image.save(buffer, 'PNG')
+    return buffer.getvalue()
@@ -1,3 +1,701 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import Company, CustomUser
+from accounts.testing import make_user
+from approvals.models import Approval
+from . import (
+    benchmarking, currency_service, duplicate_index, export, ocr_queue, ocr_service, rollups, storage,
+    synthetic_receipts, views,
+)
+from .management.commands import import_receipts
+from .models import (
+    CategorySpendRollup, EmployeeSpendRollup, Expense, ExpenseCategory, OcrJob, Receipt, ReceiptBlob,
+    ReceiptFingerprint,
+)
+
+
+def make_expense(employee, amount='10.00', currency='USD', day=date(2026, 1, 15), category='Travel', **fields):
+    return Expense.objects.create(
+        employee=employee,
+        category=ExpenseCategory.objects.get_or_create(name=category)[0],
+        amount=Decimal(amount),
+        currency=currency,
+        date=day,
+        **fields,
+    )
+
+
+def image_bytes(color=(200, 10, 10), size=(1200, 800), fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class MediaRootMixin:
+    """
+    Points MEDIA_ROOT, where receipts and thumbnails are stored, at a
+    temporary directory for each test.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ReceiptStorageTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(name='Acme')
+        self.employee = make_user('employee', self.company)
+        self.expense = make_expense(self.employee)
+        self.data = image_bytes()
+
+    def add_receipt(self, data=None, name='scan.png'):
+        return Receipt.objects.create(expense=self.expense, image=SimpleUploadedFile(name, data or self.data))
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second = self.add_receipt(name='a.png'), self.add_receipt(name='b.png')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 2)
+
+        path = first.image.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ReceiptBlob.objects.exists())
+
+    def test_replacing_the_image_moves_to_a_new_blob(self):
+        receipt = self.add_receipt()
+        old_blob, old_hash, old_path = receipt.blob_id, receipt.content_hash, receipt.image.path
+
+        receipt = Receipt.objects.get(pk=receipt.pk)
+        receipt.image = SimpleUploadedFile('new.png', image_bytes(color=(0, 0, 255)))
+        with self.captureOnCommitCallbacks(execute=True):
+            receipt.save()
+
+        receipt.refresh_from_db()
+        self.assertNotEqual(receipt.blob_id, old_blob)
+        self.assertNotEqual(receipt.content_hash, old_hash)
+        self.assertEqual(receipt.image.name, receipt.blob.name)
+        self.assertFalse(ReceiptBlob.objects.filter(pk=old_blob).exists())
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_upload_racing_the_last_release_stores_the_file_again(self):
+        receipt = self.add_receipt()
+        path = receipt.image.path
+        acquire_stored = storage.acquire_stored
+
+        def release_then_acquire(*args):
+            # The upload found the file stored; its last reference goes now.
+            if Receipt.objects.filter(pk=receipt.pk).exists():
+                with self.captureOnCommitCallbacks(execute=True):
+                    receipt.delete()
+                self.assertFalse(os.path.exists(path))
+            return acquire_stored(*args)
+
+        with mock.patch.object(storage, 'acquire_stored', side_effect=release_then_acquire):
+            second = self.add_receipt(name='again.png')
+        self.assertEqual(second.image.path, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 1)
+
+    def test_released_blob_acquired_again_keeps_its_file(self):
+        receipt = self.add_receipt()
+        path, blob_id = receipt.image.path, receipt.blob_id
+        with self.captureOnCommitCallbacks() as callbacks:
+            receipt.delete()
+        # Re-acquired before the deferred delete runs.
+        storage.acquire_stored(ReceiptBlob.objects.get().name, receipt.content_hash)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ReceiptBlob.objects.get(pk=blob_id).ref_count, 1)
+
+    def test_storage_writes_each_content_once_under_its_hash(self):
+        receipt_storage = storage.receipt_storage()
+        first = receipt_storage.save('a.png', ContentFile(self.data))
+        second = receipt_storage.save('b.png', ContentFile(self.data))
+        self.assertEqual(first, second)
+        self.assertEqual(receipt_storage.digest(first), hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(os.listdir(self.media_root), ['receipts'])
+        with receipt_storage.open(first) as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_saving_unchanged_receipt_keeps_its_reference(self):
+        receipt = self.add_receipt()
+        Receipt.objects.get(pk=receipt.pk).save()
+        self.assertEqual(ReceiptBlob.objects.get().ref_count, 1)
+
+
+class ReceiptFileViewTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(name='Acme')
+        self.employee = make_user('employee', self.company)
+        self.data = image_bytes()
+        self.receipt = Receipt.objects.create(
+            expense=make_expense(self.employee), image=SimpleUploadedFile('scan.png', self.data)
+        )
+        self.url = reverse('receipt_file', args=[self.receipt.pk])
+        self.client.force_login(self.employee)
+
+    def test_full_and_conditional_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['ETag'], f'"{self.receipt.content_hash}"')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_hashed_urls_are_immutable(self):
+        response = self.client.get(self.url, {'v': self.receipt.content_hash})
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(self.url, {'v': 'stale'})
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_thumbnail(self):
+        response = self.client.get(reverse('receipt_thumbnail', args=[self.receipt.pk, 'md']))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        thumbnail = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(max(thumbnail.size), 960)
+        response = self.client.get(reverse('receipt_thumbnail', args=[self.receipt.pk, 'huge']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_companies_cannot_read_receipts(self):
+        outsider = make_user('outsider', Company.objects.create(name='Other'), CustomUser.Role.ADMIN)
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class DeduplicateReceiptsTests(MediaRootMixin, TestCase):
+    def test_moves_legacy_receipts_from_the_old_working_directory(self):
+        legacy_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, legacy_root)
+        os.makedirs(os.path.join(legacy_root, 'receipts'))
+        data = image_bytes()
+        for name in ('one.png', 'two.png'):
+            with open(os.path.join(legacy_root, 'receipts', name), 'wb') as f:
+                f.write(data)
+        expense = make_expense(make_user('employee', Company.objects.create(name='Acme')))
+        Receipt.objects.bulk_create([
+            Receipt(expense=expense, image='receipts/one.png'),
+            Receipt(expense=expense, image='receipts/two.png'),
+        ])
+
+        with override_settings(BASE_DIR=legacy_root):
+            call_command('deduplicate_receipts', stdout=io.StringIO(), stderr=io.StringIO())
+
+        blob = ReceiptBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(set(Receipt.objects.values_list('image', 'blob_id')), {(blob.name, blob.pk)})
+        self.assertEqual(os.listdir(os.path.join(legacy_root, 'receipts')), [])
+        with open(Receipt.objects.first().image.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+class CurrencyServiceTests(TestCase):
+    def setUp(self):
+        self.rates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.rates_dir)
+        patcher = mock.patch.object(currency_service, 'RATES_DIR', self.rates_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        currency_service.clear_cache()
+        self.addCleanup(currency_service.clear_cache)
+
+    def write_table(self, day, eur):
+        with open(os.path.join(self.rates_dir, f"{day.isoformat()}.csv"), 'w') as f:
+            f.write(f"currency,rate\nEUR,{eur}\n")
+        # Directory mtimes can be coarse; make each change visible.
+        stat = os.stat(self.rates_dir)
+        os.utime(self.rates_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_days_without_a_table_use_the_latest_earlier_one(self):
+        self.write_table(date(2026, 1, 9), '0.5')
+        self.assertEqual(currency_service.convert('10', 'USD', 'EUR', date(2026, 1, 10)), Decimal('5.00'))
+        with self.assertRaises(currency_service.RateUnavailable):
+            currency_service.get_rate('USD', 'EUR', date(2026, 1, 8))
+
+    def test_tables_added_later_are_used(self):
+        self.write_table(date(2026, 1, 9), '0.5')
+        self.assertEqual(currency_service.get_rate('USD', 'EUR', date(2026, 1, 10)), Decimal('0.5'))
+        self.write_table(date(2026, 1, 10), '0.8')
+        self.assertEqual(currency_service.get_rate('USD', 'EUR', date(2026, 1, 10)), Decimal('0.8'))
+        self.assertEqual(currency_service.get_rate('EUR', 'USD', date(2026, 1, 9)), Decimal(2))
+
+    def test_unsaved_expenses_with_string_dates_are_converted(self):
+        self.write_table(date(2026, 1, 9), '0.5')
+        expense = Expense(amount=Decimal('10.00'), currency='EUR', date='2026-01-10')
+        currency_service.apply_conversion([expense], 'USD')
+        self.assertEqual((expense.converted_amount, expense.converted_currency), (Decimal('20.00'), 'USD'))
+        with self.assertRaises(TypeError):
+            currency_service.get_rate('USD', 'EUR', '2026-01-10')
+
+
+class SpendRollupTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.employee = make_user('employee', self.company)
+
+    def snapshot(self):
+        return (
+            set(CategorySpendRollup.objects.values_list(
+                'company_id', 'month', 'category_id', 'status', 'expense_count', 'total_amount')),
+            set(EmployeeSpendRollup.objects.values_list(
+                'company_id', 'month', 'employee_id', 'expense_count', 'total_amount', 'approved_amount')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_deltas_match_a_rebuild(self):
+        first = make_expense(self.employee, converted_amount=Decimal('10.00'))
+        second = make_expense(self.employee, day=date(2026, 2, 3), converted_amount=Decimal('5.00'))
+        first = Expense.objects.get(pk=first.pk)
+        first.category = ExpenseCategory.objects.create(name='Meals')
+        first.status = 'APPROVED'
+        first.save()
+        rollups.change_status([second.pk], 'REJECTED')
+        Expense.objects.filter(pk=second.pk).update(status='REJECTED')
+        self.assertMatchesRebuild()
+        self.assertEqual(EmployeeSpendRollup.objects.get(month=date(2026, 1, 1)).approved_amount, Decimal('10.00'))
+
+    def test_only_emptied_rows_are_deleted(self):
+        other = make_user('other', self.company)
+        make_expense(other)
+        # A stale empty row of another employee is not this save's business.
+        EmployeeSpendRollup.objects.filter(employee=other).update(expense_count=0)
+        expense = make_expense(self.employee)
+        expense.delete()
+        self.assertFalse(EmployeeSpendRollup.objects.filter(employee=self.employee).exists())
+        self.assertTrue(EmployeeSpendRollup.objects.filter(employee=other).exists())
+
+    def test_company_change_moves_the_employees_expenses(self):
+        make_expense(self.employee, converted_amount=Decimal('10.00'))
+        new_company = Company.objects.create(name='NewCo')
+        employee = CustomUser.objects.get(pk=self.employee.pk)
+        employee.company = new_company
+        employee.save()
+        self.assertEqual(set(EmployeeSpendRollup.objects.values_list('company_id', flat=True)), {new_company.pk})
+        self.assertMatchesRebuild()
+
+
+class DuplicateReceiptTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(name='Acme')
+        self.employee = make_user('employee', self.company)
+        # A gradient, so the hash has both kinds of bits.
+        image = Image.linear_gradient('L').resize((90, 80))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+
+    def receipt(self, amount):
+        return Receipt.objects.create(
+            expense=make_expense(self.employee, amount=amount), image=SimpleUploadedFile('scan.png', self.data)
+        )
+
+    def test_matches_are_not_limited_to_the_same_amount(self):
+        first = self.receipt('10.00')
+        duplicate_index.index_receipt(first)
+        fingerprint = duplicate_index.index_receipt(self.receipt('12.00'))
+        self.assertEqual(fingerprint.possible_duplicate_of_id, first.pk)
+
+    def test_same_amount_wins_ties(self):
+        value = duplicate_index.dhash(io.BytesIO(self.data))
+        others = [(1, value, Decimal('5.00')), (2, value, Decimal('7.00'))]
+        self.assertEqual(duplicate_index.find_duplicate(self.company.pk, value, Decimal('7.00'), others=others), (2, 0))
+
+    def test_ocr_job_indexes_the_receipt(self):
+        first = self.receipt('10.00')
+        duplicate_index.index_receipt(first)
+        receipt = self.receipt('10.00')
+        ocr_queue.enqueue(receipt)
+        self.assertFalse(ReceiptFingerprint.objects.filter(receipt=receipt).exists())
+
+        [job] = ocr_queue.claim_jobs(10)
+        with mock.patch.object(ocr_queue.ocr_service, 'run_ocr', side_effect=RuntimeError('no tesseract')):
+            result, error, value = ocr_queue.run_job(receipt.image.path)
+        self.assertEqual((result, error), ({}, 'RuntimeError: no tesseract'))
+        ocr_queue.record_hash(job, value)
+        ocr_queue.record_hash(job, value)
+        self.assertEqual(receipt.fingerprint.possible_duplicate_of_id, first.pk)
+
+
+class OcrQueueTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee = make_user('employee', Company.objects.create(name='Acme'))
+
+    def queue(self, count):
+        expense = make_expense(self.employee)
+        return [
+            ocr_queue.enqueue(Receipt.objects.create(
+                expense=expense, image=SimpleUploadedFile(f'{i}.png', image_bytes(color=(i, 0, 0)))
+            ))
+            for i in range(count)
+        ]
+
+    def test_submission_queues_ocr_instead_of_running_it(self):
+        self.client.force_login(self.employee)
+        with mock.patch.object(ocr_queue.ocr_service, 'run_ocr') as run_ocr:
+            self.client.post(reverse('submit_expense'), {
+                'category': ExpenseCategory.objects.create(name='Travel').pk, 'amount': '12.50',
+                'currency': 'USD', 'description': 'Taxi', 'date': '2026-01-15',
+                'receipt_image': SimpleUploadedFile('scan.png', image_bytes()),
+            })
+        run_ocr.assert_not_called()
+        self.assertEqual(OcrJob.objects.get().status, OcrJob.Status.QUEUED)
+
+    def test_each_job_is_claimed_once(self):
+        self.queue(3)
+        first = ocr_queue.claim_jobs(2, worker_id='a')
+        second = ocr_queue.claim_jobs(2, worker_id='b')
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(ocr_queue.claim_jobs(2), [])
+        self.assertEqual({job.attempts for job in first + second}, {1})
+
+    def test_failed_jobs_are_retried_up_to_max_attempts(self):
+        self.queue(1)
+        for _ in range(2):
+            [job] = ocr_queue.claim_jobs(1)
+            ocr_queue.fail_job(job, RuntimeError('boom'), max_attempts=2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (OcrJob.Status.FAILED, 2, 'boom'))
+        self.assertEqual(ocr_queue.claim_jobs(1), [])
+
+    def test_stale_jobs_are_requeued(self):
+        self.queue(2)
+        jobs = ocr_queue.claim_jobs(2)
+        OcrJob.objects.filter(pk=jobs[0].pk).update(attempts=3)
+        OcrJob.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(ocr_queue.requeue_stale(stale_after=600, max_attempts=3), 1)
+        self.assertEqual(OcrJob.objects.get(pk=jobs[0].pk).status, OcrJob.Status.FAILED)
+        self.assertEqual(OcrJob.objects.get(pk=jobs[1].pk).status, OcrJob.Status.QUEUED)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'ocr': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ocr-tests'},
+})
+class OcrCacheTests(TestCase):
+    def setUp(self):
+        for target, value in (('get_tesseract_version', '5.3.0'), ('image_to_string', 'TOTAL 12.50')):
+            patcher = mock.patch.object(ocr_service.pytesseract, target, return_value=value)
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        ocr_service.ocr_engine_version.cache_clear()
+        self.addCleanup(ocr_service.ocr_engine_version.cache_clear)
+        self.data = image_bytes()
+
+    def test_same_image_is_recognised_once(self):
+        first = ocr_service.run_ocr(io.BytesIO(self.data))
+        second = ocr_service.run_ocr(io.BytesIO(self.data))
+        self.assertEqual(first, second)
+        self.assertEqual(first['amount'], '12.50')
+        self.assertEqual(self.image_to_string.call_count, 1)
+
+    def test_key_covers_content_preprocessing_and_engine(self):
+        key = ocr_service.ocr_cache_key(self.data)
+        self.assertEqual(key, ocr_service.ocr_cache_key(self.data))
+        self.assertNotEqual(key, ocr_service.ocr_cache_key(image_bytes(color=(0, 0, 0))))
+        self.assertNotEqual(key, ocr_service.ocr_cache_key(self.data, {'binarize': False}))
+        ocr_service.ocr_engine_version.cache_clear()
+        self.get_tesseract_version.return_value = '5.4.0'
+        self.assertNotEqual(key, ocr_service.ocr_cache_key(self.data))
+
+
+class LoadImageTests(TestCase):
+    def load(self, image, fmt='PNG', **options):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options.pop('save', {}))
+        buffer.seek(0)
+        return ocr_service.load_image(buffer, options)
+
+    def test_small_images_are_never_upscaled(self):
+        self.assertEqual(self.load(Image.new('RGB', (400, 300))).size, (400, 300))
+
+    def test_photos_are_downscaled_to_the_assumed_receipt_width(self):
+        image = self.load(Image.new('RGB', (3000, 4000)), 'JPEG')
+        self.assertEqual(min(image.size), 1050)
+        self.assertAlmostEqual(image.height / image.width, 4 / 3, places=2)
+
+    def test_scans_are_downscaled_to_the_target_dpi(self):
+        image = self.load(Image.new('RGB', (1200, 1600)), save={'dpi': (600, 600)})
+        self.assertEqual(image.size, (600, 800))
+
+    def test_binarized_output_is_black_and_white(self):
+        image = Image.linear_gradient('L').convert('RGB')
+        result = self.load(image)
+        self.assertEqual(result.mode, 'L')
+        self.assertEqual({value for _, value in result.getcolors()}, {0, 255})
+        self.assertEqual(self.load(image, binarize=False, grayscale=False).mode, 'RGB')
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise.
+        image = self.load(Image.new('RGB', (200, 100)), 'JPEG', save={'exif': exif}, target_dpi=None)
+        self.assertEqual(image.size, (100, 200))
+        self.assertEqual(
+            self.load(Image.new('RGB', (200, 100)), 'JPEG', save={'exif': exif}, target_dpi=None,
+                      exif_transpose=False).size,
+            (200, 100),
+        )
+
+
+class ImportReceiptsTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        company = Company.objects.create(name='Acme', default_currency='USD')
+        self.employee = make_user('employee', company)
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        for name, color in (('a.png', (255, 0, 0)), ('b.png', (0, 0, 255)), ('copy-of-a.png', (255, 0, 0))):
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(image_bytes(color, size=(64, 64)))
+        with open(os.path.join(self.source, 'notes.txt'), 'w') as f:
+            f.write('not a receipt')
+
+    def run_import(self, side_effect=None, **options):
+        # The worker processes are forked, so they inherit this patch.
+        ocr_result = {'amount': '12.50', 'date': '2026-02-01'}
+        with mock.patch.object(ocr_service, 'run_ocr', return_value=ocr_result, side_effect=side_effect):
+            call_command('import_receipts', self.source, user='employee', workers=1, stdout=io.StringIO(), **options)
+
+    def test_imports_each_distinct_image_once(self):
+        self.run_import()
+        expenses = Expense.objects.filter(employee=self.employee)
+        self.assertEqual(expenses.count(), 2)
+        self.assertEqual({(e.amount, e.date) for e in expenses}, {(Decimal('12.50'), date(2026, 2, 1))})
+        self.assertEqual(ReceiptBlob.objects.count(), 2)
+        self.assertEqual(set(OcrJob.objects.values_list('status', flat=True)), {OcrJob.Status.DONE})
+        self.assertEqual(ReceiptFingerprint.objects.count(), 2)
+        self.assertEqual(EmployeeSpendRollup.objects.get(employee=self.employee).expense_count, 2)
+
+    def test_each_file_is_read_once(self):
+        with mock.patch.object(import_receipts, '_read_entry', wraps=import_receipts._read_entry) as read:
+            self.run_import()
+        self.assertEqual(read.call_count, 3)
+
+    def test_any_ocr_error_is_recorded_on_the_job(self):
+        self.run_import(side_effect=SyntaxError('broken image plugin'))
+        self.assertEqual(
+            set(OcrJob.objects.values_list('status', 'error')),
+            {(OcrJob.Status.FAILED, 'SyntaxError: broken image plugin')},
+        )
+        self.assertEqual(Expense.objects.filter(employee=self.employee).count(), 2)
+
+    def test_expenses_in_another_currency_are_converted(self):
+        rates_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, rates_dir)
+        with open(os.path.join(rates_dir, '2026-01-30.csv'), 'w') as f:
+            f.write("currency,rate\nEUR,0.5\n")
+        patcher = mock.patch.object(currency_service, 'RATES_DIR', rates_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        currency_service.clear_cache()
+        self.addCleanup(currency_service.clear_cache)
+
+        self.run_import(currency='EUR')
+        self.assertEqual(
+            set(Expense.objects.values_list('date', 'converted_amount', 'converted_currency')),
+            {(date(2026, 2, 1), Decimal('25.00'), 'USD')},
+        )
+
+    def test_rerun_skips_imported_files(self):
+        self.run_import()
+        self.run_import()
+        self.assertEqual(Expense.objects.filter(employee=self.employee).count(), 2)
+        self.assertEqual(Receipt.objects.count(), 2)
+
+
+class ParseOcrTextTests(TestCase):
+    RECEIPT = (
+        "CORNER CAFE\n"
+        "Tel 555-0100\n"
+        "Date: 03/14/2026\n"
+        "Cappuccino        $4.50\n"
+        "Bagel 2 x 3.00    $6.00\n"
+        "Subtotal         $10.50\n"
+        "Tax               $0.84\n"
+        "TOTAL            $11.34\n"
+        "Card             $11.34\n"
+    )
+
+    def test_parses_a_receipt(self):
+        parsed = ocr_service.parse_ocr_text(self.RECEIPT)
+        self.assertEqual(parsed['amount'], '11.34')
+        self.assertEqual(parsed['date'], '2026-03-14')
+        self.assertEqual((parsed['currency'], parsed['currency_symbol']), ('USD', '$'))
+        self.assertEqual(parsed['merchant'], 'CORNER CAFE')
+        self.assertEqual(parsed['line_items'], [
+            {'description': 'Cappuccino', 'amount': '4.50'},
+            {'description': 'Bagel 2 x 3.00', 'amount': '6.00'},
+        ])
+
+    def test_strongest_total_label_wins(self):
+        parsed = ocr_service.parse_ocr_text("Amount 5.00\nGrand Total 1.234,56 EUR\nTotal 9.99\n")
+        self.assertEqual((parsed['amount'], parsed['currency']), ('1234.56', 'EUR'))
+
+    def test_label_on_its_own_line_applies_to_the_next_price(self):
+        self.assertEqual(ocr_service.parse_ocr_text("TOTAL\n42.00\n")['amount'], '42.00')
+
+    def test_dates_are_not_amounts_and_invalid_dates_are_skipped(self):
+        parsed = ocr_service.parse_ocr_text("31.02.2026\n2026-01-05\n")
+        self.assertEqual((parsed['amount'], parsed['date'], parsed['line_items']), (None, '2026-01-05', []))
+
+
+class SyntheticReceiptTests(TestCase):
+    def test_corpus_is_reproducible_per_seed(self):
+        self.assertEqual(list(synthetic_receipts.generate_corpus(20, seed=3)),
+                         list(synthetic_receipts.generate_corpus(20, seed=3)))
+        self.assertNotEqual(list(synthetic_receipts.generate_corpus(20, seed=3)),
+                            list(synthetic_receipts.generate_corpus(20, seed=4)))
+
+    def test_parser_recovers_the_known_contents(self):
+        for text, truth in synthetic_receipts.generate_corpus(200, seed=1):
+            parsed = ocr_service.parse_ocr_text(text)
+            self.assertEqual({field: parsed[field] for field in truth}, truth, text)
+
+    def test_rendered_layouts_decode(self):
+        lines, _ = synthetic_receipts.generate_receipt(random.Random(0))
+        for layout in synthetic_receipts.LAYOUTS:
+            data = synthetic_receipts.encode_image(synthetic_receipts.render_receipt(lines, layout), layout)
+            self.assertEqual(Image.open(io.BytesIO(data)).format, 'JPEG' if layout == 'photo' else 'PNG')
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarking.percentile(values, 50), 50)
+        self.assertEqual(benchmarking.percentile(values, 95), 95)
+        self.assertEqual(benchmarking.percentile([7], 99), 7)
+        self.assertEqual(benchmarking.percentile([], 50), 0.0)
+
+
+class ExpenseHistoryViewTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name='Acme')
+        self.employee = make_user('employee', company)
+        make_expense(make_user('other', company))
+        # Two expenses share a date, so the id breaks the tie.
+        days = [date(2026, 1, 1), date(2026, 1, 5), date(2026, 1, 5), date(2026, 2, 1), date(2026, 3, 1)]
+        self.expenses = [make_expense(self.employee, day=day) for day in days]
+        Expense.objects.filter(pk=self.expenses[1].pk).update(status='APPROVED')
+        self.client.force_login(self.employee)
+
+    def walk(self, **filters):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('expense_history'), {**filters, **({'cursor': cursor} if cursor else {})})
+            page = response.context['page']
+            seen += [expense.pk for expense in response.context['expenses']]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    @mock.patch.object(views, 'HISTORY_PAGE_SIZE', 2)
+    def test_keyset_pages_list_own_expenses_newest_first(self):
+        expected = sorted(self.expenses, key=lambda expense: (expense.date, expense.pk), reverse=True)
+        self.assertEqual(self.walk(), [expense.pk for expense in expected])
+
+    @mock.patch.object(views, 'HISTORY_PAGE_SIZE', 2)
+    def test_filters_apply_to_every_page(self):
+        self.assertEqual(self.walk(status='APPROVED'), [self.expenses[1].pk])
+        self.assertEqual(
+            self.walk(date_from='2026-01-05', date_to='2026-02-01'),
+            [self.expenses[3].pk, self.expenses[2].pk, self.expenses[1].pk],
+        )
+        self.assertEqual(len(self.walk(status='BOGUS', date_from='not a date')), 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.admin = make_user('admin', self.company, CustomUser.Role.ADMIN)
+        self.manager = make_user('manager', self.company, CustomUser.Role.MANAGER)
+        employee = make_user('employee', self.company, managers=[self.manager])
+        self.expenses = [make_expense(employee, day=date(2026, 1, day), description=f'Trip {day}') for day in (1, 2, 3)]
+        Receipt.objects.bulk_create([
+            Receipt(expense=self.expenses[0], image='receipts/a.png'),
+            Receipt(expense=self.expenses[0], image='receipts/b.png'),
+        ])
+        Approval.objects.create(expense=self.expenses[1], manager=self.manager, decision=Approval.Decision.APPROVED)
+        make_expense(make_user('outsider', Company.objects.create(name='Other')))
+
+    def export(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export_expenses'), params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_lists_only_the_company_expenses(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([int(row['id']) for row in rows], [expense.pk for expense in self.expenses])
+        self.assertEqual(rows[0]['receipts'], 'receipts/a.png;receipts/b.png')
+        self.assertEqual(rows[1]['approvals'], 'manager:APPROVED')
+
+    def test_jsonl_with_date_range(self):
+        response, body = self.export(format='jsonl', date_from='2026-01-02', date_to='2026-01-02')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.expenses[1].pk])
+        self.assertEqual(rows[0]['approvals'], [{'manager': 'manager', 'decision': 'APPROVED'}])
+
+    def test_rows_are_complete_across_chunks(self):
+        queryset = export.export_queryset(self.company.pk)
+        self.assertEqual(list(export.iter_rows(queryset, chunk_size=1)), list(export.iter_rows(queryset)))
+
+    def test_only_admins_can_export(self):
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse('export_expenses')).status_code, 302)
+
+    def test_command_writes_the_export(self):
+        out = io.StringIO()
+        call_command('export_expenses', company='Acme', format='jsonl', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -4,5 +4,9 @@ from . import views
 urlpatterns = [
     path('submit/', views.SubmitExpenseView.as_view(), name='submit_expense'),
     path('history/', views.ExpenseHistoryView.as_view(), name='expense_history'),
+    path('analytics/', views.spend_analytics, name='spend_analytics'),
+    path('export/', views.export_expenses, name='export_expenses'),
+    path('receipts/<int:pk>/', views.receipt_file, name='receipt_file'),
+    path('receipts/<int:pk>/<slug:size>/', views.receipt_file, name='receipt_thumbnail'),
     path('<int:pk>/', views.ExpenseDetailView.as_view(), name='expense_detail'),
 ]
\ No newline at end of file
@@ -1,10 +1,25 @@
-from django.shortcuts import render, redirect
+import mimetypes
+import os
+import re
+from datetime import date
+
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404, render, redirect
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, ListView, DetailView
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import Expense, Receipt
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
+from accounts.pagination import paginate
+from .models import CategorySpendRollup, EmployeeSpendRollup, Expense, Receipt
 from .forms import ExpenseForm, ReceiptForm
-from . import ocr_service
+from . import currency_service, export, ocr_queue, storage
+from accounts.models import CustomUser
+from approvals import approval_service
 
 class SubmitExpenseView(LoginRequiredMixin, CreateView):
     model = Expense
@@ -16,26 +31,212 @@ class SubmitExpenseView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.employee = self.request.user
+        form.instance.required_approvals = approval_service.required_approvals_for(self.request.user)
+        company = self.request.user.company
+        currency_service.apply_conversion(
+            [form.instance], company.default_currency if company else form.instance.currency
+        )
         self.object = form.save()
 
         if self.request.FILES.get('receipt_image'):
             receipt_image = self.request.FILES['receipt_image']
-            Receipt.objects.create(expense=self.object, image=receipt_image)
-            # The OCR data can be used for pre-filling the form in a more advanced implementation
-            ocr_data = ocr_service.extract_text_from_image(receipt_image)
-            print("OCR Data:", ocr_data)
+            receipt = Receipt.objects.create(expense=self.object, image=receipt_image)
+            # OCR and duplicate detection run in the background
+            # (manage.py ocr_worker) so the request does not wait on them.
+            ocr_queue.enqueue(receipt)
 
         return redirect(self.get_success_url())
 
+HISTORY_PAGE_SIZE = 50
+
+
+def _parse_date(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
 class ExpenseHistoryView(LoginRequiredMixin, ListView):
+    """
+    The user's expenses, newest first, filtered by the `status`, `date_from`
+    and `date_to` query parameters and paged by a (date, id) cursor over
+    the (employee, date) and (employee, status, date) indexes.
+    """
     model = Expense
     template_name = 'expenses/expense_history.html'
     context_object_name = 'expenses'
 
     def get_queryset(self):
-        return Expense.objects.filter(employee=self.request.user)
+        expenses = Expense.objects.filter(employee=self.request.user).select_related('category')
+        status = self.request.GET.get('status')
+        if status in dict(Expense.STATUS_CHOICES):
+            expenses = expenses.filter(status=status)
+        date_from = _parse_date(self.request.GET.get('date_from'))
+        if date_from:
+            expenses = expenses.filter(date__gte=date_from)
+        date_to = _parse_date(self.request.GET.get('date_to'))
+        if date_to:
+            expenses = expenses.filter(date__lte=date_to)
+        return expenses
+
+    def get_context_data(self, **kwargs):
+        page = paginate(self.object_list, ('date', 'id'), self.request.GET.get('cursor'), per_page=HISTORY_PAGE_SIZE)
+        filters = self.request.GET.copy()
+        filters.pop('cursor', None)
+        return super().get_context_data(
+            object_list=page, page=page, statuses=Expense.STATUS_CHOICES, filters=filters.urlencode(), **kwargs
+        )
 
 class ExpenseDetailView(LoginRequiredMixin, DetailView):
     model = Expense
     template_name = 'expenses/expense_detail.html'
-    context_object_name = 'expense'
\ No newline at end of file
+    context_object_name = 'expense'
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _read_range(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _file_response(request, path, content_type, etag, immutable=False):
+    """
+    Serves a file with ETag/Last-Modified validation (304 responses) and
+    single byte-range requests (206 responses). `immutable` marks URLs whose
+    content can never change, which browsers then reuse without asking.
+    """
+    stat = os.stat(path)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        size = stat.st_size
+        start, end = 0, size - 1
+        match = RANGE_RE.match(request.headers.get('Range', ''))
+        partial = match is not None and request.headers.get('If-Range', etag) == etag and any(match.groups())
+        if partial:
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start = max(size - int(last), 0)
+            if start > end:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        f = open(path, 'rb')
+        if partial:
+            f.seek(start)
+            response = StreamingHttpResponse(_read_range(f, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(f, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable' if immutable else 'private, no-cache'
+    return response
+
+
+def _can_view_expense(user, expense):
+    return expense.employee_id == user.pk or (
+        user.role in [CustomUser.Role.ADMIN, CustomUser.Role.MANAGER]
+        and expense.employee.company_id == user.company_id
+    )
+
+
+@login_required
+def receipt_file(request, pk, size=None):
+    """
+    Serves a receipt's image, or its `size` thumbnail (generated on first
+    request), to the expense's owner and to admins and managers of their
+    company. Links carry the content hash as `v`; only such URLs are cached
+    as immutable, since a receipt's image can be replaced.
+    """
+    receipt = get_object_or_404(
+        Receipt.objects.select_related('expense__employee', 'blob'), pk=pk
+    )
+    if not _can_view_expense(request.user, receipt.expense):
+        raise PermissionDenied
+    image = receipt.image
+    immutable = bool(receipt.content_hash) and request.GET.get('v') == receipt.content_hash
+    if size is not None and receipt.content_hash:
+        try:
+            path = storage.thumbnail(image.storage, image.name, receipt.content_hash, size)
+        except KeyError:
+            raise Http404('Unknown thumbnail size.')
+        except OSError:
+            path = None
+        if path is not None:
+            return _file_response(request, path, 'image/jpeg', f'"{receipt.content_hash}-{size}"', immutable)
+    try:
+        path = image.path
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        raise Http404('Receipt file not found.')
+    content_type = (receipt.blob.content_type if receipt.blob else '') or (
+        mimetypes.guess_type(image.name)[0] or 'application/octet-stream'
+    )
+    etag = f'"{receipt.content_hash}"' if receipt.content_hash else f'"{int(stat.st_mtime)}-{stat.st_size}"'
+    return _file_response(request, path, content_type, etag, immutable)
+
+
+@login_required
+@user_passes_test(lambda u: u.role == CustomUser.Role.ADMIN)
+def export_expenses(request):
+    """
+    Streams the admin's company expenses as CSV (default) or JSON Lines
+    (`format=jsonl`), optionally limited by `date_from` and `date_to`.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        fmt = 'csv'
+    queryset = export.export_queryset(
+        request.user.company_id, _parse_date(request.GET.get('date_from')), _parse_date(request.GET.get('date_to'))
+    )
+    response = StreamingHttpResponse(export.stream(queryset, fmt), content_type=export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="expenses.{fmt}"'
+    return response
+
+
+ANALYTICS_MONTHS = 12
+
+
+@login_required
+@user_passes_test(lambda u: u.role == CustomUser.Role.ADMIN)
+def spend_analytics(request):
+    """
+    Company spend by month and category, and by employee for the current
+    month, read from the rollup tables rather than from Expense.
+    """
+    this_month = timezone.localdate().replace(day=1)
+    months = this_month.year * 12 + this_month.month - ANALYTICS_MONTHS
+    first_month = date(months // 12, months % 12 + 1, 1)
+
+    by_category = (
+        CategorySpendRollup.objects.filter(company_id=request.user.company_id, month__gte=first_month)
+        .values('month', 'category__name', 'status', 'expense_count', 'total_amount')
+        .order_by('-month', 'category__name', 'status')
+    )
+    by_employee = (
+        EmployeeSpendRollup.objects.filter(company_id=request.user.company_id, month=this_month)
+        .select_related('employee')
+        .order_by('-total_amount')
+    )
+    return render(request, 'expenses/spend_analytics.html', {
+        'by_category': by_category,
+        'by_employee': by_employee,
+        'first_month': first_month,
+        'this_month': this_month,
+    })